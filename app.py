@@ -13,8 +13,10 @@ from functools import wraps
 from flask import Flask, jsonify, render_template, request, redirect, url_for, send_file, Response, stream_with_context, session, send_from_directory
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import text
+from sqlalchemy import text, event
+from sqlalchemy.exc import IntegrityError
 
+import click
 import config
 import threading
 import requests
@@ -26,6 +28,18 @@ import base64
 from services.roster import RosterService
 from services.ban import BanService
 from services.session import SessionService
+from services.broadcaster import StatusBroadcaster
+from services.classroom_state import ClassroomStateService
+from services.token_cache import TokenResolver
+from services.cache_backend import create_cache_backend
+from services.change_bus import create_change_bus
+from services.settings_cache import SettingsCache
+from services.overdue_scheduler import OverdueScheduler
+from services.rollup import RollupService
+from services.analytics import AnalyticsService
+from services.csv_export import csv_chunks, gzip_chunks
+from services.status_encoder import create_status_encoder
+from services.gevent_mode import enable_cooperative_db, pool_options, check_worker_driver
 
 # Import models
 from models.user import create_user_model
@@ -41,6 +55,11 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
 # Prefer DATABASE_URL from env (Render), else config.py
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", config.DATABASE_URL)
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# Under gevent workers psycopg2 must yield while it waits, and the pool is sized for greenlets
+db_cooperative = enable_cooperative_db(config.GEVENT_MODE)
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = pool_options(app.config["SQLALCHEMY_DATABASE_URI"], db_cooperative,
+                                                       config.DB_POOL_SIZE, config.DB_MAX_OVERFLOW,
+                                                       config.DB_POOL_TIMEOUT)
 app.config["SECRET_KEY"] = config.SECRET_KEY
 app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(hours=8)  # Admin sessions last 8 hours
 
@@ -88,6 +107,13 @@ class Session(db.Model):
     student = db.relationship("Student")
     user = db.relationship('User', backref='sessions')
 
+    # Per-tenant open-session lookups: user_id, end_ts IS NULL, start_ts range
+    # Pass logs: newest first with keyset pagination on (start_ts, id)
+    __table_args__ = (
+        db.Index('ix_session_user_end_start', 'user_id', 'end_ts', 'start_ts'),
+        db.Index('ix_session_user_start', 'user_id', db.text('start_ts DESC'), db.text('id DESC')),
+    )
+
     @property
     def duration_seconds(self):
         end = self.end_ts or datetime.now(timezone.utc)
@@ -112,10 +138,15 @@ class Settings(db.Model):
     auto_promote_queue = db.Column(db.Boolean, nullable=False, default=False)
     enable_queue = db.Column(db.Boolean, nullable=False, default=False)
     # 2.0: Add user_id FK (nullable for migration compatibility, ID=1 is legacy global)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     
     user = db.relationship('User', backref='settings')
 
+    # One row per tenant: concurrent get-or-creates converge on it (NULLs don't conflict)
+    __table_args__ = (
+        db.Index('ux_settings_user_id', 'user_id', unique=True),
+    )
+
 class StudentName(db.Model):
     """FERPA-compliant storage of student names only (no ID association)"""
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -135,18 +166,81 @@ class StudentName(db.Model):
         db.UniqueConstraint('user_id', 'name_hash', name='uq_user_name_hash'),
     )
 
+class SessionRollup(db.Model):
+    """Sessions per local hour, maintained as sessions start/end (see RollupService)"""
+    __tablename__ = 'session_rollup'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    local_date = db.Column(db.Date, nullable=False)
+    hour = db.Column(db.Integer, nullable=False)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    overdue = db.Column(db.Integer, nullable=False, default=0)
+    total_duration_seconds = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'local_date', 'hour', name='uq_rollup_user_date_hour'),
+    )
+
+class StudentRollup(db.Model):
+    """Sessions per student per local day, for the stats insights"""
+    __tablename__ = 'student_rollup'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    local_date = db.Column(db.Date, nullable=False, index=True)
+    student_id = db.Column(db.String, nullable=False)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    overdue = db.Column(db.Integer, nullable=False, default=0)
+    total_duration_seconds = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'local_date', 'student_id', name='uq_student_rollup_user_date_sid'),
+    )
+
 # ---------- Service Initialization ----------
 # Initialize services after models are defined
 roster_service: Optional[RosterService] = None
 ban_service: Optional[BanService] = None
 session_service: Optional[SessionService] = None
+status_broadcaster: Optional[StatusBroadcaster] = None
+classroom_state_service: Optional[ClassroomStateService] = None
+token_resolver: Optional[TokenResolver] = None
+settings_cache: Optional[SettingsCache] = None
+overdue_scheduler: Optional[OverdueScheduler] = None
+rollup_service: Optional[RollupService] = None
+analytics_service: Optional[AnalyticsService] = None
+cache_backend = None
+change_bus = None
+# Set once ux_settings_user_id is known to exist (ensure_settings_unique_index)
+settings_unique_index = False
 
 def initialize_services():
     """Initialize service layer after app context is available"""
-    global roster_service, ban_service, session_service
-    roster_service = RosterService(db, cipher_suite, StudentName)
+    global roster_service, ban_service, session_service, status_broadcaster, classroom_state_service
+    global token_resolver, settings_cache, overdue_scheduler, rollup_service, analytics_service
+    global cache_backend, change_bus
+    from routes.kiosk import _build_status_payload, _build_status_signature, _next_status_deadline
+    settings_cache = SettingsCache(_load_settings, find=lambda uid: _load_settings(uid, create=False))
+    cache_backend = create_cache_backend(config.CACHE_BACKEND)
+    roster_service = RosterService(db, cipher_suite, StudentName,
+                                   cache_max_students=config.ROSTER_CACHE_MAX_STUDENTS,
+                                   cache_max_bytes=config.ROSTER_CACHE_MAX_MB * 1024 * 1024,
+                                   cache_backend=cache_backend)
     ban_service = BanService(db, StudentName, roster_service)
     session_service = SessionService(db, Session)
+    status_broadcaster = StatusBroadcaster(app, db, _build_status_payload, _build_status_signature,
+                                           _next_status_deadline,
+                                           encode=create_status_encoder(config.JSON_ENCODER))
+    classroom_state_service = ClassroomStateService(db, Session, Queue, Settings, get_settings,
+                                                    ban_service)
+    token_resolver = TokenResolver(_lookup_kiosk_token, cache_backend=cache_backend)
+    overdue_scheduler = OverdueScheduler(app, db, classroom_state_service.get, find_settings,
+                                         _open_session_tenants, ban_service.ban_many,
+                                         notify_status_change, status_broadcaster.bump)
+    rollup_service = RollupService(db, SessionRollup, StudentRollup, TZ)
+    analytics_service = AnalyticsService(db, Session, StudentRollup, TZ)
+    change_bus = create_change_bus(config.CHANGE_BUS, db.engine)
+    change_bus.subscribe(_apply_remote_change)
+    check_worker_driver(db.engine, db_cooperative)
     print("Services initialized successfully")
 
 # Create tables after models are defined (works under Gunicorn too)
@@ -177,6 +271,10 @@ def initialize_database_if_needed():
                     db.session.rollback()
                 except Exception:
                     pass
+
+            # Separate from the chain above, which stops early on SQLite
+            for msg in ensure_settings_unique_index():
+                print(f"Migration: {msg}")
             
             # Initialize services
             initialize_services()
@@ -220,6 +318,18 @@ def initialize_database_if_needed():
                         pass
                     raise  # Re-raise to see the full error
             
+            # One-time rollup backfill for databases that predate the rollup tables
+            try:
+                if SessionRollup.query.first() is None and Session.query.first() is not None:
+                    count = backfill_session_rollups()
+                    print(f"Backfilled stats rollups from {count} sessions")
+            except Exception as e:
+                print(f"Rollup backfill warning (non-fatal): {e}")
+                try:
+                    db.session.rollback()
+                except Exception:
+                    pass
+
             # Test that we can actually query the database
             try:
                 test_count = Session.query.count()
@@ -263,9 +373,9 @@ def get_current_user_id(token: Optional[str] = None) -> Optional[int]:
     3. If legacy admin_authenticated (no user_id), return None (global).
     """
     if token:
-        user = User.query.filter((User.kiosk_token == token) | (User.kiosk_slug == token)).first()
-        if user:
-            return user.id
+        user_id = resolve_kiosk_token(token)
+        if user_id:
+            return user_id
             
     if 'user_id' in session:
         return session['user_id']
@@ -273,73 +383,79 @@ def get_current_user_id(token: Optional[str] = None) -> Optional[int]:
     # Legacy: admin_authenticated but no user_id implies legacy global mode
     return None
 
+def _lookup_kiosk_token(token: str) -> Optional[int]:
+    """Resolve a kiosk token or slug with two indexed equality lookups (no OR scan)."""
+    row = db.session.query(User.id).filter(User.kiosk_token == token).first()
+    if row is None:
+        row = db.session.query(User.id).filter(User.kiosk_slug == token).first()
+    return row.id if row else None
+
+def resolve_kiosk_token(token: str) -> Optional[int]:
+    """Get the user_id for a public kiosk token or slug (cached)."""
+    if token_resolver:
+        return token_resolver.resolve(token)
+    return _lookup_kiosk_token(token)
+
+def invalidate_kiosk_token(user_id: Optional[int] = None, token: Optional[str] = None) -> None:
+    """Forget cached token/slug mappings after a user's kiosk URL changed (call after commit)."""
+    if token_resolver:
+        token_resolver.invalidate(token=token, user_id=user_id)
+
+@event.listens_for(User.kiosk_token, "set")
+@event.listens_for(User.kiosk_slug, "set")
+def _on_kiosk_token_set(target, value, oldvalue, initiator):
+    # Covers regenerate_kiosk_token()/set_kiosk_slug() wherever they are called;
+    # routes also invalidate after commit so a concurrent lookup can't re-cache the old row.
+    invalidate_kiosk_token(target.id, oldvalue if isinstance(oldvalue, str) else None)
+
 
 # ---------- Status Payload Utilities ----------
 # (Migrated to routes/kiosk.py)
 
-# ---------- FERPA-Compliant Roster Utilities ----------
+def notify_status_change(user_id: Optional[int] = None, reload_state: bool = True) -> None:
+    """Bump the status revision after a committed write so SSE streams rebuild (scoped to user).
 
-def get_memory_roster(user_id: Optional[int] = None) -> Dict[str, str]:
-    """Get student roster from memory cache (scoped to user)."""
-    return roster_service.get_memory_roster(user_id) if roster_service else {}
+    Pass reload_state=False only when the write was already applied to the
+    in-memory ClassroomState (write-through); otherwise it is rebuilt from SQL.
+    """
+    if reload_state and classroom_state_service:
+        classroom_state_service.invalidate(user_id)
+    if status_broadcaster:
+        status_broadcaster.bump(user_id)
+    if overdue_scheduler:
+        overdue_scheduler.reschedule(user_id)
+    if change_bus:
+        change_bus.publish(user_id)
+
+def _apply_remote_change(user_id: Optional[int]) -> None:
+    """A write committed by another worker (via the change bus): rebuild local state and wake streams."""
+    # The write may have been a settings change: don't serve the snapshot until its TTL
+    invalidate_settings(user_id)
+    if classroom_state_service:
+        classroom_state_service.invalidate(user_id)
+    if status_broadcaster:
+        status_broadcaster.bump(user_id)
+    if overdue_scheduler:
+        overdue_scheduler.reschedule(user_id)
+
+def _open_session_tenants() -> List[Optional[int]]:
+    """user_ids with at least one open session (for the overdue scheduler's resync)."""
+    return [row.user_id for row in db.session.query(Session.user_id).filter(Session.end_ts.is_(None)).distinct()]
+
+def get_classroom_state(user_id: Optional[int] = None):
+    """Get the in-memory classroom state (open sessions, queue, settings, bans) for a user."""
+    return classroom_state_service.get(user_id)
 
-def set_memory_roster(roster_dict: Dict[str, str], user_id: Optional[int] = None) -> None:
-    """Set student roster in memory cache (scoped to user)."""
-    if roster_service:
-        roster_service.set_memory_roster(user_id, roster_dict)
+# ---------- FERPA-Compliant Roster Utilities ----------
 
-def clear_memory_roster(user_id: Optional[int] = None) -> None:
-    """Clear student roster from memory cache (scoped to user)."""
-    if roster_service:
-        roster_service.clear_memory_roster(user_id)
+def get_roster_size(user_id: Optional[int] = None) -> int:
+    """Number of students on the roster, from the hash-keyed roster cache (scoped to user)."""
+    return roster_service.roster_size(user_id) if roster_service else 0
 
 def refresh_roster_cache(user_id: Optional[int] = None) -> None:
-    """Refresh the memory cache from the database (scoped to user)."""
-    if not roster_service:
-        return
-        
-    # Get all students for this user with non-encrypted names (or handle decryption)
-    # Simple case: Just load display_name mapped to name_hash or ID
-    # Actually memory cache maps: { id -> Name }
-    # So we need to reconstruct that.
-    
-    # 1. Clear current cache
-    clear_memory_roster(user_id)
-    
-    # 2. Query DB
-    students = StudentName.query.filter_by(user_id=user_id).all()
-    
-    # 3. Build dict
-    new_cache = {}
-    for s in students:
-        # Use encrypted_id if available (decrypted), else fallback to hash
-        # If encrypted_id is None, we can't get the original ID easily unless we used a deterministic hash
-        # But we stored `name_hash` which is `student_{user_id}_{source_id}` hashed.
-        # Wait, the Kiosk lookup hashes the input ID and checks against DB.
-        # But memory cache expects { 'real_id': 'Name' } for fast lookup on scan?
-        # NO, kiosk.js/UI sends raw ID. 
-        # If we hash it in app, we can match.
-        
-        # Actually RosterService.get_student_name checks cache first.
-        # If cache keys are raw IDs, we need raw IDs.
-        # If we only have hashes in DB, we can't repopulate cache with raw IDs!
-        
-        # HOWEVER, the `api_roster_upload` set cache with what?
-        # It didn't. It just called this missing function.
-        
-        # If we can't recover raw IDs, we can't "refresh" the cache fully for ID-based lookup
-        # UNLESS we decrypt the encrypted_id.
-        
-        if s.encrypted_id:
-            try:
-                raw_id = cipher_suite.decrypt(s.encrypted_id.encode()).decode()
-                new_cache[raw_id] = s.display_name
-            except Exception:
-                pass
-                
-    # 4. Set to cache
-    if new_cache:
-        set_memory_roster(new_cache, user_id)
+    """Drop the cached roster; the next lookup reloads it with one SELECT (no decryption)."""
+    if roster_service:
+        roster_service.invalidate_roster(user_id)
 
 def get_student_name(student_id: str, fallback: str = "Student", user_id: Optional[int] = None) -> str:
     """Get student name from memory or database (scoped to user)."""
@@ -383,6 +499,29 @@ def now_utc():
 def to_local(dt_utc):
     return dt_utc.astimezone(TZ)
 
+def local_date_range(date_from: Optional[str], date_to: Optional[str]):
+    """Parse inclusive local YYYY-MM-DD bounds (either may be empty).
+
+    Returns (since, until, start_utc, end_utc) with end_utc exclusive; raises ValueError.
+    """
+    since = until = start_utc = end_utc = None
+    if date_from:
+        since = datetime.strptime(date_from, "%Y-%m-%d").date()
+        start_utc = datetime.combine(since, datetime.min.time(), tzinfo=TZ).astimezone(timezone.utc)
+    if date_to:
+        until = datetime.strptime(date_to, "%Y-%m-%d").date()
+        end_utc = datetime.combine(until + timedelta(days=1), datetime.min.time(), tzinfo=TZ).astimezone(timezone.utc)
+    return since, until, start_utc, end_utc
+
+def stream_csv_response(filename: str, header: List[str], rows) -> Response:
+    """Stream CSV rows as a download, gzip-encoded when the client accepts it (?gzip=0 opts out)."""
+    chunks = csv_chunks(header, rows)
+    resp_headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Vary": "Accept-Encoding"}
+    if request.args.get("gzip") != "0" and "gzip" in request.headers.get("Accept-Encoding", ""):
+        chunks = gzip_chunks(chunks)
+        resp_headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(chunks), mimetype="text/csv", headers=resp_headers)
+
 def get_open_sessions(user_id: Optional[int] = None):
     """Get all currently open sessions (scoped to user)."""
     return session_service.get_open_sessions(user_id) if session_service else []
@@ -394,50 +533,9 @@ def get_current_holder(user_id: Optional[int] = None):
 def get_settings(user_id: Optional[int] = None):
     """Get settings for a specific user. Creates default settings if user doesn't have any."""
     try:
-        if user_id is not None:
-            s = Settings.query.filter_by(user_id=user_id).first()
-            if not s:
-                # Create default settings for this user (isolated from all others)
-                s = Settings(
-                    user_id=user_id,
-                    room_name="Hall Pass",
-                    capacity=1,
-                    overdue_minutes=10,
-                    kiosk_suspended=False,
-                    auto_ban_overdue=False
-                )
-                db.session.add(s)
-                db.session.commit()
-        else:
-            # Legacy/anonymous: return defaults only (don't create or use global)
-            return {
-                "room_name": config.ROOM_NAME, 
-                "capacity": config.CAPACITY, 
-                "overdue_minutes": getattr(config, "MAX_MINUTES", 10), 
-                "kiosk_suspended": False, 
-                "auto_ban_overdue": False
-            }
-        
-        # Handle case where columns might not exist yet (during migration)
-        try:
-            kiosk_suspended = s.kiosk_suspended
-        except AttributeError:
-            kiosk_suspended = False
-        
-        try:
-            auto_ban_overdue = s.auto_ban_overdue
-        except AttributeError:
-            auto_ban_overdue = False
-        
-        return {
-            "room_name": s.room_name, 
-            "capacity": s.capacity, 
-            "overdue_minutes": s.overdue_minutes, 
-            "kiosk_suspended": kiosk_suspended, 
-            "auto_ban_overdue": auto_ban_overdue,
-            "enable_queue": getattr(s, 'enable_queue', False),
-            "auto_promote_queue": getattr(s, 'auto_promote_queue', False)
-        }
+        if settings_cache:
+            return settings_cache.get(user_id)
+        return _load_settings(user_id)
     except Exception:
         # If query fails, return defaults
         return {
@@ -450,6 +548,108 @@ def get_settings(user_id: Optional[int] = None):
             "auto_promote_queue": False
         }
 
+def record_session_start(user_id: Optional[int], student_id: str, start_ts: datetime) -> None:
+    """Count a new session in the stats rollups (same transaction as the session write)."""
+    if rollup_service:
+        rollup_service.record_start(user_id, student_id, start_ts)
+
+def record_session_end(user_id: Optional[int], student_id: str, start_ts: datetime, end_ts: datetime) -> None:
+    """Add an ended session's duration/overdue flag to the stats rollups (same transaction)."""
+    if rollup_service:
+        overdue_seconds = get_settings(user_id)["overdue_minutes"] * 60
+        rollup_service.record_end(user_id, student_id, start_ts, end_ts, overdue_seconds)
+
+def clear_session_rollups(user_id: Optional[int] = None) -> None:
+    """Drop stats rollups alongside deleted session history (caller commits)."""
+    if rollup_service:
+        rollup_service.clear(user_id)
+
+def invalidate_settings(user_id: Optional[int] = None) -> None:
+    """Drop the cached settings snapshot after a Settings write (call after commit)."""
+    if settings_cache:
+        settings_cache.invalidate(user_id)
+
+def find_settings(user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Get settings without creating a default row (background threads); None if the user has none."""
+    if settings_cache:
+        return settings_cache.find(user_id)
+    return _load_settings(user_id, create=False)
+
+def get_or_create_settings(user_id: int):
+    """Get a user's Settings row, inserting the defaults if missing (commits the insert).
+
+    Racing creators (request threads in several workers) all land on the one
+    row allowed by ux_settings_user_id instead of adding duplicates. Until that
+    index is known to exist the row is added plainly, and a unique violation
+    means another request created it first.
+    """
+    s = Settings.query.filter_by(user_id=user_id).first()
+    if s:
+        return s
+    defaults = dict(user_id=user_id, room_name="Hall Pass", capacity=1, overdue_minutes=10,
+                    kiosk_suspended=False, auto_ban_overdue=False, auto_promote_queue=False,
+                    enable_queue=False)
+    dialect = db.engine.dialect.name
+    if settings_unique_index and dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        db.session.execute(dialect_insert(Settings.__table__).values(**defaults)
+                           .on_conflict_do_nothing(index_elements=["user_id"]))
+        db.session.commit()
+    else:
+        db.session.add(Settings(**defaults))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # Another request created it first
+    return Settings.query.filter_by(user_id=user_id).order_by(Settings.id).first()
+
+def _load_settings(user_id: Optional[int] = None, create: bool = True):
+    """Read settings from the database (uncached, raises on failure).
+
+    With create=False a user without a Settings row gets None instead of a new
+    default row.
+    """
+    if user_id is not None:
+        s = Settings.query.filter_by(user_id=user_id).first()
+        if not s:
+            if not create:
+                return None
+            # Create default settings for this user (isolated from all others)
+            s = get_or_create_settings(user_id)
+    else:
+        # Legacy/anonymous: return defaults only (don't create or use global)
+        return {
+            "room_name": config.ROOM_NAME, 
+            "capacity": config.CAPACITY, 
+            "overdue_minutes": getattr(config, "MAX_MINUTES", 10), 
+            "kiosk_suspended": False, 
+            "auto_ban_overdue": False
+        }
+    
+    # Handle case where columns might not exist yet (during migration)
+    try:
+        kiosk_suspended = s.kiosk_suspended
+    except AttributeError:
+        kiosk_suspended = False
+    
+    try:
+        auto_ban_overdue = s.auto_ban_overdue
+    except AttributeError:
+        auto_ban_overdue = False
+    
+    return {
+        "room_name": s.room_name, 
+        "capacity": s.capacity, 
+        "overdue_minutes": s.overdue_minutes, 
+        "kiosk_suspended": kiosk_suspended, 
+        "auto_ban_overdue": auto_ban_overdue,
+        "enable_queue": getattr(s, 'enable_queue', False),
+        "auto_promote_queue": getattr(s, 'auto_promote_queue', False)
+    }
+
 @app.context_processor
 def inject_room_name():
     # Try to resolve user context to show correct room name
@@ -526,10 +726,8 @@ def serve_static(filename):
 @app.route("/kiosk/<token>")
 def public_kiosk(token):
     """Public kiosk access via unique token or slug"""
-    user = User.query.filter(
-        (User.kiosk_token == token) | (User.kiosk_slug == token)
-    ).first()
-    if not user:
+    user_id = resolve_kiosk_token(token)
+    if not user_id:
         return "Kiosk not found", 404
         
     # Check if Flutter app is built (in static folder)
@@ -539,6 +737,7 @@ def public_kiosk(token):
         return send_file(flutter_index)
         
     # Fallback to legacy template if Flutter not built
+    user = User.query.get(user_id)
     return render_template("kiosk.html", user_id=user.id, user_name=user.name, token=token)
 
 # Legacy display route (for backward compatibility)
@@ -558,10 +757,8 @@ def display():
 @app.route("/display/<token>")
 def public_display(token):
     """Public display access via unique token or slug"""
-    user = User.query.filter(
-        (User.kiosk_token == token) | (User.kiosk_slug == token)
-    ).first()
-    if not user:
+    user_id = resolve_kiosk_token(token)
+    if not user_id:
         return "Display not found", 404
         
     # Check if Flutter app is built (in static folder)
@@ -570,6 +767,7 @@ def public_display(token):
         # Serve the Flutter SPA
         return send_file(flutter_index)
 
+    user = User.query.get(user_id)
     return render_template("display.html", user_id=user.id, user_name=user.name, token=token)
 
 @app.route("/admin/login", methods=["GET"])
@@ -725,6 +923,18 @@ def _start_keepalive_thread():
     t.start()
     _keepalive_started = True
 
+@app.before_request
+def _start_overdue_scheduler():
+    # Started lazily so the thread lives in the serving worker, not a preload parent
+    if overdue_scheduler:
+        overdue_scheduler.start()
+
+@app.before_request
+def _start_change_bus():
+    # Listens from the serving worker, like the overdue scheduler
+    if change_bus:
+        change_bus.start()
+
 # ---- API ----
 
 # ---- API ----
@@ -740,35 +950,14 @@ def api_stats():
     """Simple stats: today's hourly counts and last 7 days daily counts."""
     user_id = get_current_user_id()
     today_local = datetime.now(TZ).date()
-    start_today = datetime.combine(today_local, datetime.min.time(), tzinfo=TZ).astimezone(timezone.utc)
-    end_today = datetime.combine(today_local, datetime.max.time(), tzinfo=TZ).astimezone(timezone.utc)
-    
-    query = Session.query.filter(Session.start_ts >= start_today, Session.start_ts <= end_today)
-    if user_id is not None:
-        query = query.filter_by(user_id=user_id)
-        
-    rows_today = query.all()
 
-    hourly = [0]*24
-    for r in rows_today:
-        h = r.start_ts.astimezone(TZ).hour
-        hourly[h] += 1
+    # Read from the pre-aggregated rollups (a few dozen rows regardless of history)
+    hourly = rollup_service.hourly_counts(user_id, today_local)
 
     # last 7 days including today
-    daily_labels = []
-    daily_counts = []
-    for i in range(6, -1, -1):
-        day = today_local - timedelta(days=i)
-        ds = datetime.combine(day, datetime.min.time(), tzinfo=TZ).astimezone(timezone.utc)
-        de = datetime.combine(day, datetime.max.time(), tzinfo=TZ).astimezone(timezone.utc)
-        
-        q = Session.query.filter(Session.start_ts >= ds, Session.start_ts <= de)
-        if user_id is not None:
-            q = q.filter_by(user_id=user_id)
-            
-        c = q.count()
-        daily_labels.append(day.strftime("%a"))
-        daily_counts.append(c)
+    days = [today_local - timedelta(days=i) for i in range(6, -1, -1)]
+    daily_labels = [day.strftime("%a") for day in days]
+    daily_counts = rollup_service.daily_counts(user_id, days)
 
     return jsonify({
         "hourly": hourly,
@@ -782,39 +971,25 @@ def api_stats_week():
     user_id = get_current_user_id()
     settings = get_settings(user_id)
     overdue_minutes = settings["overdue_minutes"]
-    now = now_utc()
-    start_utc = (datetime.now(TZ).date() - timedelta(days=6))
-    start_utc = datetime.combine(start_utc, datetime.min.time(), tzinfo=TZ).astimezone(timezone.utc)
-    
-    query = Session.query.filter(Session.start_ts >= start_utc)
-    if user_id is not None:
-        query = query.filter_by(user_id=user_id)
-        
-    rows = query.all()
+    since = datetime.now(TZ).date() - timedelta(days=6)
 
-    per_student = {}
-    for r in rows:
-        sid = r.student_id
+    # Grouping, overdue classification and ranking happen in SQL
+    def top(order):
+        return analytics_service.top_students(user_id, since, overdue_minutes * 60, order=order, limit=10)
+    top_usage, top_overdue, top_overdue_rate = top("count"), top("overdue"), top("overdue_rate")
+
+    # Resolve names only for the ranked students
+    names = {}
+    for row in top_usage + top_overdue + top_overdue_rate:
         # Prefer roster name over Student table name (fixes Anonymous entries)
-        name = get_student_name(sid, "Unknown", user_id=user_id)
-        if name == "Unknown" and r.student and r.student.name != "Student":
-            name = r.student.name
-        if sid not in per_student:
-            per_student[sid] = {"name": name, "count": 0, "overdue": 0}
-        per_student[sid]["count"] += 1
-        end = r.end_ts or now
-        duration = int((end - r.start_ts).total_seconds())
-        if duration > overdue_minutes * 60:
-            per_student[sid]["overdue"] += 1
-
-    # top by count
-    top_usage = sorted(per_student.values(), key=lambda x: x["count"], reverse=True)[:10]
-    # top by overdue absolute
-    top_overdue = sorted(per_student.values(), key=lambda x: x["overdue"], reverse=True)[:10]
-    # top by overdue rate (only if count >= 1)
-    for v in per_student.values():
-        v["overdue_rate"] = (v["overdue"] / v["count"]) if v["count"] else 0
-    top_overdue_rate = sorted(per_student.values(), key=lambda x: x["overdue_rate"], reverse=True)[:10]
+        names.setdefault(row["student_id"], get_student_name(row["student_id"], "Unknown", user_id=user_id))
+    unnamed = [sid for sid, name in names.items() if name == "Unknown"]
+    if unnamed:
+        for sid, name in db.session.query(Student.id, Student.name).filter(Student.id.in_(unnamed)):
+            if name != "Student":
+                names[sid] = name
+    for row in top_usage + top_overdue + top_overdue_rate:
+        row["name"] = names[row["student_id"]]
 
     def pack(arr):
         return {"labels": [a["name"] for a in arr], "values": [a["count"] for a in arr], "overdues": [a["overdue"] for a in arr], "rates": [round(a.get("overdue_rate", 0)*100, 1) for a in arr]}
@@ -839,7 +1014,9 @@ def api_override_end():
         return jsonify(ok=False, message="No one is out."), 400
     s.end_ts = now_utc()
     s.ended_by = "override"
+    record_session_end(user_id, s.student_id, s.start_ts, s.end_ts)
     db.session.commit()
+    notify_status_change(user_id)
     return jsonify(ok=True)
 
 
@@ -859,24 +1036,13 @@ def api_toggle_kiosk_suspend_quick():
             return jsonify(ok=False, message="Invalid token or not authenticated"), 403
         
         # Get or create settings for this user
-        s = Settings.query.filter_by(user_id=user_id).first()
-        if not s:
-            s = Settings(
-                user_id=user_id,
-                room_name="Hall Pass",
-                capacity=1,
-                overdue_minutes=10,
-                kiosk_suspended=True,
-                auto_ban_overdue=False,
-                auto_promote_queue=False
-            )
-            db.session.add(s)
-            new_state = True
-        else:
-            s.kiosk_suspended = not s.kiosk_suspended
-            new_state = s.kiosk_suspended
+        s = get_or_create_settings(user_id)
+        s.kiosk_suspended = not s.kiosk_suspended
+        new_state = s.kiosk_suspended
         
         db.session.commit()
+        invalidate_settings(user_id)
+        notify_status_change(user_id)
         return jsonify(ok=True, suspended=new_state, message=f"Kiosk {'suspended' if new_state else 'resumed'}")
     except Exception as e:
         db.session.rollback()
@@ -945,7 +1111,9 @@ def api_ban_student():
     if active_session:
         active_session.end_ts = now_utc()
         active_session.ended_by = "admin_ban"
+        record_session_end(user_id, student_id, active_session.start_ts, active_session.end_ts)
         db.session.commit()
+    notify_status_change(user_id)
     
     if success:
         msg = f"{student_name} banned"
@@ -974,6 +1142,7 @@ def api_unban_student():
     
     # Remove ban status
     success = set_student_banned(student_id, False, user_id=user_id)
+    notify_status_change(user_id, reload_state=False)
     
     if success:
         return jsonify(ok=True, message=f"{student_name} unbanned from restroom", student_id=student_id)
@@ -1003,6 +1172,7 @@ def api_auto_ban_overdue():
     """Manually trigger auto-ban for all students who are currently overdue."""
     user_id = get_current_user_id()
     result = auto_ban_overdue_students(user_id)
+    notify_status_change(user_id, reload_state=False)
     
     return jsonify(
         ok=True, 
@@ -1026,43 +1196,36 @@ def api_upload_session_roster():
         if not f or f.filename == '':
             return jsonify(ok=False, message="No file selected"), 400
             
-        text = f.stream.read().decode("utf-8", errors="ignore")
-        reader = csv.reader(io.StringIO(text))
-        
-        student_roster = {}
-        count = 0
-        
-        # Clear existing memory roster to force refresh
-        clear_memory_roster(user_id)
+        # Parse lazily; rows are hashed/encrypted and upserted in chunks
+        reader = csv.reader(io.TextIOWrapper(f.stream, encoding="utf-8", errors="ignore", newline=""))
         
         # We don't clear the DB first - we upsert/add. 
         # If user wants to clear, they should use the clear endpoint first.
         
-        for row in reader:
-            if not row or len(row) < 2:
-                continue
-            sid, name = row[0].strip(), row[1].strip()
-            if not sid or not name:
-                continue
-            student_roster[sid] = name
-            count += 1
+        def roster_rows():
+            for row in reader:
+                if not row or len(row) < 2:
+                    continue
+                sid, name = row[0].strip(), row[1].strip()
+                if sid and name:
+                    yield sid, name
         
-        # Store all students in DB using efficient batch method (single commit)
-        db_stored = roster_service.store_student_names_batch(user_id, student_roster)
-        
-        # Populate memory cache for immediate performance
-        set_memory_roster(student_roster, user_id)
+        result = roster_service.ingest(user_id, roster_rows())
+        count = result["count"]
         
         # Update any Anonymous students with real names from the roster
         # This global update needs review for multi-tenancy as Student table is mixed
         
         # Retroactively update any "Anonymous_ID" entries in database
         updated_count = roster_service.update_anonymous_students(user_id, Student)
+        notify_status_change(user_id)
             
         msg = f"Roster uploaded successfully ({count} students)."
         if updated_count > 0:
             msg += f" Updated {updated_count} previously anonymous entries."
-        return jsonify(ok=True, imported=count, updated_anonymous=updated_count, message=msg)
+        return jsonify(ok=True, imported=count, updated_anonymous=updated_count, message=msg,
+                       rows_per_second=round(result["rows_per_second"]),
+                       db_seconds=round(result["db_seconds"], 3))
         
     except Exception as e:
         return jsonify(ok=False, message=f"Upload failed: {str(e)}"), 500
@@ -1072,11 +1235,11 @@ def api_upload_session_roster():
 def api_get_memory_roster_status():
     """Get memory roster status for admin display"""
     user_id = get_current_user_id()
-    memory_roster = get_memory_roster(user_id)
+    count = get_roster_size(user_id)
     
     status = {
-        'count': len(memory_roster),
-        'active': len(memory_roster) > 0,
+        'count': count,
+        'active': count > 0,
     }
     
     return jsonify(ok=True, **status)
@@ -1086,8 +1249,8 @@ def api_get_memory_roster_status():
 def api_clear_session_roster():
     """Clear memory and database roster."""
     user_id = get_current_user_id()
-    clear_memory_roster(user_id)
     roster_service.clear_all_student_names(user_id)
+    notify_status_change(user_id)
     return jsonify(ok=True, message="All rosters cleared")
 
 
@@ -1112,6 +1275,7 @@ def api_admin_reset():
         
         if clear_sessions:
             if session_service:
+                clear_session_rollups(user_id)  # Committed with the history delete
                 success = session_service.clear_user_history(user_id)
                 if success:
                     messages.append("Session history cleared")
@@ -1126,6 +1290,7 @@ def api_admin_reset():
                 else:
                     return jsonify(ok=False, message="Failed to clear roster"), 500
                     
+        notify_status_change(user_id)
         return jsonify(ok=True, message=". ".join(messages) if messages else "No actions taken", cleared=messages)
         
     except Exception as e:
@@ -1148,8 +1313,10 @@ def api_reset_database():
         else:
              # Legacy global wipe
              total_sessions = Session.query.delete()
+        clear_session_rollups(user_id)
              
         db.session.commit()
+        notify_status_change(user_id)
 
         return jsonify(
             ok=True,
@@ -1165,7 +1332,7 @@ def api_reset_database():
 
 @app.get("/export.csv")
 def export_csv():
-    """Export sessions for the current day in local timezone."""
+    """Export sessions for a local date range (?from=&to=, default today), streamed."""
     # Note: export.csv is usually hit by browser so cookie auth works if admin logged in.
     # We should require authentication explicitly if not already (it wasn't fastidiously enforced before?)
     # Adding @require_admin_auth wrapper or just handling it inside
@@ -1173,36 +1340,26 @@ def export_csv():
         return redirect(url_for('admin_login'))
         
     user_id = get_current_user_id()
-    today_local = datetime.now(TZ).date()
-    start = datetime.combine(today_local, datetime.min.time(), tzinfo=TZ).astimezone(timezone.utc)
-    end = datetime.combine(today_local, datetime.max.time(), tzinfo=TZ).astimezone(timezone.utc)
-
-    query = Session.query.filter(Session.start_ts >= start, Session.start_ts <= end)
-    if user_id is not None:
-        query = query.filter_by(user_id=user_id)
-        
-    rows = query.order_by(Session.start_ts.asc()).all()
-
-    out = io.StringIO()
-    w = csv.writer(out)
-    w.writerow(["student_id", "name", "start_local", "end_local", "duration_seconds", "ended_by", "overdue"])
-    
-    settings = get_settings(user_id)
-    overdue_minutes = settings["overdue_minutes"]
-    
-    for r in rows:
-        start_local = r.start_ts.astimezone(TZ).strftime("%Y-%m-%d %H:%M:%S")
-        end_local = r.end_ts.astimezone(TZ).strftime("%Y-%m-%d %H:%M:%S") if r.end_ts else ""
-        duration = r.duration_seconds if r.end_ts else int((now_utc() - r.start_ts).total_seconds())
-        is_overdue = duration > overdue_minutes * 60
-        w.writerow([r.student_id, r.student.name, start_local, end_local, duration if r.end_ts else "", r.ended_by or "", "YES" if is_overdue else "NO"])
-    out.seek(0)
-
-    return send_file(
-        io.BytesIO(out.getvalue().encode("utf-8")),
-        mimetype="text/csv",
-        as_attachment=True,
-        download_name="hallpass_export.csv",
+    today = datetime.now(TZ).date().isoformat()
+    try:
+        _, _, start, end = local_date_range(request.args.get("from", today), request.args.get("to", today))
+    except ValueError as e:
+        return f"Invalid date range: {e}", 400
+
+    overdue_seconds = get_settings(user_id)["overdue_minutes"] * 60
+
+    def rows():
+        for r in session_service.iter_sessions(user_id, start_utc=start, end_utc=end):
+            start_local = r.start_ts.astimezone(TZ).strftime("%Y-%m-%d %H:%M:%S")
+            end_local = r.end_ts.astimezone(TZ).strftime("%Y-%m-%d %H:%M:%S") if r.end_ts else ""
+            duration = int(((r.end_ts or now_utc()) - r.start_ts).total_seconds())
+            is_overdue = duration > overdue_seconds
+            yield [r.student_id, r.student_name, start_local, end_local, duration if r.end_ts else "", r.ended_by or "", "YES" if is_overdue else "NO"]
+
+    return stream_csv_response(
+        "hallpass_export.csv",
+        ["student_id", "name", "start_local", "end_local", "duration_seconds", "ended_by", "overdue"],
+        rows(),
     )
 
 @app.post("/api/settings/kiosk-slug")
@@ -1240,6 +1397,7 @@ def api_set_kiosk_slug():
         user = User.query.get(user_id)
         user.kiosk_slug = slug
         db.session.commit()
+        invalidate_kiosk_token(user_id)
         
         return jsonify(ok=True, slug=slug, message="Kiosk URL updated successfully")
         
@@ -1690,6 +1848,53 @@ def run_migrations():
     except Exception as e:
         messages.append(f"Warning: constraint migration: {e}")
 
+    # Migration 9: Composite indexes for per-tenant open-session lookups and pass-log pages
+    try:
+        db.session.rollback()
+        with db.engine.begin() as conn:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_session_user_end_start ON session (user_id, end_ts, start_ts)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_session_user_start ON session (user_id, start_ts DESC, id DESC)"))
+        messages.append("Session lookup indexes created/verified")
+    except Exception as e:
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+        messages.append(f"Warning: session index migration: {e}")
+
+    return messages
+
+
+def ensure_settings_unique_index() -> List[str]:
+    """Create ux_settings_user_id (after dropping duplicate rows) and return log messages.
+
+    Runs on its own rather than in run_migrations(), whose information_schema and
+    ADD COLUMN IF NOT EXISTS steps fail on SQLite before reaching the end.
+    get_or_create_settings() only relies on ON CONFLICT once this has succeeded.
+    """
+    global settings_unique_index
+    messages = []
+    # Racing get-or-creates could add duplicates; keep the oldest (the row .first()
+    # has been reading and writing)
+    try:
+        db.session.rollback()
+        with db.engine.begin() as conn:
+            removed = conn.execute(text(
+                "DELETE FROM settings WHERE user_id IS NOT NULL AND id NOT IN "
+                "(SELECT MIN(id) FROM settings WHERE user_id IS NOT NULL GROUP BY user_id)"
+            )).rowcount
+            conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_settings_user_id ON settings (user_id)"))
+            conn.execute(text("DROP INDEX IF EXISTS ix_settings_user_id"))
+        settings_unique_index = True
+        if removed:
+            messages.append(f"Removed {removed} duplicate settings row(s)")
+        messages.append("Settings user_id unique index created/verified")
+    except Exception as e:
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+        messages.append(f"Warning: settings unique index: {e}")
     return messages
 
 
@@ -1698,13 +1903,29 @@ def migrate_db():
     """Run database migrations for schema updates."""
     print("Running database migrations...")
     try:
-        messages = run_migrations()
+        messages = run_migrations() + ensure_settings_unique_index()
         for m in messages:
             print(f"- {m}")
         print("Database migrations completed successfully!")
     except Exception as e:
         print(f"Migration failed: {e}")
 
+def backfill_session_rollups(user_id: Optional[int] = None) -> int:
+    """Rebuild the stats rollups from session history; returns sessions counted."""
+    return rollup_service.backfill(Session, lambda uid: get_settings(uid)["overdue_minutes"] * 60, user_id)
+
+@app.cli.command("rollup-backfill")
+@click.option("--user-id", type=int, default=None, help="Only rebuild this user's rollups.")
+def rollup_backfill(user_id):
+    """Rebuild the pre-aggregated stats rollups from existing session history."""
+    print("Backfilling session rollups...")
+    try:
+        count = backfill_session_rollups(user_id)
+        print(f"Rollups rebuilt from {count} sessions.")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Rollup backfill failed: {e}")
+
 # ---- Debug & Migration API ----
 
 @app.get("/api/debug/settings")
@@ -1787,7 +2008,7 @@ def api_debug_database():
 def migrate_api():
     """Run database migrations via HTTP for platforms without shell access."""
     try:
-        messages = run_migrations()
+        messages = run_migrations() + ensure_settings_unique_index()
         return jsonify(ok=True, messages=messages)
     except Exception as e:
         # Ensure the session is usable after an error
@@ -1801,7 +2022,7 @@ def migrate_api():
 @app.get("/api/settings")
 @require_admin_auth_api
 def get_settings_api():
-    return jsonify(get_settings())
+    return jsonify(get_settings(get_current_user_id()))
 
 
 
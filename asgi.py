@@ -0,0 +1,284 @@
+"""
+ASGI entry point: asyncio-native status streaming next to the Flask app
+
+/api/stream and /events (SSE) and /api/status long-polls are served on the
+event loop from the shared StatusBroadcaster through a StreamHub, so an idle
+display costs a parked coroutine instead of a worker, thread or greenlet.
+Status payloads are still built once per change by the broadcaster's pump;
+the only per-connection work in a thread is resolving the kiosk token when
+the stream opens. Every other path is passed to the Flask app (same models
+and services) on a thread pool.
+
+Run with any ASGI server, e.g.:
+    uvicorn asgi:application --workers 4
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode
+import asyncio
+import io
+import os
+import sys
+
+import app as app_module
+from app import app as flask_app
+from routes.kiosk import MAX_STATUS_WAIT_SECONDS
+from services.stream_hub import StreamHub
+
+SSE_PATHS = ("/api/stream", "/events")
+SSE_HEADERS = [
+    (b"content-type", b"text/event-stream; charset=utf-8"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+]
+# Chunks a Flask response may run ahead of a slow client before its thread waits
+WSGI_QUEUE_DEPTH = 16
+
+
+def _environ(scope: dict, body: bytes) -> dict:
+    """WSGI environ for an ASGI HTTP scope"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope["headers"]:
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[name] = value
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    # The body is fully read already (chunked uploads included)
+    environ.setdefault("CONTENT_LENGTH", str(len(body)))
+    environ["wsgi.input_terminated"] = True
+    return environ
+
+
+class StreamingApp:
+    def __init__(self, wsgi_app, max_threads: Optional[int] = None):
+        """
+        Initialize StreamingApp.
+
+        Args:
+            wsgi_app: The Flask app (serves everything except the streaming paths)
+            max_threads: Thread pool size for Flask requests and token lookups
+        """
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=max_threads or min(32, (os.cpu_count() or 1) + 4),
+                                           thread_name_prefix="asgi-wsgi")
+        self._hubs = {}
+
+    def hub(self) -> StreamHub:
+        """The StreamHub for the running event loop"""
+        loop = asyncio.get_running_loop()
+        hub = self._hubs.get(loop)
+        if hub is None:
+            hub = self._hubs[loop] = StreamHub(app_module.status_broadcaster)
+        return hub
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        if app_module.status_broadcaster is not None and scope["method"] == "GET":
+            if scope["path"] in SSE_PATHS:
+                await self._stream(scope, receive, send)
+                return
+            if scope["path"] == "/api/status" and await self._long_poll(scope):
+                # Changed (or timed out): Flask answers 200 or 304 without waiting again
+                scope = dict(scope, query_string=self._without_wait(scope["query_string"]))
+        await self._wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Background threads the Flask app starts on its first request
+                if app_module.overdue_scheduler:
+                    app_module.overdue_scheduler.start()
+                if app_module.change_bus:
+                    app_module.change_bus.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _resolve_user(self, environ: dict) -> Optional[int]:
+        # Same rules as the Flask routes: kiosk token, else the logged-in session
+        from flask import request
+        with flask_app.request_context(environ):
+            return app_module.get_current_user_id(request.args.get("token"))
+
+    @staticmethod
+    def _status_etag(user_id: Optional[int]) -> str:
+        # Same ETag the Flask route sets (a hash of the encoded status); may build it
+        with flask_app.app_context():
+            return app_module.status_broadcaster.status_body(user_id)[2]
+
+    async def _stream(self, scope, receive, send) -> None:
+        """SSE stream fed by the hub; replaces routes.kiosk._sse_status_stream"""
+        loop = asyncio.get_running_loop()
+        user_id = await loop.run_in_executor(self.executor, self._resolve_user, _environ(scope, b""))
+        await send({"type": "http.response.start", "status": 200, "headers": SSE_HEADERS})
+        await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+
+        params = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+        delta = params.get("delta", "").lower() in ("1", "true", "yes")
+        last_event_id = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"last-event-id"),
+                             params.get("last_event_id"))
+        hub = self.hub()
+        listener = hub.attach(user_id, delta, last_event_id)
+
+        async def wait_for_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        disconnect = loop.create_task(wait_for_disconnect())
+        disconnect.add_done_callback(lambda _: listener.close())
+        try:
+            while True:
+                frame = await listener.next()
+                if frame is None:
+                    break
+                if frame:  # A delta client that is already current gets nothing
+                    await send({"type": "http.response.body", "body": frame, "more_body": True})
+        except OSError:
+            pass  # Client went away mid-send
+        finally:
+            hub.detach(listener)
+            disconnect.cancel()
+
+    async def _long_poll(self, scope) -> bool:
+        """
+        Hold an /api/status request whose If-None-Match is current for up to
+        `wait` seconds without a thread; True if the request should then be
+        answered without waiting again.
+        """
+        params = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+        try:
+            wait = min(max(float(params.get("wait", 0)), 0.0), MAX_STATUS_WAIT_SECONDS)
+        except ValueError:
+            return False
+        if wait <= 0:
+            return False
+        if_none_match = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"if-none-match"), None)
+        if not if_none_match:
+            return False
+
+        loop = asyncio.get_running_loop()
+        user_id = await loop.run_in_executor(self.executor, self._resolve_user, _environ(scope, b""))
+        etag = await loop.run_in_executor(self.executor, self._status_etag, user_id)
+        if f'"{etag}"' not in if_none_match and etag not in if_none_match:
+            return True  # Already stale: answer right away
+
+        hub = self.hub()
+        listener = hub.attach(user_id)
+        try:
+            listener.frame = None  # Only a frame built after this point means a change
+            end = loop.time() + wait
+            while True:
+                remaining = end - loop.time()
+                if remaining <= 0:
+                    break
+                frame = await listener.next(remaining)
+                if listener.closed:
+                    break
+                if frame is None:
+                    continue  # Timed out: the loop ends on the deadline
+                # A published frame (or keepalive): answer once the bytes differ
+                if await loop.run_in_executor(self.executor, self._status_etag, user_id) != etag:
+                    break
+        finally:
+            hub.detach(listener)
+        return True
+
+    @staticmethod
+    def _without_wait(query_string: bytes) -> bytes:
+        params = [(k, v) for k, v in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True) if k != "wait"]
+        return urlencode(params).encode("latin-1")
+
+    async def _wsgi(self, scope, receive, send) -> None:
+        """Run the Flask app on the thread pool, streaming its response back"""
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        environ = _environ(scope, b"".join(chunks))
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(WSGI_QUEUE_DEPTH)
+        job = loop.run_in_executor(self.executor, self._run_wsgi, environ, queue, loop)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, tuple):
+                    status, headers = item
+                    await send({"type": "http.response.start", "status": status, "headers": headers})
+                else:
+                    await send({"type": "http.response.body", "body": item, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await job
+
+    def _run_wsgi(self, environ: dict, queue: asyncio.Queue, loop) -> None:
+        # Runs in a pool thread. The whole response is produced in this one
+        # thread so stream_with_context generators keep their request context.
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        response = {}
+
+        def put_start():
+            put(response.pop("start"))
+            response["sent"] = True
+
+        def start_response(status, headers, exc_info=None):
+            response["start"] = (int(status.split(" ", 1)[0]),
+                                 [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers])
+
+        iterable = None
+        try:
+            iterable = self.wsgi_app(environ, start_response)
+            for chunk in iterable:
+                if "start" in response:
+                    put_start()
+                if chunk:
+                    put(chunk)
+            if "start" in response:
+                put_start()
+        except Exception as e:
+            print(f"ASGI bridge error for {environ.get('PATH_INFO')}: {e}")
+            if "sent" not in response:
+                put((500, [(b"content-type", b"text/plain")]))
+                put(b"Internal Server Error")
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+            put(None)
+
+
+application = StreamingApp(flask_app)
@@ -0,0 +1,142 @@
+"""
+Benchmark: stats endpoints against a tenant with a long session history
+
+Generates a tenant with 100k sessions spread over the past months, builds the
+rollups, then times /api/stats, /api/stats/week and /api/admin/stats (latency
+and SQL statements per request). For comparison it also times the old approach
+of loading every session in the window and aggregating in Python, and checks
+that both produce the same per-student counts.
+
+Usage:
+    python benchmarks/analytics.py [sessions] [days] [requests]
+
+Defaults to 100000 sessions over 180 days, 20 requests per endpoint. Uses a
+throwaway SQLite database unless DATABASE_URL is set.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from sqlalchemy import event
+
+from app import app, db, User, Session, Student, TZ, backfill_session_rollups
+
+STUDENTS = 500
+OVERDUE_SECONDS = 10 * 60
+
+
+def setup_tenant(sessions, days):
+    """Create a user and `sessions` ended sessions over the last `days` days"""
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        user = User(google_id="bench", email="bench@halllday.local", name="Bench", kiosk_token="bench-token")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        db.session.bulk_insert_mappings(Student, [
+            dict(id=str(70000 + i), name=f"Anonymous_{70000 + i}", user_id=user_id) for i in range(STUDENTS)
+        ])
+        rows = []
+        for _ in range(sessions):
+            start = now - timedelta(seconds=rng.randrange(days * 86400))
+            # Mostly short trips, some well past the overdue limit
+            duration = rng.choice((rng.randrange(60, 480), rng.randrange(60, 480), rng.randrange(300, 1800)))
+            end = min(start + timedelta(seconds=duration), now)
+            rows.append(dict(student_id=str(70000 + rng.randrange(STUDENTS)), start_ts=start, end_ts=end,
+                             ended_by="kiosk_scan", user_id=user_id))
+        db.session.bulk_insert_mappings(Session, rows)
+        db.session.commit()
+    return user_id
+
+
+def legacy_student_stats(user_id, since_utc):
+    """The pre-rollup approach: load the window's rows and aggregate in Python"""
+    stats = {}
+    now = datetime.now(timezone.utc)
+    for s in Session.query.filter(Session.start_ts >= since_utc).filter_by(user_id=user_id).all():
+        stat = stats.setdefault(s.student_id, {"count": 0, "overdue": 0})
+        stat["count"] += 1
+        start = s.start_ts.replace(tzinfo=timezone.utc) if s.start_ts.tzinfo is None else s.start_ts
+        end = s.end_ts or now
+        end = end.replace(tzinfo=timezone.utc) if end.tzinfo is None else end
+        if (end - start).total_seconds() > OVERDUE_SECONDS:
+            stat["overdue"] += 1
+    return stats
+
+
+def time_call(fn, repeat):
+    """Median seconds per call and SQL statements per call"""
+    statements = Counter()
+
+    def count(*_):
+        statements["n"] += 1
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+    finally:
+        with app.app_context():
+            event.remove(db.engine, "before_cursor_execute", count)
+    samples.sort()
+    return samples[len(samples) // 2], statements["n"] / repeat
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 180
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    start = time.perf_counter()
+    user_id = setup_tenant(sessions, days)
+    print(f"generated:       {sessions} sessions over {days} days in {time.perf_counter() - start:.1f}s")
+
+    with app.app_context():
+        start = time.perf_counter()
+        counted = backfill_session_rollups(user_id)
+        print(f"backfill:        {counted} sessions in {time.perf_counter() - start:.1f}s")
+        dialect = db.engine.dialect.name
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+    client.post("/api/settings/update", json={"overdue_minutes": OVERDUE_SECONDS // 60})
+
+    print(f"database:        {dialect}")
+    for path in ("/api/stats", "/api/stats/week", "/api/admin/stats"):
+        assert client.get(path).status_code == 200
+        latency, queries = time_call(lambda: client.get(path), repeat)
+        print(f"{path:<17}{latency * 1000:8.1f} ms  {queries:5.1f} queries")
+
+    ok = True
+    for label, window in (("legacy week", 6), ("legacy 30 days", 30)):
+        since = datetime.now(TZ).date() - timedelta(days=window)
+        since_utc = datetime.combine(since, datetime.min.time(), tzinfo=TZ).astimezone(timezone.utc)
+        with app.app_context():
+            latency, queries = time_call(lambda: legacy_student_stats(user_id, since_utc), max(1, repeat // 4))
+            legacy = legacy_student_stats(user_id, since_utc)
+            from app import analytics_service
+            top = analytics_service.top_students(user_id, since, OVERDUE_SECONDS, order="count", limit=STUDENTS)
+        print(f"{label:<17}{latency * 1000:8.1f} ms  {queries:5.1f} queries (Python aggregation)")
+        pushed = {row["student_id"]: {"count": row["count"], "overdue": row["overdue"]} for row in top}
+        ok = ok and pushed == legacy
+
+    print("per-student totals match:", "OK" if ok else "MISMATCH")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
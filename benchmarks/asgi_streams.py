@@ -0,0 +1,181 @@
+"""
+Benchmark: memory per idle display connection, ASGI vs. WSGI streaming
+
+Opens many /api/stream connections for one tenant in a fresh process and
+reports resident memory per connection, then handles one kiosk scan and
+measures how long until every connection has the new frame. Modes:
+
+    asgi     asgi.application on one event loop (StreamHub fan-out)
+    threads  the Flask SSE route, one thread per connection (sync workers)
+    gevent   the Flask SSE route, one greenlet per connection, as in the
+             README's `gunicorn -k gevent` setup (skipped if gevent is missing)
+
+Connections are driven in-process without sockets, so the numbers are the
+application's cost per connection; the server's own socket and protocol
+objects come on top in every mode.
+
+Usage:
+    python benchmarks/asgi_streams.py [asgi_connections] [thread_connections]
+
+Defaults to 10000 ASGI/gevent connections and 1000 threads. Uses a throwaway
+SQLite database unless DATABASE_URL is set.
+"""
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+if len(sys.argv) > 1 and sys.argv[1] == "--mode" and sys.argv[2] == "gevent":
+    from gevent import monkey  # Must patch before anything imports threading
+    monkey.patch_all()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+TOKEN = "asgi-token"
+SCAN = {"token": TOKEN, "code": "50001"}
+
+
+def rss() -> int:
+    gc.collect()
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def setup_tenant():
+    import io
+    from app import app, db, User
+    with app.app_context():
+        user = User(google_id="asgi", email="asgi@halllday.local", name="ASGI", kiosk_token=TOKEN)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+    roster = "student_id,name\n" + "\n".join(f"{50000 + i},Student {i}" for i in range(20))
+    client.post("/api/roster/upload", data={"file": (io.BytesIO(roster.encode()), "roster.csv")},
+                content_type="multipart/form-data")
+
+
+def run_asgi(n):
+    import asyncio
+    from asgi import application
+    from app import app
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        before = rss()
+        frames = [0] * n
+        counts = {1: asyncio.Event(), 2: asyncio.Event()}
+        reached = {1: 0, 2: 0}
+        gone = asyncio.Event()
+
+        def connection(i):
+            async def receive():
+                await gone.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                if message.get("body", b"").startswith(b"data:"):
+                    frames[i] += 1
+                    if frames[i] in reached:
+                        reached[frames[i]] += 1
+                        if reached[frames[i]] == n:
+                            counts[frames[i]].set()
+            scope = {"type": "http", "method": "GET", "path": "/api/stream",
+                     "query_string": f"token={TOKEN}".encode(), "headers": [], "http_version": "1.1"}
+            return application(scope, receive, send)
+
+        tasks = [loop.create_task(connection(i)) for i in range(n)]
+        await counts[1].wait()
+        after = rss()
+        start = time.perf_counter()
+        await loop.run_in_executor(None, lambda: app.test_client().post("/api/scan", json=SCAN))
+        await counts[2].wait()
+        fan_out = time.perf_counter() - start
+        gone.set()
+        await asyncio.gather(*tasks)
+        return before, after, fan_out
+
+    return asyncio.run(main())
+
+
+def run_blocking(n, spawn):
+    """Flask SSE route with one thread (or greenlet) per connection"""
+    import threading
+    from app import app
+
+    before = rss()
+    lock = threading.Lock()
+    reached = {1: 0, 2: 0}
+    events = {1: threading.Event(), 2: threading.Event()}
+
+    def connection():
+        resp = app.test_client().get(f"/api/stream?token={TOKEN}", buffered=False)
+        seen = 0
+        for chunk in resp.response:
+            if chunk.startswith("data:" if isinstance(chunk, str) else b"data:"):
+                seen += 1
+                if seen in reached:
+                    with lock:
+                        reached[seen] += 1
+                        if reached[seen] == n:
+                            events[seen].set()
+
+    for _ in range(n):
+        spawn(connection)
+    events[1].wait()
+    after = rss()
+    start = time.perf_counter()
+    app.test_client().post("/api/scan", json=SCAN)
+    events[2].wait()
+    return before, after, time.perf_counter() - start
+
+
+def child(mode, n):
+    if mode == "asgi":
+        before, after, fan_out = run_asgi(n)
+    elif mode == "threads":
+        import threading
+        before, after, fan_out = run_blocking(n, lambda f: threading.Thread(target=f, daemon=True).start())
+    else:
+        import gevent
+        before, after, fan_out = run_blocking(n, gevent.spawn)
+    print(json.dumps({"per_conn": (after - before) / n, "total": after - before, "fan_out": fan_out}))
+    sys.stdout.flush()
+    os._exit(0)  # Connections never end on their own
+
+
+def main():
+    asgi_n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    thread_n = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    setup_tenant()
+
+    runs = [("asgi", asgi_n), ("threads", thread_n), ("gevent", asgi_n)]
+    for mode, n in runs:
+        if mode == "gevent":
+            try:
+                import gevent  # noqa: F401
+            except ImportError:
+                print(f"{mode:<8} skipped (gevent not installed)")
+                continue
+        out = subprocess.run([sys.executable, __file__, "--mode", mode, str(n)], env=os.environ,
+                             capture_output=True, text=True, timeout=600)
+        lines = [line for line in out.stdout.splitlines() if line.startswith("{")]
+        if not lines:
+            print(f"{mode:<8} failed:\n{out.stderr[-2000:]}")
+            continue
+        result = json.loads(lines[-1])
+        print(f"{mode:<8} {n:>6} connections: {result['per_conn'] / 1024:6.1f} KiB/connection "
+              f"({result['total'] / 1024 / 1024:.1f} MiB), one scan reached all in {result['fan_out'] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--mode":
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
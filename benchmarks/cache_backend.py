@@ -0,0 +1,124 @@
+"""
+Benchmark: roster cache consistency across worker processes
+
+Forks several worker processes that keep looking up a student, like kiosks
+scanning against different gunicorn workers. The parent then (1) adds that
+student through a single-row roster write and (2) renames them through a
+bulk roster sync. For each cache backend it reports how long every worker
+kept serving the old answer and how many workers reloaded from the database
+versus the copy shared by the writer.
+
+Usage:
+    python benchmarks/cache_backend.py [workers] [students]
+
+Defaults to 4 workers and a 2000-student roster. Workers give up after 3
+seconds; with the local backend they only catch up once the cache TTL
+(60 s) runs out. Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from app import app, db, User, StudentName, cipher_suite
+from services.cache_backend import create_cache_backend
+from services.roster import RosterService
+
+TARGET = "999999"
+TIMEOUT = 3.0
+
+
+def make_service(spec):
+    return RosterService(db, cipher_suite, StudentName, cache_backend=create_cache_backend(spec))
+
+
+def worker(spec, user_id, expected, ready, results):
+    """Look the target up until it reads `expected` for each phase"""
+    with app.app_context():
+        db.engine.dispose(close=False)  # Don't share the parent's connections
+        service = make_service(spec)
+        for phase, want in enumerate(expected):
+            service.get_student_name(user_id, "100000")  # Warm
+            ready.put(phase)
+            deadline = time.time() + TIMEOUT
+            seen = None
+            while time.time() < deadline:
+                if service.get_student_name(user_id, TARGET, fallback=None) == want:
+                    seen = time.time()
+                    break
+                db.session.rollback()  # Fresh snapshot for the next database load
+                time.sleep(0.001)
+            results.put((phase, seen, service.cache.misses, service.shared_loads))
+
+
+def run(spec, workers, user_id, students):
+    ctx = multiprocessing.get_context("fork")
+    ready, results = ctx.Queue(), ctx.Queue()
+    expected = ("New Student", "Renamed Student")
+    procs = [ctx.Process(target=worker, args=(spec, user_id, expected, ready, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+
+    with app.app_context():
+        writer = make_service(spec)
+        writer.get_student_name(user_id, "100000")
+
+        # Phase 0: one student added the way /api/roster/add does it
+        for _ in procs:
+            ready.get()
+        name_hash = writer._hash_student_id(TARGET, user_id)
+        db.session.add(StudentName(name_hash=name_hash, display_name=expected[0], user_id=user_id,
+                                   encrypted_id=cipher_suite.encrypt(TARGET.encode()).decode()))
+        db.session.commit()
+        writer.cache_student(user_id, name_hash, expected[0])
+        written = [time.time()]
+        phase0 = [results.get() for _ in procs]
+
+        # Phase 1: nightly roster sync that renames the student
+        for _ in procs:
+            ready.get()
+        roster = [(str(100000 + i), f"Student {i}") for i in range(students)] + [(TARGET, expected[1])]
+        writer.sync(user_id, roster)
+        written.append(time.time())
+        phase1 = [results.get() for _ in procs]
+
+    for p in procs:
+        p.join()
+
+    for label, phase, rows in (("single add", 0, phase0), ("bulk sync", 1, phase1)):
+        lags = [seen - written[phase] for _, seen, _, _ in rows if seen is not None]
+        stale = sum(1 for _, seen, _, _ in rows if seen is None)
+        shared = sum(r[3] for r in rows)
+        worst = f"{max(lags) * 1000:7.1f} ms" if lags else f"{'-':>10}"
+        print(f"{spec:<28} {label:<11} worst lag {worst}  still stale after {TIMEOUT:.0f}s: {stale}/{len(rows)}"
+              f"  shared loads so far: {shared}")
+    return phase0, phase1
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    students = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    ok = True
+    for index, spec in enumerate(("local", f"file:{tempfile.mkdtemp()}")):
+        with app.app_context():
+            user = User(google_id=f"cb{index}", email=f"cb{index}@halllday.local", name="CB",
+                        kiosk_token=f"cb-token-{index}")
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+            make_service("local").ingest(user_id, ((str(100000 + i), f"Student {i}") for i in range(students)))
+        phase0, phase1 = run(spec, workers, user_id, students)
+        if spec != "local":
+            ok = all(seen is not None for _, seen, _, _ in phase0 + phase1)
+
+    print("shared backend kept every worker consistent:", "OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark: scan-to-display latency across worker processes
+
+Forks several worker processes (like gunicorn --preload), each holding an SSE
+subscription for the same tenant, as displays connected to different workers
+would. The parent process then handles kiosk scans through /api/scan and
+measures how long each scan takes to show up as a new frame in every other
+worker, once per change bus backend. Without a cross-process bus the other
+workers only notice at their periodic resync.
+
+After the scans the parent changes overdue_minutes through /api/settings/update,
+and every worker reads /api/status once the change reaches it, checking that
+its cached settings were dropped too (not served until the settings TTL).
+
+Usage:
+    python benchmarks/change_bus.py [workers] [scans]
+
+Defaults to 4 workers and 50 scans (3 for the local backend, which just times
+out). Set CHANGE_BUS_POSTGRES=1 with a PostgreSQL DATABASE_URL to include the
+LISTEN/NOTIFY backend. Uses a throwaway SQLite database unless DATABASE_URL
+is set.
+"""
+import io
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+import app as app_module
+from app import app, db, User
+from services.change_bus import create_change_bus
+
+TOKEN = "bus-token"
+STUDENT = "50000"
+TIMEOUT = 2.0
+
+
+def setup_tenant():
+    with app.app_context():
+        user = User(google_id="bus", email="bus@halllday.local", name="Bus", kiosk_token=TOKEN)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+    roster = "student_id,name\n" + "\n".join(f"{50000 + i},Student {i}" for i in range(20))
+    client.post("/api/roster/upload", data={"file": (io.BytesIO(roster.encode()), "roster.csv")},
+                content_type="multipart/form-data")
+    return user_id
+
+
+def worker(user_id, scans, check_settings, ready, results):
+    """A worker with one connected display: report when each scan's frame arrives"""
+    with app.app_context():
+        db.engine.dispose(close=False)  # Never share pooled connections with the parent
+    app_module.change_bus.start()
+    sub = app_module.status_broadcaster.subscribe(user_id)
+    sub.get(TIMEOUT)  # Initial snapshot
+    ready.put(os.getpid())
+    for i in range(scans):
+        frame = sub.get(TIMEOUT)
+        results.put((i, time.time() if frame else None))
+    if check_settings:
+        sub.get(TIMEOUT)  # The settings change
+        status = app.test_client().get(f"/api/status?token={TOKEN}").get_json()
+        results.put(("settings", status.get("overdue_minutes")))
+    app_module.status_broadcaster.unsubscribe(sub)
+
+
+def run(spec, workers, scans, user_id, overdue_minutes=None):
+    with app.app_context():
+        bus = create_change_bus(spec, db.engine)
+    bus.subscribe(app_module._apply_remote_change)
+    app_module.change_bus = bus
+
+    ctx = multiprocessing.get_context("fork")
+    ready, results = ctx.Queue(), ctx.Queue()
+    check_settings = overdue_minutes is not None
+    procs = [ctx.Process(target=worker, args=(user_id, scans, check_settings, ready, results))
+             for _ in range(workers)]
+    for p in procs:
+        p.start()
+    for _ in procs:
+        ready.get()
+
+    client = app.test_client()
+    lags, missed, scan_times = [], 0, []
+    for i in range(scans):
+        start = time.time()
+        client.post("/api/scan", json={"token": TOKEN, "code": STUDENT})
+        scan_times.append(time.time() - start)
+        for _ in procs:
+            index, seen = results.get()
+            if seen is None:
+                missed += 1
+            else:
+                lags.append(seen - start)
+    stale = 0
+    if check_settings:
+        with client.session_transaction() as sess:
+            sess["user_id"] = user_id
+        client.post("/api/settings/update", json={"overdue_minutes": overdue_minutes})
+        stale = sum(results.get()[1] != overdue_minutes for _ in procs)
+    for p in procs:
+        p.join()
+
+    if lags:
+        lags.sort()
+        p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+        timing = f"median {statistics.median(lags) * 1000:6.1f} ms  p99 {p99 * 1000:6.1f} ms"
+    else:
+        timing = f"{'no frames':>30}"
+    settings = f"  stale settings {stale}/{workers}" if check_settings else ""
+    print(f"{spec:<32} scan->frame {timing}  missed {missed}/{scans * workers}{settings}"
+          f"  (scan request median {statistics.median(scan_times) * 1000:.1f} ms)")
+    return missed + stale
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    scans = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    user_id = setup_tenant()
+
+    specs = [("local", 3), (f"unix:{tempfile.mkdtemp()}", scans)]
+    if os.getenv("CHANGE_BUS_POSTGRES"):
+        specs.append(("postgres", scans))
+    ok = True
+    for i, (spec, count) in enumerate(specs):
+        if spec == "local":
+            run(spec, workers, count, user_id)
+        else:
+            ok = run(spec, workers, count, user_id, overdue_minutes=20 + i) == 0 and ok
+    print(f"every worker saw every scan and settings change within {TIMEOUT:.0f}s:", "OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: streaming CSV export memory and throughput vs. history size
+
+Generates a tenant's session history, then downloads the full pass-log export
+(plain and gzip) through the test client without buffering, at increasing
+history sizes. Reports rows/s, bytes sent and peak Python heap during the
+export; the peak should stay flat as the row count grows.
+
+Usage:
+    python benchmarks/csv_export.py [sizes...]
+
+Defaults to 10000 50000 200000 sessions. Uses a throwaway SQLite database
+unless DATABASE_URL is set.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from app import app, db, User, Session, Student
+
+STUDENTS = 300
+
+
+def setup_tenant():
+    with app.app_context():
+        user = User(google_id="export", email="export@halllday.local", name="Export", kiosk_token="export-token")
+        db.session.add(user)
+        db.session.commit()
+        db.session.bulk_insert_mappings(Student, [
+            dict(id=str(80000 + i), name=f"Anonymous_{80000 + i}", user_id=user.id) for i in range(STUDENTS)
+        ])
+        db.session.commit()
+        return user.id
+
+
+def add_sessions(user_id, count, rng):
+    """Append `count` ended sessions spread over the last five years"""
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        for offset in range(0, count, 10000):
+            rows = []
+            for _ in range(min(10000, count - offset)):
+                start = now - timedelta(seconds=rng.randrange(5 * 365 * 86400))
+                rows.append(dict(student_id=str(80000 + rng.randrange(STUDENTS)), start_ts=start,
+                                 end_ts=start + timedelta(seconds=rng.randrange(60, 1500)),
+                                 ended_by="kiosk_scan", room="Room 1", user_id=user_id))
+            db.session.bulk_insert_mappings(Session, rows)
+            db.session.commit()
+
+
+def export(client, encoding):
+    """Stream the export chunk by chunk; return (bytes, seconds, peak heap bytes)"""
+    headers = {"Accept-Encoding": "gzip"} if encoding == "gzip" else {}
+    tracemalloc.start()
+    start = time.perf_counter()
+    resp = client.get("/api/admin/logs/export", headers=headers, buffered=False)
+    size = 0
+    for chunk in resp.response:
+        size += len(chunk)
+    resp.close()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10000, 50000, 200000]
+    rng = random.Random(7)
+    user_id = setup_tenant()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+
+    total = 0
+    with app.app_context():
+        print(f"database: {db.engine.dialect.name}")
+    print(f"{'sessions':>9} {'encoding':>8} {'rows/s':>9} {'bytes':>12} {'peak heap':>10}")
+    for target in sorted(sizes):
+        add_sessions(user_id, target - total, rng)
+        total = target
+        for encoding in ("identity", "gzip"):
+            size, elapsed, peak = export(client, encoding)
+            print(f"{total:>9} {encoding:>8} {total / elapsed:>9.0f} {size:>12} {peak / 1024 / 1024:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Load test: kiosk scan latency under a gevent worker with many open SSE streams
+
+Runs the Flask app monkey-patched, like one `gunicorn -k gevent` worker, with
+kiosk greenlets scanning as fast as they can, in three phases:
+
+    idle     no streams open
+    streams  500 /api/stream displays open, each receiving every frame
+    slow     500 streams plus a greenlet running a 200 ms query in a loop
+             (pg_sleep, Postgres only) standing in for a slow status query
+
+Each phase reports scans/s and p50/p99/max latency. With cooperative psycopg2
+(HALLPASS_GEVENT=auto) the slow query only parks its own greenlet; on Postgres
+the whole run is repeated with HALLPASS_GEVENT=off, where every scan waits
+behind it.
+
+Usage:
+    python benchmarks/gevent_streams.py [streams] [kiosks] [seconds]
+
+Defaults to 500 streams, 20 kiosks, 5 seconds per phase. Uses a throwaway
+SQLite database unless DATABASE_URL is set (the slow phase and the
+HALLPASS_GEVENT=off comparison need Postgres).
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+CHILD = len(sys.argv) > 1 and sys.argv[1] == "--child"
+if CHILD:
+    from gevent import monkey  # Must patch before anything imports threading or sockets
+    monkey.patch_all()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+TOKEN = "gevent-token"
+CAPACITY = 3
+ROSTER_SIZE = 200
+SLOW_QUERY_SECONDS = 0.2
+
+
+def setup_tenant():
+    import io
+    from app import app, db, User, Settings
+    with app.app_context():
+        user = User(google_id="gevent", email="gevent@halllday.local", name="Gevent", kiosk_token=TOKEN)
+        db.session.add(user)
+        db.session.flush()
+        # Created up front so no background get_settings() races in a default row
+        db.session.add(Settings(user_id=user.id, room_name="Hall Pass", capacity=CAPACITY, overdue_minutes=10,
+                                kiosk_suspended=False, auto_ban_overdue=False, enable_queue=True,
+                                auto_promote_queue=True))
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+    roster = "student_id,name\n" + "\n".join(f"{50000 + i},Student {i}" for i in range(ROSTER_SIZE))
+    client.post("/api/roster/upload", data={"file": (io.BytesIO(roster.encode()), "roster.csv")},
+                content_type="multipart/form-data")
+
+
+def scan_phase(app, kiosks, seconds):
+    """`kiosks` greenlets scanning until the deadline; returns sorted latencies"""
+    import random
+    import time
+    import gevent
+
+    deadline = time.time() + seconds
+    latencies = []
+
+    def kiosk():
+        client = app.test_client()
+        rng = random.Random()
+        while time.time() < deadline:
+            code = str(50000 + rng.randrange(ROSTER_SIZE))
+            start = time.perf_counter()
+            client.post("/api/scan", json={"token": TOKEN, "code": code})
+            latencies.append(time.perf_counter() - start)
+            # A real request yields on its socket; the test client never does
+            gevent.sleep(0)
+
+    gevent.joinall([gevent.spawn(kiosk) for _ in range(kiosks)])
+    return sorted(latencies)
+
+
+def child(streams, kiosks, seconds):
+    import gevent
+    from sqlalchemy import text
+    from app import app, db, db_cooperative
+    from services.gevent_mode import gevent_stats
+
+    with app.app_context():
+        db.engine.dispose()
+        dialect = db.engine.dialect.name
+    frames = [0]
+
+    def display():
+        resp = app.test_client().get(f"/api/stream?token={TOKEN}", buffered=False)
+        for chunk in resp.response:
+            if chunk.startswith("data:" if isinstance(chunk, str) else b"data:"):
+                frames[0] += 1
+
+    def slow_queries(stop):
+        with app.app_context():
+            while not stop.is_set():
+                db.session.execute(text("SELECT pg_sleep(:s)"), {"s": SLOW_QUERY_SECONDS})
+                db.session.rollback()
+
+    results = {"dialect": dialect, "cooperative": db_cooperative, "phases": {}}
+
+    def record(name, latencies, elapsed):
+        n = len(latencies)
+        results["phases"][name] = {
+            "scans": n,
+            "rate": n / elapsed,
+            "p50": latencies[n // 2] * 1000 if n else 0.0,
+            "p99": latencies[int(n * 0.99)] * 1000 if n else 0.0,
+            "max": latencies[-1] * 1000 if n else 0.0,
+        }
+
+    record("idle", scan_phase(app, kiosks, seconds), seconds)
+
+    displays = [gevent.spawn(display) for _ in range(streams)]
+    while frames[0] < streams:
+        gevent.sleep(0.05)
+    record("streams", scan_phase(app, kiosks, seconds), seconds)
+
+    if dialect == "postgresql":
+        from gevent.event import Event
+        stop = Event()
+        slow = gevent.spawn(slow_queries, stop)
+        gevent.sleep(0.05)
+        record("slow", scan_phase(app, kiosks, seconds), seconds)
+        stop.set()
+        slow.join()
+
+    with app.app_context():
+        results["database"] = gevent_stats(db.engine)
+    gevent.killall(displays, block=False)
+    print(json.dumps(results))
+    sys.stdout.flush()
+    os._exit(0)  # Streams never end on their own
+
+
+def main():
+    streams = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    kiosks = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5.0
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        print("gevent is not installed (pip install gevent)")
+        sys.exit(1)
+    setup_tenant()
+    from app import app, db
+    with app.app_context():
+        postgres = db.engine.dialect.name == "postgresql"
+
+    modes = ["auto", "off"] if postgres else ["auto"]
+    for mode in modes:
+        env = dict(os.environ, HALLPASS_GEVENT=mode)
+        out = subprocess.run([sys.executable, __file__, "--child", str(streams), str(kiosks), str(seconds)],
+                             env=env, capture_output=True, text=True, timeout=600)
+        lines = [line for line in out.stdout.splitlines() if line.startswith("{")]
+        if not lines:
+            print(f"HALLPASS_GEVENT={mode} failed:\n{out.stderr[-2000:]}")
+            continue
+        result = json.loads(lines[-1])
+        print(f"HALLPASS_GEVENT={mode} ({result['dialect']}, cooperative={result['cooperative']}, "
+              f"{kiosks} kiosks, driver {result['database']['driver']})")
+        for name, phase in result["phases"].items():
+            label = {"idle": "no streams", "streams": f"{streams} streams",
+                     "slow": f"{streams} streams + slow query"}[name]
+            print(f"  {label:<28} {phase['rate']:7.1f} scans/s  p50 {phase['p50']:6.1f} ms  "
+                  f"p99 {phase['p99']:6.1f} ms  max {phase['max']:7.1f} ms")
+    if not postgres:
+        print("  (slow-query phase and HALLPASS_GEVENT=off comparison need DATABASE_URL=postgresql://...)")
+
+
+if __name__ == "__main__":
+    if CHILD:
+        child(int(sys.argv[2]), int(sys.argv[3]), float(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,127 @@
+"""
+Benchmark: roster cache memory and hit rate on a shared instance
+
+Part 1 compares the memory of one tenant's roster held as plain dicts
+({name_hash: name} plus a banned set) with the compact TenantRoster.
+Part 2 creates many teachers' rosters in the database, then replays scans
+with a skewed tenant popularity through RosterService with a cache budget
+smaller than the total, reporting hit rate, evictions, cache size and
+lookup latency, and checks every lookup returned the right name.
+
+Usage:
+    python benchmarks/roster_cache.py [tenants] [students] [budget] [scans]
+
+Defaults to 300 tenants x 400 students, a 40000-student budget and 50000
+scans. Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from app import app, db, User, StudentName, cipher_suite
+from services.roster import RosterService
+from services.roster_cache import TenantRoster
+
+
+def student_name(user_id, i):
+    return f"Student {user_id}-{i:04d}"
+
+
+def rows_for(user_id, students):
+    for i in range(students):
+        name_hash = hashlib.sha256(f"student_{user_id}_{100000 + i}".encode()).hexdigest()[:16]
+        yield name_hash, student_name(user_id, i), i % 50 == 0
+
+
+def measure(build):
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+
+def memory_comparison(students):
+    rows = list(rows_for(1, students))
+    # Hashes and names come from the database as fresh strings either way
+    def fresh():
+        return (("".join(h), "".join(n), b) for h, n, b in rows)
+
+    def as_dicts():
+        names, banned = {}, set()
+        for h, n, b in fresh():
+            names[h] = n
+            if b:
+                banned.add(h)
+        return names, banned
+
+    # Several copies so allocator free lists do not skew a single small roster
+    copies = 20
+    _, as_dict = measure(lambda: [as_dicts() for _ in range(copies)])
+    _, compact = measure(lambda: [TenantRoster(fresh()) for _ in range(copies)])
+    print(f"roster of {students}: dicts {as_dict / students / copies:.0f} B/student, "
+          f"TenantRoster {compact / students / copies:.0f} B/student")
+
+
+def setup(tenants, students):
+    with app.app_context():
+        users = [User(google_id=f"rc{i}", email=f"rc{i}@halllday.local", name=f"T{i}", kiosk_token=f"rc-{i}")
+                 for i in range(tenants)]
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [u.id for u in users]
+        encrypted = cipher_suite.encrypt(b"hidden").decode()  # Not read by the cache
+        for user_id in user_ids:
+            db.session.bulk_insert_mappings(StudentName, [
+                dict(name_hash=h, display_name=n, banned=b, encrypted_id=encrypted, user_id=user_id)
+                for h, n, b in rows_for(user_id, students)
+            ])
+        db.session.commit()
+    return user_ids
+
+
+def main():
+    tenants = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    students = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    budget = int(sys.argv[3]) if len(sys.argv) > 3 else 40000
+    scans = int(sys.argv[4]) if len(sys.argv) > 4 else 50000
+
+    memory_comparison(students)
+
+    start = time.perf_counter()
+    user_ids = setup(tenants, students)
+    print(f"generated: {tenants} tenants x {students} students in {time.perf_counter() - start:.1f}s, "
+          f"cache budget {budget} students")
+
+    rng = random.Random(3)
+    ok = True
+    with app.app_context():
+        service = RosterService(db, cipher_suite, StudentName, cache_max_students=budget, cache_max_bytes=0)
+        start = time.perf_counter()
+        for _ in range(scans):
+            # Pareto-skewed tenant popularity: a few busy classrooms, a long tail
+            user_id = user_ids[min(int(rng.paretovariate(1.2)) - 1, tenants - 1)]
+            i = rng.randrange(students)
+            if service.get_student_name(user_id, str(100000 + i)) != student_name(user_id, i):
+                ok = False
+        elapsed = time.perf_counter() - start
+
+    stats = service.cache.stats()
+    print(f"scans: {scans} in {elapsed:.2f}s ({elapsed / scans * 1e6:.1f} us/lookup)")
+    print(f"cache: {stats['tenants']} tenants, {stats['students']} students, "
+          f"{stats['bytes'] / 1024 / 1024:.1f} MB est., hit rate {stats['hit_rate']:.3f}, "
+          f"{stats['evictions']} evictions")
+    ok = ok and stats["students"] <= budget
+    print("names correct and within budget:", "OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
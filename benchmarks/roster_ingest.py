@@ -0,0 +1,121 @@
+"""
+Benchmark: importing a district-sized roster CSV
+
+Uploads a generated roster through /api/roster/upload (replace), re-uploads
+it unchanged and with 1% of names edited (sync), then through
+/api/upload_session_roster (upsert over existing rows), reporting wall time,
+database time and rows/s for each. For comparison it also
+times the old approach of one ORM object (or one lookup query) per row, and
+checks that every student can be resolved by ID afterwards.
+
+Usage:
+    python benchmarks/roster_ingest.py [students]
+
+Defaults to 5000 students. Uses a throwaway SQLite database unless
+DATABASE_URL is set.
+"""
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from app import app, db, User, StudentName, cipher_suite, roster_service
+
+
+def make_csv(students, header=True, edited=0):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(["student_id", "name"])
+    for i in range(students):
+        writer.writerow([str(100000 + i), f"Student {i:05d}" + (" (edited)" if i < edited else "")])
+    return buf.getvalue().encode("utf-8")
+
+
+def upload(client, path, data):
+    start = time.perf_counter()
+    resp = client.post(path, data={"file": (io.BytesIO(data), "roster.csv")},
+                       content_type="multipart/form-data")
+    elapsed = time.perf_counter() - start
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json(), elapsed
+
+
+def legacy_replace(user_id, students):
+    """The pre-pipeline upload: one ORM object and one Fernet call per row"""
+    start = time.perf_counter()
+    StudentName.query.filter_by(user_id=user_id).delete()
+    for i in range(students):
+        sid = str(100000 + i)
+        db.session.add(StudentName(display_name=f"Student {i:05d}",
+                                   name_hash=roster_service._hash_student_id(sid, user_id),
+                                   encrypted_id=cipher_suite.encrypt(sid.encode()).decode(),
+                                   user_id=user_id, banned=False))
+    db.session.commit()
+    return time.perf_counter() - start
+
+
+def legacy_upsert(user_id, students):
+    """The pre-pipeline batch store: one lookup query per row before upserting"""
+    start = time.perf_counter()
+    for i in range(students):
+        sid = str(100000 + i)
+        name_hash = roster_service._hash_student_id(sid, user_id)
+        existing = StudentName.query.filter_by(name_hash=name_hash).first()
+        existing.display_name = f"Student {i:05d}"
+        existing.encrypted_id = cipher_suite.encrypt(sid.encode()).decode()
+    db.session.commit()
+    return time.perf_counter() - start
+
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    steps = (
+        ("replace (/api/roster/upload)", "/api/roster/upload?mode=replace", make_csv(students)),
+        ("sync, unchanged", "/api/roster/upload", make_csv(students)),
+        ("sync, 1% renamed", "/api/roster/upload", make_csv(students, edited=students // 100)),
+        # The session roster endpoint takes bare id,name rows
+        ("upsert (upload_session_roster)", "/api/upload_session_roster", make_csv(students, header=False)),
+    )
+
+    with app.app_context():
+        user = User(google_id="roster", email="roster@halllday.local", name="Roster", kiosk_token="roster-token")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        print(f"database: {db.engine.dialect.name}, {students} students, "
+              f"{roster_service.ingest_workers} encryption worker(s)")
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+
+    print(f"{'path':<30} {'wall':>8} {'db':>8} {'rows/s':>9}")
+    for label, path, data in steps:
+        body, elapsed = upload(client, path, data)
+        db_seconds = body.get("db_seconds")
+        db_text = f"{db_seconds * 1000:6.0f}ms" if db_seconds is not None else f"{'-':>8}"
+        print(f"{label:<30} {elapsed * 1000:6.0f}ms {db_text} {students / elapsed:>9.0f}")
+
+    with app.app_context():
+        stored = StudentName.query.filter_by(user_id=user_id).count()
+        roster_service.invalidate_roster(user_id)
+        sample = [str(100000 + i) for i in range(0, students, max(1, students // 50))]
+        resolved = all(roster_service.get_student_name(user_id, sid, fallback=None) for sid in sample)
+
+        for label, fn in (("legacy replace", legacy_replace), ("legacy upsert", legacy_upsert)):
+            elapsed = fn(user_id, students)
+            print(f"{label:<30} {elapsed * 1000:6.0f}ms {'-':>8} {students / elapsed:>9.0f}")
+
+    ok = stored == students and resolved
+    print("roster stored and resolvable:", "OK" if ok else f"MISMATCH ({stored} rows)")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
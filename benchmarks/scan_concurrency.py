@@ -0,0 +1,171 @@
+"""
+Stress test: concurrent kiosk scans against one tenant
+
+Forks several worker processes (like gunicorn --preload) and runs simulated
+kiosks as threads in each, all scanning random students from the same roster
+as fast as they can. Afterwards the session history is replayed to check the
+capacity invariant: no moment may have more open sessions than the capacity
+setting allows, even though the kiosks are spread across processes with their
+own in-memory ClassroomState. The run also fails if it never filled every slot
+or never queued anyone, since then the waitlist and auto-promote paths went
+untested.
+
+Usage:
+    python benchmarks/scan_concurrency.py [kiosks] [processes] [seconds]
+
+Defaults to 50 kiosks over 4 processes for 10 seconds. Uses a throwaway SQLite
+database unless DATABASE_URL is set. Exits non-zero if the invariant is broken
+or was not exercised.
+"""
+import io
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from app import app, db, User, Session, Queue
+
+TOKEN = "stress-token"
+CAPACITY = 3
+ROSTER_SIZE = 200
+
+
+def setup_tenant():
+    """Create a user with a roster, a small capacity and auto-promoting waitlist"""
+    with app.app_context():
+        user = User(google_id="stress", email="stress@halllday.local", name="Stress", kiosk_token=TOKEN)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+    roster = "student_id,name\n" + "\n".join(f"{50000 + i},Student {i}" for i in range(ROSTER_SIZE))
+    resp = client.post("/api/roster/upload", data={"file": (io.BytesIO(roster.encode()), "roster.csv")},
+                       content_type="multipart/form-data")
+    assert resp.status_code == 200, f"roster upload failed: {resp.status_code} {resp.get_data(as_text=True)}"
+    resp = client.post("/api/settings/update", json={
+        "capacity": CAPACITY, "enable_queue": True, "auto_promote_queue": True,
+    })
+    assert resp.status_code == 200, f"settings update failed: {resp.status_code} {resp.get_data(as_text=True)}"
+
+    # Read back what the scans will see: a silently dropped update would stress capacity 1 with no queue
+    settings = client.get("/api/settings").get_json()
+    expected = {"capacity": CAPACITY, "enable_queue": True, "auto_promote_queue": True}
+    actual = {key: settings.get(key) for key in expected}
+    assert actual == expected, f"settings not applied: {actual} != {expected}"
+    return user_id
+
+
+def worker(kiosks, seconds, results):
+    """One worker process: `kiosks` threads scanning until the deadline"""
+    with app.app_context():
+        db.engine.dispose()  # Never share pooled connections with the parent
+    actions = Counter()
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.time() + seconds
+
+    def kiosk():
+        client = app.test_client()
+        rng = random.Random()
+        local_actions = Counter()
+        local_latencies = []
+        while time.time() < deadline:
+            code = str(50000 + rng.randrange(ROSTER_SIZE))
+            start = time.perf_counter()
+            resp = client.post("/api/scan", json={"token": TOKEN, "code": code})
+            local_latencies.append(time.perf_counter() - start)
+            body = resp.get_json(silent=True) or {}
+            local_actions[body.get("action") or f"http_{resp.status_code}"] += 1
+        with lock:
+            actions.update(local_actions)
+            latencies.extend(local_latencies)
+
+    threads = [threading.Thread(target=kiosk) for _ in range(kiosks)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.put((dict(actions), latencies))
+
+
+def max_concurrent_sessions(user_id):
+    """Replay session start/end times and return the peak number open at once"""
+    with app.app_context():
+        rows = db.session.query(Session.start_ts, Session.end_ts).filter_by(user_id=user_id).all()
+    events = []
+    for start_ts, end_ts in rows:
+        events.append((start_ts.replace(tzinfo=timezone.utc) if start_ts.tzinfo is None else start_ts, 1))
+        if end_ts is not None:
+            events.append((end_ts.replace(tzinfo=timezone.utc) if end_ts.tzinfo is None else end_ts, -1))
+    # At equal timestamps apply ends before starts
+    events.sort(key=lambda e: (e[0], e[1]))
+    peak = current = 0
+    for _, delta in events:
+        current += delta
+        peak = max(peak, current)
+    return peak, len(rows)
+
+
+def main():
+    kiosks = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10.0
+    user_id = setup_tenant()
+
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    per_process = [kiosks // processes + (1 if i < kiosks % processes else 0) for i in range(processes)]
+    procs = [ctx.Process(target=worker, args=(n, seconds, results)) for n in per_process if n]
+
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    actions = Counter()
+    latencies = []
+    for _ in procs:
+        proc_actions, proc_latencies = results.get()
+        actions.update(proc_actions)
+        latencies.extend(proc_latencies)
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    peak, total_sessions = max_concurrent_sessions(user_id)
+    with app.app_context():
+        open_now = Session.query.filter_by(user_id=user_id, end_ts=None).count()
+        queued = [q.student_id for q in Queue.query.filter_by(user_id=user_id).all()]
+        dialect = db.engine.dialect.name
+
+    scans = sum(actions.values())
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0.0
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0
+    print(f"database:        {dialect}")
+    print(f"kiosks:          {kiosks} across {len(procs)} processes, {seconds:.0f}s")
+    print(f"scans:           {scans} ({scans / elapsed:.1f} scans/s, p50 {p50:.1f} ms, p99 {p99:.1f} ms)")
+    print(f"actions:         {dict(sorted(actions.items()))}")
+    print(f"sessions:        {total_sessions} total, {open_now} open, {len(queued)} queued")
+    print(f"peak concurrent: {peak} (capacity {CAPACITY})")
+
+    ok = peak <= CAPACITY and open_now <= CAPACITY and len(queued) == len(set(queued))
+    print("capacity invariant:", "OK" if ok else "VIOLATED")
+    # The run only says something about the invariant if it filled every slot and used the waitlist
+    exercised = peak == CAPACITY and actions.get("queued", 0) > 0
+    if not exercised:
+        print(f"not exercised: peak {peak} of capacity {CAPACITY}, {actions.get('queued', 0)} queued scans")
+    sys.exit(0 if ok and exercised else 1)
+
+
+if __name__ == "__main__":
+    main()
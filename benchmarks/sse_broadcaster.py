@@ -0,0 +1,112 @@
+"""
+Benchmark: SSE status broadcaster query rate vs. subscriber count
+
+Subscribes 1..1000 simulated Display clients to one tenant, scans a student out
+or back in through /api/scan twice a second, and counts the SQL statements
+issued while they are connected (the scans' own included). With the shared
+broadcaster the query rate should stay flat no matter how many clients are
+listening.
+
+Usage:
+    python benchmarks/sse_broadcaster.py [seconds_per_step]
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from sqlalchemy import event
+
+import app as hallpass
+from app import app, db, User, Settings
+
+TOKEN = "bench-token"
+SCANNER = "800000"
+
+
+def setup_tenant():
+    """Create a user with a few students out so every rebuild does real work"""
+    with app.app_context():
+        user = User(google_id="bench", email="bench@halllday.local", name="Bench", kiosk_token=TOKEN)
+        db.session.add(user)
+        db.session.commit()
+        db.session.add(Settings(user_id=user.id, room_name="Hall Pass", capacity=10, overdue_minutes=10,
+                                kiosk_suspended=False, auto_ban_overdue=False, enable_queue=False,
+                                auto_promote_queue=False))
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+    codes = [f"9{i:05d}" for i in range(5)]
+    roster = f"student_id,name\n{SCANNER},Bench Scanner\n" + "".join(f"{c},Bench {c}\n" for c in codes)
+    client.post("/api/roster/upload", data={"file": (io.BytesIO(roster.encode()), "roster.csv")},
+                content_type="multipart/form-data")
+    for code in codes:
+        client.post("/api/scan", json={"token": TOKEN, "code": code})
+    return user_id
+
+
+def run_step(user_id, subscribers, seconds, counter):
+    broadcaster = hallpass.status_broadcaster
+    client = app.test_client()
+    stop = threading.Event()
+    received = [0]
+
+    def drain(sub):
+        while not stop.is_set():
+            if sub.get(timeout=0.2) is not None:
+                received[0] += 1
+
+    subs = [broadcaster.subscribe(user_id) for _ in range(subscribers)]
+    threads = [threading.Thread(target=drain, args=(s,), daemon=True) for s in subs]
+    for t in threads:
+        t.start()
+
+    # Let the pump start, then measure a steady-state window
+    time.sleep(0.5)
+    start_queries = counter[0]
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        # A real change: commits, invalidates the cached state and wakes the pump
+        resp = client.post("/api/scan", json={"token": TOKEN, "code": SCANNER})
+        assert resp.status_code == 200, resp.get_json()
+        time.sleep(0.5)
+    elapsed = time.perf_counter() - start
+    queries = counter[0] - start_queries
+
+    stop.set()
+    for s in subs:
+        broadcaster.unsubscribe(s)
+    for t in threads:
+        t.join()
+    return queries / elapsed, received[0]
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    user_id = setup_tenant()
+
+    counter = [0]
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        counter[0] += 1
+
+    print(f"{'subscribers':>12} {'queries/s':>10} {'frames':>8}")
+    for n in (1, 10, 100, 1000):
+        rate, frames = run_step(user_id, n, seconds, counter)
+        print(f"{n:>12} {rate:>10.1f} {frames:>8}")
+
+
+if __name__ == "__main__":
+    main()
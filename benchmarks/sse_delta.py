@@ -0,0 +1,149 @@
+"""
+Benchmark: bytes and encoding time per status change, full frames vs. JSON-patch deltas
+
+Opens one legacy /api/stream and one /api/stream?delta=1 for a tenant with
+three students out and a waitlist, then plays a school-day pattern of scans:
+the longest-out student returns (the head of the waitlist is auto-promoted)
+and a new student joins the back of the queue. Every patch received is
+applied to the client's copy and checked against the full frame for the same
+change, then the bytes per change and the pump's encoding time per change
+(json.dumps of the payload vs. diff + json.dumps of the patch) are reported.
+A last step reconnects with Last-Event-ID to show the missed patches being
+replayed instead of a new snapshot.
+
+Usage:
+    python benchmarks/sse_delta.py [changes] [queue_length]
+
+Defaults to 200 changes with 8 students waiting. Uses a throwaway SQLite
+database unless DATABASE_URL is set.
+"""
+import io
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from app import app, db, User, Settings
+from services import json_patch
+
+TOKEN = "delta-token"
+CAPACITY = 3
+
+
+def setup_tenant(roster_size):
+    with app.app_context():
+        user = User(google_id="delta", email="delta@halllday.local", name="Delta", kiosk_token=TOKEN)
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Settings(user_id=user.id, room_name="Hall Pass", capacity=CAPACITY, overdue_minutes=10,
+                                kiosk_suspended=False, auto_ban_overdue=False, enable_queue=True,
+                                auto_promote_queue=True))
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+    roster = "student_id,name\n" + "\n".join(f"{50000 + i},Student Number {i}" for i in range(roster_size))
+    client.post("/api/roster/upload", data={"file": (io.BytesIO(roster.encode()), "roster.csv")},
+                content_type="multipart/form-data")
+
+
+def open_stream(url, headers=None):
+    """Read an SSE stream in a thread; yields (event, id, data, raw_bytes) on a queue"""
+    events = queue.Queue()
+
+    def read():
+        resp = app.test_client().get(url, headers=headers or {}, buffered=False)
+        for chunk in resp.response:
+            text = chunk.decode() if isinstance(chunk, bytes) else chunk
+            for block in text.split("\n\n"):
+                fields = dict(line.split(": ", 1) for line in block.split("\n") if ": " in line)
+                if "data" in fields:
+                    events.put((fields.get("event", "message"), fields.get("id"), fields["data"],
+                                len(block.encode()) + 2))
+
+    threading.Thread(target=read, daemon=True).start()
+    return events
+
+
+def main():
+    changes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    queue_length = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    setup_tenant(CAPACITY + queue_length + changes + 1)
+    kiosk = app.test_client()
+    codes = iter(str(50000 + i) for i in range(10 ** 6))
+
+    def scan(code):
+        kiosk.post("/api/scan", json={"token": TOKEN, "code": code})
+
+    out = [next(codes) for _ in range(CAPACITY)]
+    waiting = [next(codes) for _ in range(queue_length)]
+    for code in out + waiting:
+        scan(code)
+
+    full = open_stream(f"/api/stream?token={TOKEN}")
+    delta = open_stream(f"/api/stream?token={TOKEN}&delta=1")
+    _, _, body, snapshot_bytes = full.get(timeout=10)
+    kind, event_id, body, delta_snapshot_bytes = delta.get(timeout=10)
+    assert kind == "snapshot", kind
+    doc = json.loads(body)
+
+    full_bytes = delta_bytes = 0
+    payloads = [doc]
+    mismatches = 0
+    for i in range(changes):
+        if i % 2 == 0:
+            code = out.pop(0)  # Returns; the head of the waitlist goes out
+            out.append(waiting.pop(0))
+        else:
+            code = next(codes)  # Joins the back of the queue
+            waiting.append(code)
+        scan(code)
+        _, _, body, size = full.get(timeout=10)
+        full_bytes += size
+        kind, event_id, patch_body, size = delta.get(timeout=10)
+        delta_bytes += size
+        patch = json.loads(patch_body)
+        doc = json_patch.apply(doc, patch["ops"])
+        expected = json.loads(body)
+        payloads.append(expected)
+        mismatches += doc != expected
+
+    # Encoding work the pump does per change, on the payloads just captured
+    start = time.perf_counter()
+    for payload in payloads[1:]:
+        json.dumps(payload)
+    dumps_time = (time.perf_counter() - start) / changes
+    start = time.perf_counter()
+    for old, new in zip(payloads, payloads[1:]):
+        json.dumps(json_patch.diff(old, new))
+    patch_time = (time.perf_counter() - start) / changes
+
+    # Reconnect after missing three changes: the patches are replayed, no snapshot
+    missed_from = event_id
+    for _ in range(3):
+        code = next(codes)
+        waiting.append(code)
+        scan(code)
+        delta.get(timeout=10)
+    resumed = open_stream(f"/api/stream?token={TOKEN}&delta=1", headers={"Last-Event-ID": missed_from})
+    replay = [resumed.get(timeout=10) for _ in range(3)]
+
+    print(f"tenant:   {CAPACITY} out, {queue_length} waiting, {changes} changes")
+    print(f"snapshot: {snapshot_bytes} bytes (delta stream: {delta_snapshot_bytes} bytes, sent once)")
+    print(f"full:     {full_bytes / changes:7.0f} bytes/change   encode {dumps_time * 1e6:6.1f} us/change")
+    print(f"delta:    {delta_bytes / changes:7.0f} bytes/change   diff+encode {patch_time * 1e6:6.1f} us/change "
+          f"({full_bytes / max(delta_bytes, 1):.1f}x fewer bytes)")
+    print(f"patched client == full frame: {changes - mismatches}/{changes}")
+    print(f"resume after 3 missed changes: {[kind for kind, *_ in replay]}")
+    sys.exit(0 if mismatches == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark: /api/status and SSE encoding work per revision
+
+Polls /api/status for one tenant (3 students out, 8 waiting) from many
+simulated displays while scans change the state every `interval` polls, and
+reports how many payload builds and JSON encodings the broadcaster did per
+revision and the server time per poll. For comparison, the same number of
+polls is served the old way, building and jsonify()-ing the payload on every
+request. Then each available encoder (json, orjson) is timed on the payload.
+
+Usage:
+    python benchmarks/status_encoding.py [polls] [polls_per_change]
+
+Defaults to 5000 polls with a state change every 100. Uses a throwaway SQLite
+database unless DATABASE_URL is set.
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from flask import jsonify
+
+import app as hallpass
+from app import app, db, User, Settings
+from routes.kiosk import _build_status_payload
+from services.status_encoder import create_status_encoder, stamp_server_time
+
+TOKEN = "encoding-token"
+CAPACITY = 3
+WAITING = 8
+
+
+def setup_tenant(roster_size):
+    with app.app_context():
+        user = User(google_id="encoding", email="encoding@halllday.local", name="Encoding", kiosk_token=TOKEN)
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Settings(user_id=user.id, room_name="Hall Pass", capacity=CAPACITY, overdue_minutes=10,
+                                kiosk_suspended=False, auto_ban_overdue=False, enable_queue=True,
+                                auto_promote_queue=True))
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+    roster = "student_id,name\n" + "\n".join(f"{50000 + i},Student Number {i}" for i in range(roster_size))
+    client.post("/api/roster/upload", data={"file": (io.BytesIO(roster.encode()), "roster.csv")},
+                content_type="multipart/form-data")
+    return user_id
+
+
+def main():
+    polls = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    interval = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    changes = polls // interval
+    user_id = setup_tenant(CAPACITY + WAITING + changes + 1)
+    client = app.test_client()
+    for i in range(CAPACITY + WAITING):
+        client.post("/api/scan", json={"token": TOKEN, "code": str(50000 + i)})
+    codes = iter(str(50000 + i) for i in range(CAPACITY + WAITING, 10 ** 6))
+    broadcaster = hallpass.status_broadcaster
+
+    # Cached path: the route serves the revision's bytes, stamping only the clock
+    builds, encodes = broadcaster.builds, broadcaster.encodes
+    bodies = set()
+    served = 0.0
+    for i in range(polls):
+        if i % interval == 0:
+            client.post("/api/scan", json={"token": TOKEN, "code": next(codes)})
+        start = time.perf_counter()
+        resp = client.get(f"/api/status?token={TOKEN}")
+        served += time.perf_counter() - start
+        body = json.loads(resp.data)
+        body.pop("server_time_ms")
+        bodies.add(json.dumps(body, sort_keys=True))
+    cached_builds = broadcaster.builds - builds
+    cached_encodes = broadcaster.encodes - encodes
+
+    # Old path: build and jsonify per request, timed inside the same request context
+    with app.test_request_context(f"/api/status?token={TOKEN}"):
+        start = time.perf_counter()
+        for _ in range(polls):
+            jsonify(server_time_ms=int(time.time() * 1000), **_build_status_payload(user_id)).get_data()
+        uncached = (time.perf_counter() - start) / polls
+        start = time.perf_counter()
+        for _ in range(polls):
+            revision, body, etag = broadcaster.status_body(user_id)
+            stamp_server_time(body)
+        cached = (time.perf_counter() - start) / polls
+        payload = _build_status_payload(user_id)
+
+    print(f"tenant:        {CAPACITY} out, {WAITING} waiting; {polls} polls, a scan every {interval}")
+    print(f"revisions:     {changes} scans -> {len(bodies)} distinct bodies")
+    print(f"builds:        {cached_builds} ({cached_builds / max(len(bodies), 1):.2f} per body), "
+          f"encodes {cached_encodes} ({cached_encodes / max(len(bodies), 1):.2f} per body)")
+    print(f"request:       {served / polls * 1e6:.0f} us/poll through the test client")
+    print(f"status body:   build+jsonify {uncached * 1e6:.1f} us/poll vs. cached+stamp {cached * 1e6:.1f} us/poll")
+    for name in ("json", "orjson"):
+        try:
+            encode = create_status_encoder(name)
+        except ValueError:
+            print(f"encoder {name:<7} not installed")
+            continue
+        start = time.perf_counter()
+        for _ in range(polls):
+            encode(payload)
+        print(f"encoder {name:<7} {(time.perf_counter() - start) / polls * 1e6:6.1f} us/encode "
+              f"({len(encode(payload))} bytes)")
+
+
+if __name__ == "__main__":
+    main()
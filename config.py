@@ -8,6 +8,23 @@ TIMEZONE = os.getenv("HALLPASS_TIMEZONE", "America/Chicago")  # For display and
 SECRET_KEY = os.getenv("HALLPASS_SECRET_KEY", "change-me-in-production")  # Flask session key
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///instance/hallpass.db")  # Use relative path for local dev
 
+# Per-worker roster cache budget across all teachers (least recently used rosters are evicted; 0 = no limit)
+ROSTER_CACHE_MAX_STUDENTS = int(os.getenv("HALLPASS_ROSTER_CACHE_MAX_STUDENTS", "200000"))
+ROSTER_CACHE_MAX_MB = int(os.getenv("HALLPASS_ROSTER_CACHE_MAX_MB", "64"))
+# Where workers share cache invalidations: "local" (single worker) or "file:/dev/shm/halllday" (all workers on a host)
+CACHE_BACKEND = os.getenv("HALLPASS_CACHE_BACKEND", "local")
+# How workers hear about each other's status changes for SSE: "local" (single worker),
+# "unix:/dev/shm/halllday-bus" (all workers on a host) or "postgres" (LISTEN/NOTIFY, any host)
+CHANGE_BUS = os.getenv("HALLPASS_CHANGE_BUS", "local")
+# Cooperative psycopg2 under `gunicorn -k gevent`: "auto" (when the worker is monkey-patched), "on" or "off"
+GEVENT_MODE = os.getenv("HALLPASS_GEVENT", "auto")
+# Postgres connection pool per worker (0 / -1 = pick by worker type: 10 + 20 overflow under gevent, else SQLAlchemy's 5 + 10)
+DB_POOL_SIZE = int(os.getenv("HALLPASS_DB_POOL_SIZE", "0"))
+DB_MAX_OVERFLOW = int(os.getenv("HALLPASS_DB_MAX_OVERFLOW", "-1"))
+DB_POOL_TIMEOUT = int(os.getenv("HALLPASS_DB_POOL_TIMEOUT", "0"))  # Seconds a request waits for a free connection
+# Status JSON encoder: "auto" (orjson when installed), "orjson" or "json"
+JSON_ENCODER = os.getenv("HALLPASS_JSON_ENCODER", "auto")
+
 # Google OAuth Configuration (for 2.0 multi-user support)
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET", "")
@@ -94,12 +94,16 @@ class StatusProvider with ChangeNotifier {
     try {
       final newStatus = await _api.getStatus(_token!);
 
-      // Reset stopwatch on each successful poll - used for timer calculation
-      // Stopwatch uses monotonic time (system uptime), immune to clock changes
-      _pollStopwatch.reset();
-      _pollStopwatch.start();
-
-      _status = newStatus;
+      // null means 304 Not Modified: keep the current status and keep the
+      // stopwatch running, since timers are still relative to that response
+      if (newStatus != null) {
+        // Reset stopwatch on each fresh status - used for timer calculation
+        // Stopwatch uses monotonic time (system uptime), immune to clock changes
+        _pollStopwatch.reset();
+        _pollStopwatch.start();
+
+        _status = newStatus;
+      }
       _error = null;
       _failureCount = 0; // Reset on success
     } catch (e) {
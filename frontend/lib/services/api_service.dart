@@ -23,13 +23,23 @@ class ApiService {
     return Uri.parse(url).replace(queryParameters: queryParams);
   }
 
-  Future<KioskStatus> getStatus(String token) async {
+  // ETag of the last status body, sent back as If-None-Match
+  String? _statusEtag;
+
+  /// Returns null when the server answers 304 (status unchanged).
+  Future<KioskStatus?> getStatus(String token) async {
     final uri = _getUri('/api/status', {'token': token});
 
     try {
-      final response = await http.get(uri);
+      final response = await http.get(
+        uri,
+        headers: _statusEtag != null ? {'If-None-Match': _statusEtag!} : null,
+      );
 
-      if (response.statusCode == 200) {
+      if (response.statusCode == 304) {
+        return null;
+      } else if (response.statusCode == 200) {
+        _statusEtag = response.headers['etag'];
         return KioskStatus.fromJson(json.decode(response.body));
       } else {
         throw Exception('Failed to load status: ${response.statusCode}');
@@ -67,6 +77,30 @@ class ApiService {
     }
   }
 
+  /// Flush scans buffered while offline. Each event is {'code', 'client_ts'}
+  /// (epoch ms); the server applies them in order and returns one result each.
+  Future<List<Map<String, dynamic>>> scanBatch(
+      String token, List<Map<String, dynamic>> events) async {
+    final uri = _getUri('/api/scan/batch');
+
+    try {
+      final response = await http.post(
+        uri,
+        headers: {'Content-Type': 'application/json'},
+        body: json.encode({'token': token, 'events': events}),
+      );
+
+      if (response.statusCode == 200) {
+        final body = json.decode(response.body);
+        return List<Map<String, dynamic>>.from(body['results']);
+      } else {
+        throw Exception('Server error: ${response.statusCode}');
+      }
+    } catch (e) {
+      throw Exception('Network error: $e');
+    }
+  }
+
   // --- ADMIN API ---
   Future<Map<String, dynamic>> getAdminStats() async {
     final uri = _getUri('/api/admin/stats');
@@ -8,8 +8,10 @@ See PLANNING.md for remaining routes to migrate.
 from flask import Blueprint, jsonify, request, send_file, current_app, session
 from functools import wraps
 from datetime import datetime, timezone, timedelta
+import base64
 import csv
 import io
+import json
 
 # Create blueprint
 admin_bp = Blueprint('admin', __name__)
@@ -49,9 +51,10 @@ def get_current_user_id():
 @admin_bp.route('/api/admin/stats')
 def api_admin_stats():
     """API Endpoint: Get Admin Dashboard Stats & Insights"""
-    from app import (db, User, Settings, Session as SessionModel, StudentName, Queue,
+    from app import (db, User, Settings, Session as SessionModel, StudentName, Queue, TZ,
                      is_admin_authenticated, get_settings, get_student_name, 
-                     get_memory_roster, now_utc, handle_db_errors)
+                     get_roster_size, now_utc, handle_db_errors, rollup_service,
+                     analytics_service)
     
     if not is_admin_authenticated():
         return jsonify(ok=False, error="Unauthorized", authenticated=False), 401
@@ -69,49 +72,29 @@ def api_admin_stats():
         public_urls = current_user.get_public_urls(base_url)
 
     # Scope queries
-    query_session = SessionModel.query
     query_open = SessionModel.query.filter_by(end_ts=None)
     query_roster = StudentName.query
     
     if user_id is not None:
-        query_session = query_session.filter_by(user_id=user_id)
         query_open = query_open.filter_by(user_id=user_id)
         query_roster = query_roster.filter_by(user_id=user_id)
     
-    # Insights Logic (Python-side aggregation)
-    start_date = datetime.now(timezone.utc) - timedelta(days=30)
-    sessions = query_session.filter(SessionModel.start_ts >= start_date).all()
-    
-    student_stats = {}
+    # Insights Logic (last 30 days; grouped and ranked in SQL)
     settings = get_settings(user_id)
+    since = datetime.now(TZ).date() - timedelta(days=30)
     overdue_limit = settings["overdue_minutes"] * 60
-    
-    for s in sessions:
-        sid = s.student_id
-        if sid not in student_stats:
-            student_stats[sid] = {"count": 0, "overdue": 0}
-        
-        stat = student_stats[sid]
-        stat["count"] += 1
-        
-        # Check overdue
-        end_time = s.end_ts or now_utc()
-        duration = (end_time - s.start_ts).total_seconds()
-        if duration > overdue_limit:
-            stat["overdue"] += 1
-            
-    # Convert to list and sort
-    def resolve_top(stats_dict, sort_key, limit=5):
-        sorted_items = sorted(stats_dict.items(), key=lambda x: x[1][sort_key], reverse=True)[:limit]
+
+    def resolve_top(sort_key, limit=5):
         result = []
-        for sid, data in sorted_items:
+        for row in analytics_service.top_students(user_id, since, overdue_limit, order=sort_key, limit=limit):
+            sid = row["student_id"]
             name = get_student_name(sid, "Unknown", user_id=user_id)
-            result.append({"name": name if name != "Unknown" else f"ID: {sid}", "count": data[sort_key]})
+            result.append({"name": name if name != "Unknown" else f"ID: {sid}", "count": row[sort_key]})
         return result
 
     insights = {
-        "top_students": resolve_top(student_stats, "count"),
-        "most_overdue": resolve_top(student_stats, "overdue")
+        "top_students": resolve_top("count"),
+        "most_overdue": resolve_top("overdue")
     }
 
     try:
@@ -123,11 +106,11 @@ def api_admin_stats():
                 "slug": current_user.kiosk_slug if current_user else None,
                 "urls": public_urls
             },
-            total_sessions=query_session.count(),
+            total_sessions=rollup_service.total_sessions(user_id),
             active_sessions_count=query_open.count(),
             roster_count=query_roster.count(),
-            memory_roster_count=len(get_memory_roster(user_id)),
-            settings=get_settings(user_id),
+            memory_roster_count=get_roster_size(user_id),
+            settings=settings,
             queue_list=[{
                 "name": get_student_name(q.student_id, "Unknown", user_id=user_id),
                 "student_id": q.student_id
@@ -151,7 +134,8 @@ def api_admin_stats():
 @require_admin_auth_api
 def api_end_session():
     """Manually end a specific session"""
-    from app import db, Session as SessionModel, Queue, get_settings, get_student_name, now_utc, handle_db_errors
+    from app import (db, Session as SessionModel, Queue, get_settings, get_student_name, now_utc,
+                     handle_db_errors, notify_status_change, record_session_start, record_session_end)
     
     user_id = get_current_user_id()
     payload = request.get_json(silent=True) or {}
@@ -169,6 +153,7 @@ def api_end_session():
         
     sess.end_ts = now_utc()
     sess.ended_by = "admin_override"
+    record_session_end(user_id, sess.student_id, sess.start_ts, sess.end_ts)
     
     # Check for auto-promote
     settings = get_settings(user_id)
@@ -181,11 +166,13 @@ def api_end_session():
             promoted_sess = SessionModel(student_id=next_code, start_ts=now_utc(), room=settings["room_name"], user_id=user_id, ended_by="auto")
             db.session.add(promoted_sess)
             db.session.delete(next_in_line)
+            record_session_start(user_id, next_code, promoted_sess.start_ts)
             
             next_name = get_student_name(next_code, "Student", user_id=user_id)
             promoted_msg = f". Auto-started {next_name} from waitlist."
 
     db.session.commit()
+    notify_status_change(user_id)
     
     return jsonify(ok=True, message=f"Ended session for {get_student_name(sess.student_id, 'Student', user_id=user_id)}{promoted_msg}")
 
@@ -194,7 +181,7 @@ def api_end_session():
 @require_admin_auth_api
 def update_settings_api():
     """Update user settings"""
-    from app import db, Settings, get_settings
+    from app import db, get_or_create_settings, get_settings, invalidate_settings, notify_status_change
     
     user_id = get_current_user_id()
     if not user_id:
@@ -203,17 +190,7 @@ def update_settings_api():
     data = request.get_json(silent=True) or {}
     
     # Get or create the user's settings
-    s = Settings.query.filter_by(user_id=user_id).first()
-    if not s:
-        s = Settings(
-            user_id=user_id,
-            room_name="Hall Pass",
-            capacity=1,
-            overdue_minutes=10,
-            kiosk_suspended=False,
-            auto_ban_overdue=False
-        )
-        db.session.add(s)
+    s = get_or_create_settings(user_id)
     
     if "room_name" in data:
         s.room_name = str(data["room_name"]).strip() or s.room_name
@@ -237,13 +214,15 @@ def update_settings_api():
         s.enable_queue = bool(data["enable_queue"])
     
     db.session.commit()
+    invalidate_settings(user_id)
+    notify_status_change(user_id)
     return jsonify(ok=True, settings=get_settings(user_id))
 
 
 @admin_bp.route('/api/settings/suspend', methods=['POST'])
 def api_suspend_kiosk():
     """Suspend or resume kiosk"""
-    from app import db, Settings, is_admin_authenticated
+    from app import db, Settings, is_admin_authenticated, invalidate_settings, notify_status_change
     
     if not is_admin_authenticated():
         return jsonify(ok=False, error="Unauthorized"), 401
@@ -256,6 +235,8 @@ def api_suspend_kiosk():
     if settings:
         settings.kiosk_suspended = bool(should_suspend)
         db.session.commit()
+        invalidate_settings(user_id)
+        notify_status_change(user_id)
         return jsonify(ok=True, suspended=settings.kiosk_suspended)
     return jsonify(ok=False, error="Settings not found"), 404
 
@@ -263,7 +244,7 @@ def api_suspend_kiosk():
 @admin_bp.route('/api/settings/slug', methods=['POST'])
 def api_update_slug():
     """Update kiosk slug (custom URL)"""
-    from app import db, User, is_admin_authenticated
+    from app import db, User, is_admin_authenticated, invalidate_kiosk_token
     
     if not is_admin_authenticated():
         return jsonify(ok=False, error="Unauthorized"), 401
@@ -278,6 +259,7 @@ def api_update_slug():
     if current_user.set_kiosk_slug(slug):
         try:
             db.session.commit()
+            invalidate_kiosk_token(user_id)
             return jsonify(ok=True, slug=current_user.kiosk_slug)
         except Exception:
             db.session.rollback()
@@ -341,16 +323,69 @@ def api_roster_template():
     )
 
 
+def _generated_id_prefix(user_id):
+    """Prefix of the placeholder IDs given to roster rows without a student ID"""
+    return f"AUTO_{user_id}_"
+
+
+def _parse_roster_csv(reader, user_id, skipped_rows, generated_ids):
+    """Yield (student_id, name) from an uploaded roster, one CSV row at a time.
+
+    Auto-detects (ID, Name) vs (Name, ID) per row and skips a header row.
+    FERPA Compliance: rows without a name are skipped (recorded in skipped_rows);
+    rows without an ID get a placeholder ID (recorded in generated_ids) so every
+    record has an encrypted_id.
+    """
+    auto_id_counter = 0  # Counter for auto-generated IDs
+    for row_num, row in enumerate(reader, start=1):
+        if not row:
+            continue
+
+        col0 = row[0].strip() if len(row) > 0 else ""
+        col1 = row[1].strip() if len(row) > 1 else ""
+
+        # Skip header row
+        if row_num == 1 and (col0.lower() in ['student_id', 'id', 'studentid'] or
+                              col1.lower() in ['name', 'student_name', 'studentname']):
+            continue
+
+        # Auto-detect format (ID, Name) or (Name, ID)
+        if col0 and col0.isdigit() and not (col1 and col1.isdigit()):
+            student_id, name = col0, col1
+        elif col1 and col1.isdigit() and not (col0 and col0.isdigit()):
+            name, student_id = col0, col1
+        else:
+            name, student_id = col0, col1
+
+        if not name:
+            skipped_rows.append({"row": row_num, "reason": "Missing name"})
+            continue
+
+        if not student_id:
+            auto_id_counter += 1
+            student_id = f"{_generated_id_prefix(user_id)}{auto_id_counter:06d}"
+            generated_ids.append({
+                "row": row_num,
+                "name": name,
+                "generated_id": student_id
+            })
+
+        yield student_id, name
+
+
 @admin_bp.route('/api/roster/upload', methods=['POST'])
 def api_roster_upload():
     """Upload roster CSV file with FERPA-compliant validation.
     
     FERPA Compliance: All students MUST have an encrypted_id.
     If CSV row is missing student_id, a placeholder ID is auto-generated.
+    The file is parsed as a stream and written in bulk.
+    
+    mode=sync (default) applies only the differences against the stored roster,
+    keeping ban state for students who remain (rows with generated IDs are
+    always re-added); mode=replace deletes the roster and re-imports every row.
     """
-    from app import (db, is_admin_authenticated, StudentName, cipher_suite, 
-                     refresh_roster_cache)
-    import hashlib
+    from app import db, is_admin_authenticated, roster_service, notify_status_change
     
     if not is_admin_authenticated():
         return jsonify(ok=False, error="Unauthorized"), 401
@@ -362,86 +397,48 @@ def api_roster_upload():
     if not file.filename.endswith('.csv'):
         return jsonify(ok=False, error="CSV required"), 400
         
+    mode = request.form.get('mode') or request.args.get('mode') or 'sync'
+    if mode not in ('sync', 'replace'):
+        return jsonify(ok=False, error="mode must be 'sync' or 'replace'"), 400
+        
     user_id = get_current_user_id()
     
     try:
-        # Replace existing roster
-        StudentName.query.filter_by(user_id=user_id).delete()
-        
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        reader = csv.reader(stream)
-        
-        count = 0
         skipped_rows = []  # Rows that were skipped with reasons
         generated_ids = []  # Rows where placeholder IDs were generated
-        auto_id_counter = 0  # Counter for auto-generated IDs
         
-        for row_num, row in enumerate(reader, start=1):
-            if not row: 
-                continue
-            
-            col0 = row[0].strip() if len(row) > 0 else ""
-            col1 = row[1].strip() if len(row) > 1 else ""
-            
-            # Skip header row
-            if row_num == 1 and (col0.lower() in ['student_id', 'id', 'studentid'] or 
-                                  col1.lower() in ['name', 'student_name', 'studentname']):
-                continue
-            
-            # Auto-detect format (ID, Name) or (Name, ID)
-            name = None
-            student_id = None
-            
-            if col0 and all(c.isdigit() for c in col0) and not (col1 and all(c.isdigit() for c in col1)):
-                student_id = col0
-                name = col1
-            elif col1 and all(c.isdigit() for c in col1) and not (col0 and all(c.isdigit() for c in col0)):
-                name = col0
-                student_id = col1
-            else:
-                name = col0
-                student_id = col1
-            
-            # FERPA Compliance: Skip rows without a name
-            if not name:
-                skipped_rows.append({"row": row_num, "reason": "Missing name"})
-                continue
-            
-            # FERPA Compliance: Generate placeholder ID if missing
-            # This ensures all records have an encrypted_id for data protection
-            if not student_id:
-                auto_id_counter += 1
-                student_id = f"AUTO_{user_id}_{auto_id_counter:06d}"
-                generated_ids.append({
-                    "row": row_num, 
-                    "name": name, 
-                    "generated_id": student_id
-                })
-            
-            # Create hash and encrypt ID (always encrypted now)
-            name_hash = hashlib.sha256(f"student_{user_id}_{student_id}".encode()).hexdigest()[:16]
-            encrypted_id = cipher_suite.encrypt(student_id.encode()).decode()
-            
-            s = StudentName(
-                display_name=name,
-                name_hash=name_hash,
-                encrypted_id=encrypted_id,
-                user_id=user_id,
-                banned=False
-            )
-            db.session.add(s)
-            count += 1
-            
-        db.session.commit()
-        refresh_roster_cache(user_id)
+        # Decode lazily; utf-8-sig drops the BOM spreadsheet exports add
+        stream = io.TextIOWrapper(file.stream, encoding="utf-8-sig", newline="")
+        rows = _parse_roster_csv(csv.reader(stream), user_id, skipped_rows, generated_ids)
+        
+        if mode == 'replace':
+            result = roster_service.ingest(user_id, rows, replace=True)
+        else:
+            # Placeholder IDs are numbered by row position, so they never match a stored student
+            prefix = _generated_id_prefix(user_id)
+            result = roster_service.sync(user_id, rows,
+                                         is_placeholder=lambda student_id: student_id.startswith(prefix))
+        count = result["count"]
+        
+        if result.get("changed", True):
+            notify_status_change(user_id)
         
         # Build response with detailed feedback
         response = {
             "ok": True, 
+            "mode": mode,
             "count": count,
-            "message": f"Successfully imported {count} students"
+            "message": f"Successfully imported {count} students",
+            "rows_per_second": round(result["rows_per_second"]),
+            "db_seconds": round(result["db_seconds"], 3),
         }
         
+        if mode == 'sync':
+            for key in ("added", "updated", "removed", "unchanged"):
+                response[key] = result[key]
+            response["message"] += (f" ({result['added']} added, {result['updated']} updated, "
+                                    f"{result['removed']} removed)")
+        
         if generated_ids:
             response["generated_ids_count"] = len(generated_ids)
             response["generated_ids"] = generated_ids[:10]  # Limit to first 10 for brevity
@@ -508,7 +505,7 @@ def api_roster_get():
 @admin_bp.route('/api/roster/ban', methods=['POST'])
 def api_roster_ban():
     """Ban or unban a student"""
-    from app import db, is_admin_authenticated, StudentName
+    from app import db, is_admin_authenticated, StudentName, ban_service, notify_status_change
     from datetime import datetime, timezone
     
     if not is_admin_authenticated():
@@ -532,6 +529,8 @@ def api_roster_ban():
             else:
                 student.banned_since = None
             db.session.commit()
+            ban_service.mark_banned(user_id, hash_key, bool(should_ban))
+            notify_status_change(user_id, reload_state=False)
             return jsonify(ok=True)
         else:
             return jsonify(ok=False, error="Student not found"), 404
@@ -565,7 +564,8 @@ def _check_rate_limit(user_id):
 @admin_bp.route('/api/roster/add', methods=['POST'])
 def api_roster_add():
     """Add a single student to the roster"""
-    from app import db, is_admin_authenticated, StudentName, cipher_suite, refresh_roster_cache
+    from app import (db, is_admin_authenticated, StudentName, cipher_suite, roster_service,
+                     notify_status_change)
     import hashlib
     
     if not is_admin_authenticated():
@@ -609,7 +609,8 @@ def api_roster_add():
         )
         db.session.add(s)
         db.session.commit()
-        refresh_roster_cache(user_id)
+        roster_service.cache_student(user_id, name_hash, name)
+        notify_status_change(user_id)
         
         return jsonify(ok=True, message="Student added successfully", student={
             "id": s.id,
@@ -626,7 +627,7 @@ def api_roster_add():
 @admin_bp.route('/api/roster/<int:student_db_id>', methods=['DELETE'])
 def api_roster_delete(student_db_id):
     """Delete a single student from the roster"""
-    from app import db, is_admin_authenticated, StudentName, refresh_roster_cache
+    from app import db, is_admin_authenticated, StudentName, roster_service, notify_status_change
     
     if not is_admin_authenticated():
         return jsonify(ok=False, error="Unauthorized"), 401
@@ -640,9 +641,11 @@ def api_roster_delete(student_db_id):
         if not student:
             return jsonify(ok=False, error="Student not found"), 404
             
+        name_hash = student.name_hash
         db.session.delete(student)
         db.session.commit()
-        refresh_roster_cache(user_id)
+        roster_service.uncache_student(user_id, name_hash)
+        notify_status_change(user_id)
         
         return jsonify(ok=True, message="Student deleted successfully")
         
@@ -654,7 +657,8 @@ def api_roster_delete(student_db_id):
 @admin_bp.route('/api/roster/clear', methods=['POST'])
 def api_roster_clear():
     """Clear roster and optionally session history"""
-    from app import db, is_admin_authenticated, StudentName, Session as SessionModel, refresh_roster_cache
+    from app import (db, is_admin_authenticated, StudentName, Session as SessionModel, refresh_roster_cache,
+                     notify_status_change, clear_session_rollups)
     
     if not is_admin_authenticated():
         return jsonify(ok=False, error="Unauthorized"), 401
@@ -667,38 +671,79 @@ def api_roster_clear():
         StudentName.query.filter_by(user_id=user_id).delete()
         if clear_history:
             SessionModel.query.filter_by(user_id=user_id).delete()
+            clear_session_rollups(user_id)
             
         db.session.commit()
         refresh_roster_cache(user_id)
+        notify_status_change(user_id)
         return jsonify(ok=True)
     except Exception as e:
         db.session.rollback()
         return jsonify(ok=False, error=str(e)), 500
 
 
+MAX_LOG_PAGE = 500
+
+
+def _encode_log_cursor(key):
+    """Opaque cursor for the row after which the next page starts"""
+    start_ts, session_id = key
+    raw = json.dumps([start_ts.isoformat(), session_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_log_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    start_ts, session_id = json.loads(raw)
+    return datetime.fromisoformat(start_ts), int(session_id)
+
+
 @admin_bp.route('/api/admin/logs', methods=['GET'])
 def api_admin_logs():
-    """Get pass logs with pagination"""
-    from app import is_admin_authenticated, Session as SessionModel, get_student_name, get_settings, to_local
+    """
+    Get pass logs, newest first, with keyset pagination.
+
+    Query params: limit, cursor (next_cursor from the previous page), from/to
+    (local YYYY-MM-DD, inclusive), status (active/completed/overdue), student_id,
+    count (estimate [default], exact or none).
+    """
+    from app import (is_admin_authenticated, get_student_name, get_settings, to_local, local_date_range,
+                     session_service, rollup_service)
     
     if not is_admin_authenticated():
         return jsonify(ok=False, error="Unauthorized"), 401
         
     user_id = get_current_user_id()
+    settings = get_settings(user_id)
+    overdue_seconds = settings["overdue_minutes"] * 60
     try:
-        limit = int(request.args.get('limit', 100))
+        limit = max(1, min(int(request.args.get('limit', 100)), MAX_LOG_PAGE))
         offset = int(request.args.get('offset', 0))
-        
-        sessions = SessionModel.query.filter_by(user_id=user_id).order_by(
-            SessionModel.start_ts.desc()
-        ).limit(limit).offset(offset).all()
-        
-        settings = get_settings(user_id)
-        overdue_seconds = settings["overdue_minutes"] * 60
-        
+        cursor = request.args.get('cursor')
+        after = _decode_log_cursor(cursor) if cursor else None
+
+        since, until, start_utc, end_utc = local_date_range(request.args.get('from'), request.args.get('to'))
+        filters = dict(overdue_seconds=overdue_seconds, start_utc=start_utc, end_utc=end_utc)
+        status_filter = request.args.get('status') or None
+        if status_filter is not None and status_filter not in session_service.LOG_STATUSES:
+            raise ValueError(f"Unknown status: {status_filter}")
+        filters["status"] = status_filter
+        filters["student_id"] = (request.args.get('student_id') or '').strip() or None
+        count_mode = request.args.get('count', 'estimate')
+        if count_mode not in ('estimate', 'exact', 'none'):
+            raise ValueError(f"Unknown count mode: {count_mode}")
+    except (ValueError, TypeError) as e:
+        return jsonify(ok=False, error=f"Invalid query: {e}"), 400
+
+    try:
+        sessions, last_key = session_service.get_log_page(user_id, limit, after=after, offset=offset, **filters)
+
+        names = {}
         logs = []
         for s in sessions:
-            name = get_student_name(s.student_id, "Unknown", user_id=user_id)
+            # Resolve each student once per page
+            if s.student_id not in names:
+                names[s.student_id] = get_student_name(s.student_id, "Unknown", user_id=user_id)
             status = "active"
             if s.end_ts:
                 status = "completed"
@@ -707,7 +752,7 @@ def api_admin_logs():
             
             logs.append({
                 "id": s.id,
-                "name": name,  # Changed back from "student_name" to "name"
+                "name": names[s.student_id],  # Changed back from "student_name" to "name"
                 "student_id": s.student_id,
                 "start": to_local(s.start_ts).isoformat(),  # Changed back from "start_ts" to "start"
                 "end": to_local(s.end_ts).isoformat() if s.end_ts else None,  # Changed back from "end_ts" to "end"
@@ -715,66 +760,75 @@ def api_admin_logs():
                 "status": status,
                 "room": s.room
             })
-            
-        total_count = SessionModel.query.filter_by(user_id=user_id).count()
-        return jsonify(ok=True, logs=logs, total=total_count)
+
+        # Exact counts scan the filtered history; the default estimate reads the
+        # rollups (exact for date/student filters, unavailable for status filters)
+        total = None
+        if count_mode == 'exact':
+            total = session_service.count_logs(user_id, **filters)
+        elif count_mode == 'estimate' and status_filter is None:
+            total = rollup_service.total_sessions(user_id, since, until, filters["student_id"])
+
+        return jsonify(
+            ok=True,
+            logs=logs,
+            next_cursor=_encode_log_cursor(last_key) if last_key else None,
+            total=total,
+            total_exact=count_mode == 'exact',
+        )
     except Exception as e:
         return jsonify(ok=False, error=str(e)), 500
 
 
 @admin_bp.route('/api/admin/logs/export', methods=['GET'])
 def api_admin_logs_export():
-    """Export logs to CSV"""
-    from app import is_admin_authenticated, Session as SessionModel, get_student_name, get_settings, to_local
+    """Export logs to CSV (streamed, newest first; optional ?from=&to= local dates)"""
+    from app import (is_admin_authenticated, get_student_name, get_settings, to_local, now_utc,
+                     local_date_range, session_service, stream_csv_response)
     
     if not is_admin_authenticated():
         return "Unauthorized", 401
     
     user_id = get_current_user_id()
     try:
-        sessions = SessionModel.query.filter_by(user_id=user_id).order_by(SessionModel.start_ts.desc()).limit(1000).all()
-        
-        si = io.StringIO()
-        cw = csv.writer(si)
-        cw.writerow(["Student Name", "Student ID", "Room", "Start Time", "End Time", "Duration (Minutes)", "Status"])
-        
-        for s in sessions:
-            name = get_student_name(s.student_id, "Unknown", user_id=user_id)
+        _, _, start_utc, end_utc = local_date_range(request.args.get('from'), request.args.get('to'))
+    except ValueError as e:
+        return f"Invalid date range: {e}", 400
+    overdue_seconds = get_settings(user_id)["overdue_minutes"] * 60
+
+    def rows():
+        names = {}
+        for s in session_service.iter_sessions(user_id, newest_first=True, start_utc=start_utc, end_utc=end_utc):
+            if s.student_id not in names:
+                names[s.student_id] = get_student_name(s.student_id, "Unknown", user_id=user_id)
+            duration = int(((s.end_ts or now_utc()) - s.start_ts).total_seconds())
             status = "active"
             if s.end_ts:
                 status = "completed"
-                if s.duration_seconds > get_settings(user_id)["overdue_minutes"] * 60:
+                if duration > overdue_seconds:
                     status = "overdue"
             
-            cw.writerow([
-                name,
+            yield [
+                names[s.student_id],
                 s.student_id,
                 s.room,
                 to_local(s.start_ts).isoformat(),
                 to_local(s.end_ts).isoformat() if s.end_ts else "",
-                round(s.duration_seconds / 60, 1),
+                round(duration / 60, 1),
                 status
-            ])
-            
-        output = io.BytesIO()
-        output.write(si.getvalue().encode('utf-8'))
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype="text/csv",
-            as_attachment=True,
-            download_name="pass_logs.csv"
-        )
-    except Exception as e:
-        return str(e), 500
+            ]
+
+    return stream_csv_response(
+        "pass_logs.csv",
+        ["Student Name", "Student ID", "Room", "Start Time", "End Time", "Duration (Minutes)", "Status"],
+        rows(),
+    )
 
 
 @admin_bp.route('/api/control/ban_overdue', methods=['POST'])
 def api_ban_overdue():
     """Ban all students with active overdue sessions"""
-    from app import db, is_admin_authenticated, Session as SessionModel, StudentName, get_settings
-    import hashlib
+    from app import db, is_admin_authenticated, Session as SessionModel, ban_service, get_settings, notify_status_change
     
     if not is_admin_authenticated():
         return jsonify(ok=False, error="Unauthorized"), 401
@@ -788,22 +842,23 @@ def api_ban_overdue():
         count = 0
         for s in open_sessions:
             if s.duration_seconds > overdue_seconds:
-                name_hash = hashlib.sha256(f"student_{user_id}_{s.student_id}".encode()).hexdigest()[:16]
-                student_name = StudentName.query.filter_by(user_id=user_id, name_hash=name_hash).first()
-                if student_name and not student_name.banned:
-                    student_name.banned = True
-                    count += 1
+                if not ban_service.is_student_banned(user_id, s.student_id):
+                    if ban_service.set_student_banned(user_id, s.student_id, True, commit=False):
+                        count += 1
         db.session.commit()
+        notify_status_change(user_id, reload_state=False)
         return jsonify(ok=True, count=count)
     except Exception as e:
         db.session.rollback()
+        ban_service.invalidate(user_id)
         return jsonify(ok=False, error=str(e)), 500
 
 
 @admin_bp.route('/api/control/delete_history', methods=['POST'])
 def api_delete_history():
     """Delete all session history for user"""
-    from app import db, is_admin_authenticated, Session as SessionModel
+    from app import (db, is_admin_authenticated, Session as SessionModel, notify_status_change,
+                     clear_session_rollups)
     
     if not is_admin_authenticated():
         return jsonify(ok=False, error="Unauthorized"), 401
@@ -811,7 +866,9 @@ def api_delete_history():
     user_id = get_current_user_id()
     try:
         SessionModel.query.filter_by(user_id=user_id).delete()
+        clear_session_rollups(user_id)
         db.session.commit()
+        notify_status_change(user_id)
         return jsonify(ok=True)
     except Exception as e:
         return jsonify(ok=False, error=str(e)), 500
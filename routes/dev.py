@@ -6,6 +6,7 @@ Contains dev dashboard endpoints for system-wide stats and user management.
 """
 from flask import Blueprint, jsonify, request, session
 from datetime import datetime, timezone
+from sqlalchemy.orm import joinedload
 import os
 
 # Create blueprint
@@ -38,11 +39,29 @@ def api_dev_auth():
 @dev_bp.route("/api/dev/stats")
 def api_dev_stats():
     """Basic system stats (requires dev authentication)"""
-    from app import Session, StudentName, User, get_settings
+    from app import (Session, StudentName, User, get_settings, settings_cache, token_resolver,
+                     overdue_scheduler, roster_service, cache_backend, change_bus, db)
+    from services.gevent_mode import gevent_stats
     
     if not session.get('dev_authenticated'):
         return jsonify(ok=False, error="Unauthorized", authenticated=False), 401
     
+    # Per-worker cache counters (hit rate since this process started)
+    caches = {}
+    if settings_cache:
+        caches["settings"] = settings_cache.stats()
+    if token_resolver:
+        caches["kiosk_tokens"] = token_resolver.stats()
+    if roster_service:
+        caches["rosters"] = dict(roster_service.cache.stats(),
+                                 shared_loads=roster_service.shared_loads,
+                                 unknown_rejects=roster_service.unknown_rejects,
+                                 name_db_lookups=roster_service.name_db_lookups)
+    if cache_backend:
+        caches["backend"] = cache_backend.stats()
+    if change_bus:
+        caches["change_bus"] = change_bus.stats()
+    
     # Global Stats
     return jsonify(
         ok=True,
@@ -50,7 +69,10 @@ def api_dev_stats():
         active_sessions=Session.query.filter_by(end_ts=None).count(),
         total_students=StudentName.query.count(),
         total_users=User.query.count(),
-        settings=get_settings()
+        settings=get_settings(),
+        caches=caches,
+        overdue_scheduler=overdue_scheduler.stats() if overdue_scheduler else None,
+        database=gevent_stats(db.engine)
     )
 
 
@@ -61,7 +83,7 @@ def api_dev_expanded_stats():
     Authenticated via dev passcode (can be inline or session-based).
     """
     import config
-    from app import Session, Student, User
+    from app import Session, Student, User, analytics_service
     
     # Check session auth OR inline passcode
     if not session.get('dev_authenticated'):
@@ -80,15 +102,16 @@ def api_dev_expanded_stats():
     # --- Active Teachers List ---
     teachers_data = []
     users = User.query.all()
+    # One GROUP BY for every teacher's counts
+    counts = analytics_service.tenant_session_counts()
     
     for u in users:
-        u_total = Session.query.filter_by(user_id=u.id).count()
-        u_active = Session.query.filter_by(user_id=u.id, end_ts=None).count()
+        u_counts = counts.get(u.id, {"total": 0, "active": 0})
         
         teachers_data.append({
             "email": u.email,
-            "active_sessions": u_active,
-            "total_sessions": u_total,
+            "active_sessions": u_counts["active"],
+            "total_sessions": u_counts["total"],
             "last_login": u.last_login.isoformat() if u.last_login else None
         })
         
@@ -96,7 +119,7 @@ def api_dev_expanded_stats():
     teachers_data.sort(key=lambda x: (x['active_sessions'], x['last_login'] or ""), reverse=True)
     
     # --- Recent System Activity (FERPA-compliant: ANONYMIZED) ---
-    recent_sess = Session.query.order_by(Session.start_ts.desc()).limit(20).all()
+    recent_sess = Session.query.options(joinedload(Session.user)).order_by(Session.start_ts.desc()).limit(20).all()
     activity_log = []
     
     for s in recent_sess:
@@ -7,9 +7,10 @@ Contains all kiosk-related endpoints for student scanning and queue management.
 from flask import Blueprint, jsonify, request, Response, stream_with_context
 from datetime import datetime, timezone, timedelta
 from typing import Dict, Optional, Any
-import json
 import time
 
+from services.status_encoder import stamp_server_time
+
 # Create blueprint
 kiosk_bp = Blueprint('kiosk', __name__)
 
@@ -22,43 +23,43 @@ def _build_status_payload(user_id: Optional[int]) -> Dict[str, Any]:
     """
     Single source of truth for Kiosk/Display status payload.
     Keep this aligned with the Flutter `KioskStatus` model.
+    Served from the in-memory ClassroomState; only names come from the roster cache.
+    Carries no clock: server_time_ms is stamped on when the encoded payload is
+    served and clients derive elapsed time from it and `start_ms`, so the
+    payload (and its cached bytes) only change with real state.
     """
-    from app import (get_settings, get_current_holder, get_student_name, 
-                     get_open_sessions, to_local, Queue)
+    from app import get_classroom_state, get_student_name, to_local
     
-    settings = get_settings(user_id)
+    state = get_classroom_state(user_id)
+    with state.lock:
+        settings = dict(state.settings)
+        open_sessions = list(state.open_sessions)
+        queue_ids = list(state.queue)
 
     overdue_minutes = settings["overdue_minutes"]
     kiosk_suspended = settings["kiosk_suspended"]
     auto_ban_overdue = settings.get("auto_ban_overdue", False)
     auto_promote_queue = settings.get("auto_promote_queue", False)
 
-    # Server time in milliseconds for client sync (NTP-lite)
-    server_now = datetime.now(timezone.utc)
-    server_time_ms = int(server_now.timestamp() * 1000)
-
     # Current holder (legacy single-pass fields) + multi-pass
-    s = get_current_holder(user_id)
+    s = open_sessions[0] if open_sessions else None
     active_sessions = [{
         "id": sess.id,
         "name": get_student_name(sess.student_id, "Student", user_id=user_id),
-        "elapsed": sess.duration_seconds,
         "overdue": sess.duration_seconds > overdue_minutes * 60,
         "start": to_local(sess.start_ts).isoformat(),
         # Unix timestamp in ms for precise client-side calculation
         "start_ms": int(sess.start_ts.timestamp() * 1000)
-    } for sess in get_open_sessions(user_id)]
+    } for sess in open_sessions]
 
     # Queue (names for display + ids for admin actions)
-    queue_rows = Queue.query.filter_by(user_id=user_id).order_by(Queue.joined_ts.asc()).all()
-    queue_names = [get_student_name(q.student_id, "Unknown", user_id=user_id) for q in queue_rows]
+    queue_names = [get_student_name(student_id, "Unknown", user_id=user_id) for student_id in queue_ids]
     queue_list = [{
-        "name": get_student_name(q.student_id, "Unknown", user_id=user_id),
-        "student_id": q.student_id,
-    } for q in queue_rows]
+        "name": name,
+        "student_id": student_id,
+    } for student_id, name in zip(queue_ids, queue_names)]
 
     payload: Dict[str, Any] = {
-        "server_time_ms": server_time_ms,  # For client clock sync
         "overdue_minutes": overdue_minutes,
         "kiosk_suspended": kiosk_suspended,
         "auto_ban_overdue": auto_ban_overdue,
@@ -75,14 +76,12 @@ def _build_status_payload(user_id: Optional[int]) -> Dict[str, Any]:
             "name": get_student_name(s.student_id, "Student", user_id=user_id),
             "start": to_local(s.start_ts).isoformat(),
             "start_ms": int(s.start_ts.timestamp() * 1000),
-            "elapsed": s.duration_seconds,
             "overdue": s.duration_seconds > overdue_minutes * 60,
         })
     else:
         payload.update({
             "in_use": False,
             "name": "",
-            "elapsed": 0,
             "overdue": False,
         })
 
@@ -92,7 +91,7 @@ def _build_status_payload(user_id: Optional[int]) -> Dict[str, Any]:
 def _build_status_signature(payload: Dict[str, Any]) -> Dict[str, Any]:
     """
     A reduced, stable signature for SSE change detection.
-    Excludes fields that change every second (like `elapsed`).
+    Excludes the per-session `start_ms` timestamps, which `start` already covers.
     """
     sig_sessions = [{
         "id": s.get("id"),
@@ -117,41 +116,58 @@ def _build_status_signature(payload: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def _sse_status_stream(token: Optional[str]):
-    """SSE stream generator for real-time status updates"""
-    from app import db, get_current_user_id
-    
+def _next_status_deadline(payload: Dict[str, Any]) -> Optional[float]:
+    """
+    Epoch seconds when the next active session turns overdue, or None.
+    Lets the SSE pump sleep until the payload would change on its own.
+    """
+    limit_ms = (payload.get("overdue_minutes") or 0) * 60 * 1000
+    pending = [s["start_ms"] + limit_ms for s in (payload.get("active_sessions") or [])
+               if not s.get("overdue")]
+    if not pending:
+        return None
+    # `overdue` compares whole elapsed seconds, so it flips one second after the limit
+    return min(pending) / 1000 + 1
+
+
+def _sse_status_stream(token: Optional[str], delta: bool = False, last_event_id: Optional[str] = None):
+    """
+    SSE stream generator for real-time status updates.
+    With `delta`, sends a snapshot event and then JSON-patch events; a client
+    resumes from `last_event_id` or resyncs by reconnecting without one.
+    """
+    from app import db, get_current_user_id, status_broadcaster as broadcaster
+    from services.broadcaster import Subscription
+
     # Capture user_id at start of stream
     user_id = get_current_user_id(token)
+    if broadcaster is None:
+        return jsonify(ok=False, message="Status stream unavailable"), 503
+    # The stream keeps its app context open for hours; return any connection
+    # the token lookup checked out so idle displays don't pin the pool
+    db.session.remove()
 
     def stream():
-        last_sig = None
-        last_heartbeat = 0.0
-
-        # Hint to EventSource clients how quickly to retry
-        yield "retry: 3000\n\n"
-
-        while True:
-            # Reset transaction to see updates from other requests
-            try:
-                db.session.rollback()
-            except Exception:
-                pass
-
-            payload = _build_status_payload(user_id)
-            sig = _build_status_signature(payload)
-
-            now = time.time()
-            if sig != last_sig:
-                yield f"data: {json.dumps(payload)}\n\n"
-                last_sig = sig
-                last_heartbeat = now
-            elif now - last_heartbeat > 15:
-                # Keep-alive comment so proxies don't buffer/timeout
-                yield ": ping\n\n"
-                last_heartbeat = now
-
-            time.sleep(0.5)
+        # Frames are built once per tenant by the shared broadcaster pump
+        sub = broadcaster.subscribe(user_id, Subscription(user_id, delta=delta))
+        event_id = last_event_id
+        try:
+            # Hint to EventSource clients how quickly to retry
+            yield "retry: 3000\n\n"
+
+            while True:
+                frame = sub.get(timeout=15)
+                if frame is not None and delta:
+                    frames, event_id = broadcaster.resume(user_id, event_id)
+                    if frames:
+                        yield "".join(frames)
+                elif frame is not None:
+                    yield frame
+                else:
+                    # Keep-alive comment so proxies don't buffer/timeout
+                    yield ": ping\n\n"
+        finally:
+            broadcaster.unsubscribe(sub)
 
     resp = Response(stream_with_context(stream()), mimetype="text/event-stream")
     resp.headers["Cache-Control"] = "no-cache"
@@ -166,159 +182,300 @@ def _sse_status_stream(token: Optional[str]):
 @kiosk_bp.post("/api/scan")
 def api_scan():
     """Main scan endpoint - handles student check-in/check-out"""
-    from app import (db, Student, Session, Queue, get_current_user_id, get_settings,
-                     get_student_name, get_memory_roster, is_student_banned, 
-                     set_student_banned, get_open_sessions, now_utc)
+    from app import (db, get_current_user_id, get_settings, classroom_state_service, now_utc,
+                     notify_status_change)
+    
+    payload = request.get_json(silent=True) or {}
+    token = payload.get("token")
+    user_id = get_current_user_id(token)
+
+    if classroom_state_service is None:
+        return jsonify(ok=False, message="Service unavailable"), 503
+
+    # Suspended kiosks and unknown codes are rejected from cached settings and
+    # the roster membership set, before any lock or query
+    rejected = _reject_scan(get_settings(user_id), payload.get("code"), user_id)
+    if rejected:
+        body, status = rejected
+        return jsonify(**body), status
+
+    # One transaction per scan, holding the tenant lock in this process and in
+    # the database, so concurrent kiosks (in any worker) never decide on the
+    # same snapshot. Open sessions and queue are re-read under the lock.
+    with classroom_state_service.transaction(user_id) as state:
+        body, status, changed = _apply_scan(state, payload.get("code"), user_id, now_utc())
+        if changed:
+            db.session.commit()
+    if changed:
+        notify_status_change(user_id, reload_state=False)
+    return jsonify(**body), status
+
+
+# Most events accepted by one /api/scan/batch request
+MAX_SCAN_BATCH = 200
+# Oldest client_ts honoured for a buffered scan; older events are applied at this age
+MAX_SCAN_BACKLOG_SECONDS = 12 * 3600
+
+
+@kiosk_bp.post("/api/scan/batch")
+def api_scan_batch():
+    """
+    Apply an ordered list of buffered scans ({code, client_ts}) for one token.
+
+    Events run through the same scan logic, in order, inside one transaction,
+    so each event sees the effect of the ones before it. client_ts (epoch ms)
+    dates the session start/end; it is clamped to be monotonic, not in the
+    future and not older than MAX_SCAN_BACKLOG_SECONDS. Returns one result per event.
+    """
+    from app import db, get_current_user_id, classroom_state_service, now_utc, notify_status_change
     
     payload = request.get_json(silent=True) or {}
     token = payload.get("token")
+    events = payload.get("events")
     user_id = get_current_user_id(token)
 
+    if classroom_state_service is None:
+        return jsonify(ok=False, message="Service unavailable"), 503
+    if not isinstance(events, list):
+        return jsonify(ok=False, message="events must be a list"), 400
+    if len(events) > MAX_SCAN_BATCH:
+        return jsonify(ok=False, message=f"Too many events (max {MAX_SCAN_BATCH})"), 413
+
+    results = []
+    changed = False
+    with classroom_state_service.transaction(user_id) as state:
+        now = now_utc()
+        floor = now - timedelta(seconds=MAX_SCAN_BACKLOG_SECONDS)
+        for event in events:
+            event = event if isinstance(event, dict) else {}
+            event_ts = _event_time(event.get("client_ts"), floor, now)
+            floor = event_ts  # Keep event times monotonic
+            body, status, event_changed = _apply_scan(state, event.get("code"), user_id, event_ts)
+            changed = changed or event_changed
+            results.append(dict(body, code=event.get("code"), status=status))
+        if changed:
+            db.session.commit()
+    if changed:
+        notify_status_change(user_id, reload_state=False)
+    return jsonify(ok=True, results=results)
+
+
+def _event_time(client_ts: Any, floor: datetime, now: datetime) -> datetime:
+    """Clamp a client epoch-ms timestamp into [floor, now]"""
+    try:
+        ts = datetime.fromtimestamp(float(client_ts) / 1000, tz=timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return now
+    return min(max(ts, floor), now)
+
+
+def _reject_scan(settings: Dict[str, Any], code: Any, user_id: Optional[int]):
+    """Read-only checks that refuse a scan outright; returns (body, http_status) or None"""
+    from app import get_student_name, get_roster_size
+
     # Check if kiosk is suspended
-    settings = get_settings(user_id)
     if settings["kiosk_suspended"]:
-        return jsonify(ok=False, message="Kiosk is currently suspended by administrator"), 403
+        return dict(ok=False, message="Kiosk is currently suspended by administrator"), 403
     
-    code = (payload.get("code") or "").strip()
+    code = str(code or "").strip()
     if not code:
-        return jsonify(ok=False, message="No code scanned"), 400
+        return dict(ok=False, message="No code scanned"), 400
 
-    # Look up student name from encrypted database
+    # Look up student name (unknown codes never reach the database, see RosterService)
     student_name = get_student_name(code, user_id=user_id)
     
     if student_name == "Student":  # Default fallback means student not found
         # Check if roster is actually empty
-        if len(get_memory_roster(user_id)) == 0:
-            return jsonify(ok=False, message="Roster empty. Please upload student list."), 404
+        if get_roster_size(user_id) == 0:
+            return dict(ok=False, message="Roster empty. Please upload student list."), 404
         else:
-            return jsonify(ok=False, message=f"Incorrect ID: {code}"), 404
+            return dict(ok=False, message=f"Incorrect ID: {code}"), 404
+    return None
+
+
+def _apply_scan(state, code: Any, user_id: Optional[int], now: datetime):
+    """
+    Decide and apply one scan at time `now`; caller holds the tenant lock
+    (see ClassroomStateService.transaction) and commits.
+
+    Writes are flushed, not committed, and applied to `state` right away so the
+    next scan in the same transaction sees them. Returns (body, http_status, changed).
+    """
+    from app import (db, Student, Session, Queue, ban_service, classroom_state_service,
+                     get_student_name, record_session_start, record_session_end)
+    from services.classroom_state import OpenSession
+
+    settings = state.settings
+    rejected = _reject_scan(settings, code, user_id)
+    if rejected:
+        body, status = rejected
+        return body, status, False
+
+    code = str(code).strip()
+    student_name = get_student_name(code, user_id=user_id)
     
     # Ensure minimal Student record exists for foreign key constraint
-    if not Student.query.get(code):
-        anonymous_student = Student(id=code, name=f"Anonymous_{code}", user_id=user_id)
-        db.session.add(anonymous_student)
-        db.session.commit()
-
-    open_sessions = get_open_sessions(user_id)
+    # (added to this scan's transaction, committed with the session/queue write)
+    if code not in state.known_students:
+        if not Student.query.get(code):
+            anonymous_student = Student(id=code, name=f"Anonymous_{code}", user_id=user_id)
+            db.session.add(anonymous_student)
+        state.known_students.add(code)
 
     # If this student currently holds the pass, end their session
-    for s in open_sessions:
-        if s.student_id == code:
-            # Check if student is overdue and auto-ban is enabled
-            action = "ended"
-            msg = None
-            if settings.get("auto_ban_overdue", False):
-                overdue_seconds = settings["overdue_minutes"] * 60
-                if s.duration_seconds > overdue_seconds:
-                    # Auto-ban this student for being overdue
-                    if not is_student_banned(code, user_id=user_id):
-                        set_student_banned(code, True, user_id=user_id)
-                        print(f"AUTO-BAN ON SCAN-BACK: {student_name} ({code}) was overdue {round(s.duration_seconds / 60, 1)} minutes")
-                        action = "ended_banned"
-                        msg = "PASSED RETURNED LATE - AUTO BANNED"
-            
-            # End the session
-            s.end_ts = now_utc()
-            s.ended_by = "kiosk_scan"
-            db.session.commit()
-            
-            # AUTO-PROMOTE LOGIC
-            next_student_name = None
-            if settings.get("enable_queue") and settings.get("auto_promote_queue"):
-                # Check for next student
-                next_in_line = Queue.query.filter_by(user_id=user_id).order_by(Queue.joined_ts.asc()).first()
-                if next_in_line:
-                    # Promote them!
-                    next_code = next_in_line.student_id
-                    
-                    promoted_sess = Session(student_id=next_code, start_ts=now_utc(), room=settings["room_name"], user_id=user_id, ended_by="auto")
-                    db.session.add(promoted_sess)
-                    db.session.delete(next_in_line)
-                    db.session.commit()
-                    
-                    next_student_name = get_student_name(next_code, "Student", user_id=user_id)
-                    action = "ended_auto_started"
-            
-            return jsonify(ok=True, action=action, message=msg, name=student_name, next_student=next_student_name)
+    s = state.find_session(code)
+    if s:
+        end_ts = max(now, s.start_ts)
+        duration_seconds = int((end_ts - s.start_ts).total_seconds())
+        # Check if student is overdue and auto-ban is enabled
+        action = "ended"
+        msg = None
+        if settings.get("auto_ban_overdue", False):
+            overdue_seconds = settings["overdue_minutes"] * 60
+            if duration_seconds > overdue_seconds:
+                # Auto-ban this student for being overdue (usually the overdue
+                # scheduler already did at the deadline; still tell the student)
+                if not classroom_state_service.is_banned(state, code):
+                    ban_service.set_student_banned(user_id, code, True, commit=False)
+                    print(f"AUTO-BAN ON SCAN-BACK: {student_name} ({code}) was overdue {round(duration_seconds / 60, 1)} minutes")
+                action = "ended_banned"
+                msg = "PASSED RETURNED LATE - AUTO BANNED"
+        
+        # End the session
+        Session.query.filter_by(id=s.id).update({"end_ts": end_ts, "ended_by": "kiosk_scan"})
+        record_session_end(user_id, code, s.start_ts, end_ts)
+        state.end_session(s.id)
+        
+        # AUTO-PROMOTE LOGIC
+        next_student_name = None
+        if settings.get("enable_queue") and settings.get("auto_promote_queue"):
+            # Check for next student
+            if state.queue:
+                # Promote them!
+                next_code = state.queue[0]
+                
+                promoted_sess = Session(student_id=next_code, start_ts=end_ts, room=settings["room_name"], user_id=user_id, ended_by="auto")
+                db.session.add(promoted_sess)
+                Queue.query.filter_by(user_id=user_id, student_id=next_code).delete()
+                db.session.flush()  # Assign the id without a post-commit reload
+                record_session_start(user_id, next_code, end_ts)
+                state.queue_remove(next_code)
+                state.add_session(OpenSession(promoted_sess.id, next_code, end_ts))
+                
+                next_student_name = get_student_name(next_code, "Student", user_id=user_id)
+                action = "ended_auto_started"
+        
+        return dict(ok=True, action=action, message=msg, name=student_name, next_student=next_student_name), 200, True
     
     # Check if student is banned from starting NEW restroom trips
-    if is_student_banned(code, user_id=user_id):
-        return jsonify(ok=False, action="banned", message="RESTROOM PRIVILEGES SUSPENDED - SEE TEACHER", name=student_name), 403
+    if classroom_state_service.is_banned(state, code):
+        return dict(ok=False, action="banned", message="RESTROOM PRIVILEGES SUSPENDED - SEE TEACHER", name=student_name), 403, False
 
     # QUEUE SELF-REMOVAL LOGIC (NEW FEATURE)
     # Allow students to remove themselves from queue by scanning again
-    existing_queue_entry = Queue.query.filter_by(user_id=user_id, student_id=code).first()
-    if existing_queue_entry:
-        db.session.delete(existing_queue_entry)
-        db.session.commit()
-        return jsonify(ok=True, action="left_queue", message="Removed from waitlist", name=student_name)
+    if code in state.queue:
+        Queue.query.filter_by(user_id=user_id, student_id=code).delete()
+        state.queue_remove(code)
+        return dict(ok=True, action="left_queue", message="Removed from waitlist", name=student_name), 200, True
 
     # QUEUE LOCK LOGIC
-    queue_count = Queue.query.filter_by(user_id=user_id).count()
-    if queue_count > 0:
-        top_spot = Queue.query.filter_by(user_id=user_id).order_by(Queue.joined_ts.asc()).first()
-        if top_spot.student_id != code:
-             # Scanner is NOT the top spot - new student trying to join
-             if settings.get("enable_queue"):
-                 q = Queue(student_id=code, user_id=user_id)
-                 db.session.add(q)
-                 db.session.commit()
-                 return jsonify(ok=True, action="queued", message="Added to Waitlist (Queue is active)")
-             else:
-                 return jsonify(ok=False, action="denied", message="Waitlist is active. Cannot start."), 409
+    # (The scanner is never in the queue here, so it is never the top spot)
+    if state.queue:
+        # Scanner is NOT the top spot - new student trying to join
+        if settings.get("enable_queue"):
+            db.session.add(Queue(student_id=code, user_id=user_id, joined_ts=now))
+            state.queue_append(code)
+            return dict(ok=True, action="queued", message="Added to Waitlist (Queue is active)"), 200, True
         else:
-            # Scanner IS the top spot. Allow and REMOVE from queue.
-            db.session.delete(top_spot)
-
+            return dict(ok=False, action="denied", message="Waitlist is active. Cannot start."), 409, False
 
     # CAPACITY CHECK & START
-    if len(open_sessions) >= settings["capacity"]:
-         # Queue Prompt / Auto-Join
-         existing_q = Queue.query.filter_by(user_id=user_id, student_id=code).first()
-         if existing_q:
-              return jsonify(ok=False, action="denied_queue_position", message="You are in the waitlist."), 409
-         
-         if settings.get("enable_queue"):
-             # Auto-Join Queue
-             q = Queue(student_id=code, user_id=user_id)
-             db.session.add(q)
-             db.session.commit()
-             return jsonify(ok=True, action="queued", message="Added to Waitlist")
-         else:
-             # Queue Disabled - Deny
-             return jsonify(ok=False, action="denied", message="Pass limit reached."), 409
+    if len(state.open_sessions) >= settings["capacity"]:
+        # Queue Prompt / Auto-Join
+        if settings.get("enable_queue"):
+            # Auto-Join Queue
+            db.session.add(Queue(student_id=code, user_id=user_id, joined_ts=now))
+            state.queue_append(code)
+            return dict(ok=True, action="queued", message="Added to Waitlist"), 200, True
+        else:
+            # Queue Disabled - Deny
+            return dict(ok=False, action="denied", message="Pass limit reached."), 409, False
 
     # Otherwise start a new session
-    Queue.query.filter_by(user_id=user_id, student_id=code).delete()
-    
-    sess = Session(student_id=code, start_ts=now_utc(), room=settings["room_name"], user_id=user_id)
+    sess = Session(student_id=code, start_ts=now, room=settings["room_name"], user_id=user_id)
     db.session.add(sess)
-    db.session.commit()
-    return jsonify(ok=True, action="started", name=student_name)
+    db.session.flush()  # Assign the id without a post-commit reload
+    record_session_start(user_id, code, now)
+    state.add_session(OpenSession(sess.id, code, now))
+    return dict(ok=True, action="started", name=student_name), 200, True
+
+
+# Longest a `wait=` long-poll may hold a request before answering 304
+MAX_STATUS_WAIT_SECONDS = 25.0
 
 
 @kiosk_bp.get("/api/status")
 def api_status():
-    """Get current kiosk status"""
-    from app import get_current_user_id
+    """
+    Get current kiosk status.
+
+    Responses carry an ETag of the encoded status. A matching
+    If-None-Match is answered with 304; with `wait=<seconds>` the request is
+    held until the status changes or the wait runs out (long-poll).
+    """
+    from app import db, get_current_user_id, status_broadcaster as broadcaster
     
     token = request.args.get('token')
     user_id = get_current_user_id(token)
-    return jsonify(_build_status_payload(user_id))
+    if broadcaster is None:
+        return jsonify(server_time_ms=int(time.time() * 1000), **_build_status_payload(user_id))
+
+    # Encoded once per revision and shared with the SSE pump; the ETag hashes
+    # these bytes, so it matches across workers and only the clock is per response
+    revision, body, etag = broadcaster.status_body(user_id)
+    if request.if_none_match.contains(etag):
+        try:
+            wait = min(max(float(request.args.get("wait", 0)), 0.0), MAX_STATUS_WAIT_SECONDS)
+        except ValueError:
+            wait = 0.0
+        end = time.time() + wait
+        # A new revision with the same bytes (an unrelated write, a resync) keeps waiting
+        while request.if_none_match.contains(etag) and time.time() < end:
+            # Hand the DB connection back to the pool while we wait
+            db.session.rollback()
+            broadcaster.wait_for_change(user_id, revision, end - time.time())
+            revision, body, etag = broadcaster.status_body(user_id)
+
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+            resp.set_etag(etag)
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp
+
+    resp = Response(stamp_server_time(body), mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+def _stream_args():
+    """(token, delta, last_event_id) from an SSE request"""
+    delta = request.args.get("delta", "").lower() in ("1", "true", "yes")
+    # EventSource sends Last-Event-ID on reconnect; the query form is for clients that can't set headers
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    return request.args.get("token"), delta, last_event_id
 
 
 @kiosk_bp.get("/api/stream")
 def api_stream():
-    """SSE stream for real-time status updates"""
-    token = request.args.get("token")
-    return _sse_status_stream(token)
+    """SSE stream for real-time status updates (?delta=1 for snapshot + JSON-patch events)"""
+    return _sse_status_stream(*_stream_args())
 
 
 @kiosk_bp.get("/events")
 def sse_events():
     """Backwards-compatible alias for SSE stream"""
-    token = request.args.get("token")
-    return _sse_status_stream(token)
+    return _sse_status_stream(*_stream_args())
 
 
 # ============================================================================
@@ -328,7 +485,7 @@ def sse_events():
 @kiosk_bp.route("/api/queue/join", methods=["POST"])
 def api_queue_join():
     """Student joins queue"""
-    from app import db, Queue, get_current_user_id
+    from app import db, Queue, get_current_user_id, classroom_state_service, notify_status_change
     
     payload = request.get_json(silent=True) or {}
     token = payload.get("token")
@@ -338,35 +495,41 @@ def api_queue_join():
     if not code: 
         return jsonify(ok=False), 400
     
-    # Check if already in queue
-    if Queue.query.filter_by(user_id=user_id, student_id=code).first():
-        return jsonify(ok=True, message="Already in queue")
-        
-    q = Queue(student_id=code, user_id=user_id)
-    db.session.add(q)
-    db.session.commit()
+    with classroom_state_service.locked(user_id) as state:
+        # Check if already in queue
+        if code in state.queue:
+            return jsonify(ok=True, message="Already in queue")
+            
+        q = Queue(student_id=code, user_id=user_id)
+        db.session.add(q)
+        db.session.commit()
+        state.queue_append(code)
+    notify_status_change(user_id, reload_state=False)
     return jsonify(ok=True)
 
 
 @kiosk_bp.route("/api/queue/leave", methods=["POST"])
 def api_queue_leave():
     """Student leaves queue"""
-    from app import db, Queue, get_current_user_id
+    from app import db, Queue, get_current_user_id, classroom_state_service, notify_status_change
     
     payload = request.get_json(silent=True) or {}
     token = payload.get("token")
     code = payload.get("code")
     user_id = get_current_user_id(token)
 
-    Queue.query.filter_by(user_id=user_id, student_id=code).delete()
-    db.session.commit()
+    with classroom_state_service.locked(user_id) as state:
+        Queue.query.filter_by(user_id=user_id, student_id=code).delete()
+        db.session.commit()
+        state.queue_remove(code)
+    notify_status_change(user_id, reload_state=False)
     return jsonify(ok=True)
 
 
 @kiosk_bp.route("/api/queue/delete", methods=["POST"])
 def api_queue_delete():
     """Admin removes student from queue"""
-    from app import db, Queue, get_current_user_id
+    from app import db, Queue, get_current_user_id, classroom_state_service, notify_status_change
     from functools import wraps
     from flask import session
     
@@ -388,8 +551,11 @@ def api_queue_delete():
         if not student_id:
             return jsonify(ok=False, error="Missing student_id"), 400
 
-        Queue.query.filter_by(user_id=user_id, student_id=student_id).delete()
-        db.session.commit()
+        with classroom_state_service.locked(user_id) as state:
+            Queue.query.filter_by(user_id=user_id, student_id=student_id).delete()
+            db.session.commit()
+            state.queue_remove(student_id)
+        notify_status_change(user_id, reload_state=False)
         return jsonify(ok=True)
     
     return _delete()
@@ -398,7 +564,7 @@ def api_queue_delete():
 @kiosk_bp.route("/api/queue/reorder", methods=["POST"])
 def api_queue_reorder():
     """Admin reorders the queue"""
-    from app import db, Queue, get_current_user_id, now_utc
+    from app import db, Queue, get_current_user_id, now_utc, notify_status_change
     from functools import wraps
     from flask import session
     
@@ -431,6 +597,7 @@ def api_queue_reorder():
                 queue_map[student_id].joined_ts = base_time + timedelta(seconds=i)
                 
         db.session.commit()
+        notify_status_change(user_id)
         return jsonify(ok=True, message="Queue reordered")
     
     return _reorder()
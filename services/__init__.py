@@ -2,5 +2,22 @@
 from .roster import RosterService
 from .ban import BanService
 from .session import SessionService
+from .broadcaster import StatusBroadcaster
+from .classroom_state import ClassroomStateService
+from .token_cache import TokenResolver
+from .roster_cache import RosterCache
+from .cache_backend import LocalCacheBackend, SharedFileCacheBackend, create_cache_backend
+from .change_bus import LocalChangeBus, SocketChangeBus, PostgresChangeBus, create_change_bus
+from .settings_cache import SettingsCache
+from .overdue_scheduler import OverdueScheduler
+from .rollup import RollupService
+from .analytics import AnalyticsService
+from .gevent_mode import enable_cooperative_db, pool_options, check_worker_driver, gevent_stats
 
-__all__ = ['RosterService', 'BanService', 'SessionService']
+__all__ = ['RosterService', 'BanService', 'SessionService', 'StatusBroadcaster',
+           'ClassroomStateService', 'TokenResolver', 'RosterCache',
+           'SettingsCache', 'OverdueScheduler', 'RollupService',
+           'AnalyticsService', 'LocalCacheBackend', 'SharedFileCacheBackend',
+           'create_cache_backend', 'LocalChangeBus', 'SocketChangeBus',
+           'PostgresChangeBus', 'create_change_bus', 'enable_cooperative_db',
+           'pool_options', 'check_worker_driver', 'gevent_stats']
@@ -0,0 +1,106 @@
+"""
+Analytics Service: Grouping, overdue classification and top-N ranking in SQL
+The stats endpoints used to load every session in their window and aggregate in
+Python. These queries group the per-student rollups (plus open sessions that are
+already overdue) in the database and return only the ranked rows, so endpoints
+resolve names for a handful of student IDs. Portable across SQLite and Postgres.
+"""
+from typing import Dict, List, Optional, Any
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import Float, case, cast, func, literal, select, union_all
+
+
+class AnalyticsService:
+    # Ranking keys for top_students(); ties break on the other counts, then student_id
+    ORDERS = ("count", "overdue", "overdue_rate")
+
+    def __init__(self, db, session_model, student_rollup_model, tz):
+        """
+        Initialize AnalyticsService.
+
+        Args:
+            db: SQLAlchemy database instance
+            session_model: Session model class
+            student_rollup_model: StudentRollup model class
+            tz: Local timezone the rollup dates are in
+        """
+        self.db = db
+        self.Session = session_model
+        self.StudentRollup = student_rollup_model
+        self.tz = tz
+
+    def top_students(self, user_id: Optional[int], since: date, overdue_seconds: int,
+                     order: str = "count", limit: int = 10,
+                     now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Rank students by sessions started on/after local date `since`.
+
+        Ended sessions carry their overdue flag in the rollups; open sessions are
+        classified here (now - start_ts > overdue interval). Returns up to `limit`
+        dicts with student_id, count, overdue and overdue_rate.
+        """
+        if order not in self.ORDERS:
+            raise ValueError(f"Unknown order: {order}")
+        totals = self._student_totals(user_id, since, overdue_seconds, now)
+        keys = {
+            "count": (totals.c.count.desc(), totals.c.overdue.desc()),
+            "overdue": (totals.c.overdue.desc(), totals.c.count.desc()),
+            "overdue_rate": (totals.c.overdue_rate.desc(), totals.c.overdue.desc()),
+        }[order]
+        rows = self.db.session.execute(
+            select(totals).order_by(*keys, totals.c.student_id).limit(limit)
+        ).all()
+        return [
+            {
+                "student_id": row.student_id,
+                "count": int(row.count or 0),
+                "overdue": int(row.overdue or 0),
+                "overdue_rate": float(row.overdue_rate or 0.0),
+            }
+            for row in rows
+        ]
+
+    def tenant_session_counts(self) -> Dict[Optional[int], Dict[str, int]]:
+        """{user_id: {"total", "active"}} for every tenant in one GROUP BY"""
+        S = self.Session
+        rows = self.db.session.query(
+            S.user_id,
+            func.count(S.id),
+            func.sum(case((S.end_ts.is_(None), 1), else_=0)),
+        ).group_by(S.user_id).all()
+        return {uid: {"total": int(total or 0), "active": int(active or 0)} for uid, total, active in rows}
+
+    def _student_totals(self, user_id: Optional[int], since: date, overdue_seconds: int,
+                        now: Optional[datetime]):
+        """Subquery: per-student count/overdue/overdue_rate since `since`"""
+        R, S = self.StudentRollup, self.Session
+        now = now or datetime.now(timezone.utc)
+        # Local midnight of `since` in UTC, so open sessions use the same window as local_date
+        since_utc = datetime.combine(since, datetime.min.time(), tzinfo=self.tz).astimezone(timezone.utc)
+        overdue_before = now - timedelta(seconds=overdue_seconds)
+
+        ended = select(
+            R.student_id.label("student_id"),
+            R.sessions.label("sessions"),
+            R.overdue.label("overdue"),
+        ).where(R.local_date >= since)
+        # Open sessions are already counted in `sessions`; add their overdue flag
+        running = select(
+            S.student_id.label("student_id"),
+            literal(0).label("sessions"),
+            literal(1).label("overdue"),
+        ).where(S.end_ts.is_(None), S.start_ts >= since_utc, S.start_ts < overdue_before)
+        if user_id is not None:
+            ended = ended.where(R.user_id == user_id)
+            running = running.where(S.user_id == user_id)
+
+        rows = union_all(ended, running).subquery()
+        count = func.sum(rows.c.sessions)
+        overdue = func.sum(rows.c.overdue)
+        return select(
+            rows.c.student_id,
+            count.label("count"),
+            overdue.label("overdue"),
+            case((count > 0, cast(overdue, Float) / count), else_=0.0).label("overdue_rate"),
+        ).group_by(rows.c.student_id).subquery()
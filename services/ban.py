@@ -1,36 +1,48 @@
 """
 Ban Service: Handles student ban management
 Refactored for 2.0 multi-tenancy with stateless user_id scoping
+
+Each tenant's banned name_hash values come from RosterService's cached roster
+(the same single query that loads names) and are updated in place by every
+ban/unban path, so ban checks cost no database work. The roster is reloaded
+when it changes or after `ttl` seconds (bans made by other workers).
 """
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set
 
 
 class BanService:
-    def __init__(self, db, student_name_model, roster_service):
+    def __init__(self, db, student_name_model, roster_service, ttl: float = 30.0):
         """
         Initialize BanService.
         """
         self.db = db
         self.StudentName = student_name_model
         self.roster_service = roster_service
+        self.ttl = ttl
+    
+    def banned_hashes(self, user_id: Optional[int]) -> Set[str]:
+        """The tenant's banned name_hash set, loading the roster if missing or stale"""
+        return self.roster_service.banned_hashes(user_id, max_age=self.ttl)
+    
+    def mark_banned(self, user_id: Optional[int], name_hash: str, banned: bool) -> None:
+        """Apply a ban/unban written by the caller to the in-memory set"""
+        self.roster_service.mark_banned(user_id, name_hash, banned)
+    
+    def invalidate(self, user_id: Optional[int]) -> None:
+        """Drop the tenant's cached roster and banned set (reloaded on next check)"""
+        self.roster_service.invalidate_roster(user_id)
     
     def is_student_banned(self, user_id: Optional[int], student_id: str) -> bool:
         """Check if a student is banned from using the restroom"""
         try:
             name_hash = self.roster_service._hash_student_id(student_id, user_id)
-            
-            # Build query with optional user_id scoping
-            query = self.StudentName.query.filter_by(name_hash=name_hash)
-            if user_id is not None:
-                query = query.filter_by(user_id=user_id)
-            
-            student_name = query.first()
-            return student_name.banned if student_name else False
+            return self.roster_service.is_banned(user_id, name_hash, max_age=self.ttl)
         except Exception:
             return False
     
-    def set_student_banned(self, user_id: Optional[int], student_id: str, banned_status: bool) -> bool:
-        """Ban or unban a student from using the restroom"""
+    def set_student_banned(self, user_id: Optional[int], student_id: str, banned_status: bool,
+                           commit: bool = True) -> bool:
+        """Ban or unban a student from using the restroom (commit=False leaves it to the caller's transaction)"""
         try:
             from datetime import datetime, timezone
             name_hash = self.roster_service._hash_student_id(student_id, user_id)
@@ -40,24 +52,52 @@ class BanService:
             if user_id is not None:
                 query = query.filter_by(user_id=user_id)
             
-            student_name = query.first()
-            if student_name:
-                student_name.banned = banned_status
-                # Set timestamp when banning, clear when unbanning
-                if banned_status:
-                    student_name.banned_since = datetime.now(timezone.utc)
-                else:
-                    student_name.banned_since = None
-                self.db.session.commit()
+            # Single UPDATE; set timestamp when banning, clear when unbanning
+            updated = query.update({
+                "banned": banned_status,
+                "banned_since": datetime.now(timezone.utc) if banned_status else None,
+            }, synchronize_session=False)
+            if updated:
+                if commit:
+                    self.db.session.commit()
+                self.mark_banned(user_id, name_hash, banned_status)
                 return True
             return False
         except Exception:
+            if not commit:
+                raise
             try:
                 self.db.session.rollback()
             except Exception:
                 pass
             return False
     
+    def ban_many(self, user_id: Optional[int], student_ids: List[str]) -> int:
+        """Ban several students with one UPDATE (skips those already banned), returns how many it banned"""
+        from datetime import datetime, timezone
+        banned = self.banned_hashes(user_id)
+        hashes = {self.roster_service._hash_student_id(sid, user_id) for sid in student_ids} - banned
+        if not hashes:
+            return 0
+        try:
+            # Only rows not banned yet: when several workers fire the same deadline
+            # one of them bans, the others update nothing (banned_since is kept)
+            query = self.StudentName.query.filter(self.StudentName.name_hash.in_(hashes),
+                                                  self.StudentName.banned.isnot(True))
+            if user_id is not None:
+                query = query.filter_by(user_id=user_id)
+            count = query.update({
+                "banned": True,
+                "banned_since": datetime.now(timezone.utc),
+            }, synchronize_session=False)
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            return 0
+        # Patch the whole batch, then share the roster with other workers once
+        self.roster_service.mark_many_banned(user_id, hashes, True)
+        return count
+    
     def get_overdue_students(self, user_id: Optional[int], open_sessions: list, overdue_minutes: int) -> List[Dict[str, Any]]:
         """Get list of students who are currently overdue"""
         try:
@@ -95,15 +135,12 @@ class BanService:
         """Automatically ban students who are currently overdue"""
         try:
             overdue_list = self.get_overdue_students(user_id, open_sessions, overdue_minutes)
-            banned_count = 0
-            banned_students = []
+            to_ban = [student for student in overdue_list if not student['banned']]
+            if not to_ban:
+                return {'count': 0, 'students': []}
             
-            for student in overdue_list:
-                if not student['banned']:
-                    success = self.set_student_banned(user_id, student['student_id'], True)
-                    if success:
-                        banned_count += 1
-                        banned_students.append(student['name'])
+            banned_count = self.ban_many(user_id, [student['student_id'] for student in to_ban])
+            banned_students = [student['name'] for student in to_ban] if banned_count else []
             
             return {'count': banned_count, 'students': banned_students}
         except Exception:
@@ -0,0 +1,417 @@
+"""
+Status Broadcaster: Shares one status pump per tenant across all SSE streams
+Every connected Kiosk/Display for a user_id subscribes to the same channel, so the
+status payload is built once per change and the encoded frame is fanned out.
+
+Pumps are change-driven: mutating routes call bump() to advance the tenant's
+revision, and a pump only rebuilds after a bump or when the next session is due
+to turn overdue. The same revision backs the /api/status long-poll.
+
+Delta subscribers (?delta=1) get a snapshot once and then RFC 6902 patches,
+each tagged with the event id of the state it applies to. The pump diffs and
+encodes once per change; a client that reconnects with Last-Event-ID is
+replayed the patches it missed, or sent a fresh snapshot if they are gone.
+
+Each revision's payload is encoded at most once (status_body), and the same
+bytes back /api/status and the SSE frames. Payloads carry no clock, so the
+bytes only change with real state; server_time_ms is stamped on when served.
+The /api/status ETag is a hash of those bytes, so every worker showing the
+same state gives the same ETag and a poll that lands on another worker still
+gets its 304.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import deque
+import hashlib
+import secrets
+import threading
+import time
+
+from services import json_patch
+from services.status_encoder import Encoder, create_status_encoder, stamp_server_time
+
+# Patches kept per tenant for clients resuming with Last-Event-ID
+PATCH_HISTORY = 32
+# A replayed patch older than this gets its server_time_ms refreshed
+RESTAMP_AFTER_MS = 1000
+# Pushed to delta subscriptions instead of a frame: "call resume()"
+CHANGED = "changed"
+
+
+class Subscription:
+    """A single SSE client's mailbox of pending frames"""
+
+    def __init__(self, user_id: Optional[int], max_backlog: int = 16, delta: bool = False):
+        self.user_id = user_id
+        # Delta clients are woken with CHANGED and pull frames via resume()
+        self.delta = delta
+        self._frames = deque()
+        self._max_backlog = max_backlog
+        self._cond = threading.Condition()
+        self.closed = False
+
+    def push(self, frame: str) -> None:
+        """Queue a frame; a slow client only keeps the newest snapshot"""
+        with self._cond:
+            if len(self._frames) >= self._max_backlog:
+                self._frames.clear()
+            self._frames.append(frame)
+            self._cond.notify()
+
+    def get(self, timeout: float) -> Optional[str]:
+        """Wait for the next frame, returns None on timeout"""
+        with self._cond:
+            if not self._frames and not self.closed:
+                self._cond.wait(timeout)
+            if self._frames:
+                return self._frames.popleft()
+            return None
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class _Revision:
+    """Revision counter plus the moments it must advance on its own"""
+
+    def __init__(self):
+        self.value = 0
+        self.changed_at = time.time()
+        # Epoch seconds when the last built payload turns stale (next overdue flip)
+        self.deadline: Optional[float] = None
+        # Newest payload built for this tenant, the revision it was built at,
+        # and its encoding and ETag (made on first use)
+        self.payload: Optional[Dict[str, Any]] = None
+        self.payload_revision: Optional[int] = None
+        self.body: Optional[bytes] = None
+        self.etag: Optional[str] = None
+
+
+class _TenantChannel:
+    """Subscribers and pump state for one user_id"""
+
+    def __init__(self, user_id: Optional[int]):
+        self.user_id = user_id
+        self.subscribers = set()
+        self.last_payload: Optional[Dict[str, Any]] = None
+        self.last_sig: Any = None
+        # Event id of last_payload, when it was published, its unstamped
+        # encoding and its live frames (built on first use)
+        self.event_id: Optional[str] = None
+        self.revision: Optional[int] = None
+        self.published_ms = 0
+        self.body: Optional[bytes] = None
+        self.frames: Dict[str, str] = {}
+        # (base event id, patch frame, patch document) for the most recent changes
+        self.patches = deque(maxlen=PATCH_HISTORY)
+        self.stop = threading.Event()
+        self.wake = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+
+class StatusBroadcaster:
+    def __init__(self, app, db, build_payload: Callable[[Optional[int]], Dict[str, Any]],
+                 build_signature: Callable[[Dict[str, Any]], Any],
+                 next_deadline: Callable[[Dict[str, Any]], Optional[float]],
+                 resync_interval: float = 30.0, encode: Optional[Encoder] = None):
+        """
+        Initialize StatusBroadcaster.
+
+        Args:
+            app: Flask app (pump threads run inside its app context)
+            db: SQLAlchemy database instance
+            build_payload: Builds the status payload for a user_id
+            build_signature: Reduces a payload to the fields that matter for change detection
+            next_deadline: Epoch seconds when a payload next changes on its own (overdue), or None
+            resync_interval: Max seconds a pump sleeps without a bump (catches writes from other workers)
+            encode: Payload -> JSON bytes (see services.status_encoder)
+        """
+        self.app = app
+        self.db = db
+        self.build_payload = build_payload
+        self.build_signature = build_signature
+        self.next_deadline = next_deadline
+        self.resync_interval = resync_interval
+        self.encode = encode or create_status_encoder("json")
+        self._channels: Dict[Optional[int], _TenantChannel] = {}
+        # Per-tenant monotonic revision, advanced by every mutating route
+        self._revisions: Dict[Optional[int], _Revision] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # Revisions are per process, so SSE event ids carry the process identity too
+        self.instance_id = secrets.token_hex(4)
+        # Counters for benchmarks and dev stats
+        self.builds = 0
+        self.frames_sent = 0
+        self.encodes = 0
+        self.body_hits = 0
+
+    def subscribe(self, user_id: Optional[int], sub: Optional[Subscription] = None) -> Subscription:
+        """
+        Attach a new client (or a caller-built mailbox) to the tenant channel,
+        starting its pump if needed. Delta mailboxes are woken with CHANGED.
+        """
+        sub = sub or Subscription(user_id)
+        with self._lock:
+            channel = self._channels.get(user_id)
+            if channel is None:
+                channel = _TenantChannel(user_id)
+                self._channels[user_id] = channel
+                channel.thread = threading.Thread(
+                    target=self._pump, args=(channel,), daemon=True,
+                    name=f"status-pump-{user_id}"
+                )
+                channel.thread.start()
+            channel.subscribers.add(sub)
+            # Late joiners get the current snapshot without waiting for a rebuild
+            if channel.last_payload is not None:
+                sub.push(CHANGED if sub.delta else self._render(channel, "data", int(time.time() * 1000)))
+        return sub
+
+    def resume(self, user_id: Optional[int], last_event_id: Optional[str]) -> Tuple[List[str], Optional[str]]:
+        """
+        Delta frames that bring a client at `last_event_id` up to date, and
+        the event id they end at: nothing if it is current, the missed
+        patches if they are still in the history, else a snapshot.
+        """
+        with self._lock:
+            channel = self._channels.get(user_id)
+            if channel is None or channel.last_payload is None or last_event_id == channel.event_id:
+                return [], last_event_id
+            now_ms = int(time.time() * 1000)
+            patches = list(channel.patches)
+            for i, (base, _, _) in enumerate(patches):
+                if base == last_event_id:
+                    frames = [frame for _, frame, _ in patches[i:]]
+                    if now_ms - channel.published_ms > RESTAMP_AFTER_MS:
+                        # Catching up after a gap: the last patch carries the clock
+                        frames[-1] = self._patch_frame(channel.event_id, patches[-1][2], now_ms)
+                    return frames, channel.event_id
+            return [self._render(channel, "snapshot", now_ms)], channel.event_id
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        """Detach a client; the pump stops once its last subscriber leaves"""
+        sub.close()
+        with self._lock:
+            channel = self._channels.get(sub.user_id)
+            if channel is None:
+                return
+            channel.subscribers.discard(sub)
+            if not channel.subscribers:
+                channel.stop.set()
+                channel.wake.set()
+                del self._channels[sub.user_id]
+
+    def bump(self, user_id: Optional[int]) -> int:
+        """Advance the tenant's status revision and wake its pump"""
+        with self._lock:
+            revision = self._advance(user_id)
+            channel = self._channels.get(user_id)
+        if channel is not None:
+            channel.wake.set()
+        return revision
+
+    def revision(self, user_id: Optional[int]) -> int:
+        """Current status revision for a tenant"""
+        with self._lock:
+            return self._current(user_id)
+
+    def note_deadline(self, user_id: Optional[int], deadline: Optional[float]) -> None:
+        """Record when the payload just built for a tenant will change without a write"""
+        with self._lock:
+            self._revisions.setdefault(user_id, _Revision()).deadline = deadline
+
+    def wait_for_change(self, user_id: Optional[int], revision: int, timeout: float) -> int:
+        """Block until the tenant's revision differs from `revision` or timeout passes"""
+        end = time.time() + timeout
+        with self._lock:
+            while True:
+                current = self._current(user_id)
+                remaining = end - time.time()
+                if current != revision or remaining <= 0:
+                    return current
+                deadline = self._revisions[user_id].deadline
+                if deadline is not None:
+                    remaining = min(remaining, max(0.1, deadline - time.time()))
+                self._changed.wait(remaining)
+
+    def status_body(self, user_id: Optional[int]) -> Tuple[int, bytes, str]:
+        """
+        The tenant's current revision, its encoded status (without
+        server_time_ms) and that body's ETag, building and encoding it only if
+        this revision has not been seen yet. Call inside an app context.
+        """
+        with self._lock:
+            revision = self._current(user_id)
+            record = self._revisions[user_id]
+            if record.payload_revision == revision:
+                self.body_hits += 1
+                return revision, self._encoded(record), record.etag
+
+        # Read the revision before building, so the payload is at least as new as it
+        payload = self.build_payload(user_id)
+        self.builds += 1
+        deadline = self.next_deadline(payload)
+        with self._lock:
+            record = self._revisions[user_id]
+            if record.payload_revision is None or record.payload_revision <= revision:
+                record.payload, record.payload_revision, record.body = payload, revision, None
+                body, etag = self._encoded(record), record.etag
+            else:
+                body = self.encode(payload)
+                etag = self._body_etag(body)
+                self.encodes += 1
+        self.note_deadline(user_id, deadline)
+        return revision, body, etag
+
+    def _payload(self, user_id: Optional[int]) -> Dict[str, Any]:
+        # Reuse the payload a poll already built at the current revision
+        with self._lock:
+            revision = self._current(user_id)
+            record = self._revisions[user_id]
+            if record.payload_revision == revision:
+                return record.payload
+        payload = self.build_payload(user_id)
+        self.builds += 1
+        return payload
+
+    def _encoded(self, record: _Revision) -> bytes:
+        # Caller holds self._lock
+        if record.body is None:
+            record.body = self.encode(record.payload)
+            record.etag = self._body_etag(record.body)
+            self.encodes += 1
+        return record.body
+
+    @staticmethod
+    def _body_etag(body: bytes) -> str:
+        # Content-derived, so it is the same in every worker that has the same state
+        return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+    def _event_id(self, user_id: Optional[int], revision: int) -> str:
+        # SSE event ids name a state in this process's patch history; a resume
+        # on another worker doesn't find it and gets a snapshot
+        return f"{self.instance_id}-{user_id}-{revision}"
+
+    def _advance(self, user_id: Optional[int]) -> int:
+        # Caller holds self._lock
+        record = self._revisions.setdefault(user_id, _Revision())
+        record.value += 1
+        record.changed_at = time.time()
+        record.deadline = None
+        self._changed.notify_all()
+        return record.value
+
+    def _current(self, user_id: Optional[int]) -> int:
+        # Caller holds self._lock. Advances lazily past overdue deadlines, and
+        # after resync_interval so writes from other workers are picked up.
+        record = self._revisions.setdefault(user_id, _Revision())
+        now = time.time()
+        if (record.deadline is not None and now >= record.deadline) or \
+                now - record.changed_at > self.resync_interval:
+            return self._advance(user_id)
+        return record.value
+
+    def subscriber_count(self, user_id: Optional[int] = None) -> int:
+        """Number of connected clients (for one tenant, or all tenants)"""
+        with self._lock:
+            if user_id is not None:
+                channel = self._channels.get(user_id)
+                return len(channel.subscribers) if channel else 0
+            return sum(len(c.subscribers) for c in self._channels.values())
+
+    def channel_count(self) -> int:
+        with self._lock:
+            return len(self._channels)
+
+    def _frame(self, channel: _TenantChannel, kind: str) -> str:
+        # Caller holds self._lock. Live fan-out: built once per change and kind,
+        # stamped with the publish time.
+        frame = channel.frames.get(kind)
+        if frame is None:
+            frame = channel.frames[kind] = self._render(channel, kind, channel.published_ms)
+        return frame
+
+    def _render(self, channel: _TenantChannel, kind: str, server_time_ms: int) -> str:
+        # Caller holds self._lock. The body is encoded at most once per change.
+        if channel.body is None:
+            record = self._revisions[channel.user_id]
+            if record.payload_revision == channel.revision:
+                channel.body = self._encoded(record)
+            else:
+                channel.body = self.encode(channel.last_payload)  # Superseded by a newer poll build
+                self.encodes += 1
+        body = stamp_server_time(channel.body, server_time_ms).decode()
+        if kind == "data":
+            return f"data: {body}\n\n"
+        return f"id: {channel.event_id}\nevent: snapshot\ndata: {body}\n\n"
+
+    def _patch_frame(self, event_id: str, patch: Dict[str, Any], server_time_ms: Optional[int] = None) -> str:
+        if server_time_ms is not None:
+            # ops[0] is always the server_time_ms replace
+            patch = dict(patch, ops=[dict(patch["ops"][0], value=server_time_ms)] + patch["ops"][1:])
+        return f"id: {event_id}\nevent: patch\ndata: {self.encode(patch).decode()}\n\n"
+
+    def _publish(self, channel: _TenantChannel, payload: Dict[str, Any]) -> None:
+        # The previous payload's diff is taken outside the lock; only this pump writes it
+        ops = json_patch.diff(channel.last_payload, payload) if channel.last_payload is not None else None
+        with self._lock:
+            # Every published change gets its own revision, so event ids move
+            # even when an overdue flip had not advanced it yet
+            revision = self._current(channel.user_id)
+            if revision == channel.revision:
+                revision = self._advance(channel.user_id)
+            base = channel.event_id
+            channel.revision = revision
+            channel.event_id = self._event_id(channel.user_id, revision)
+            channel.last_payload = payload
+            channel.published_ms = int(time.time() * 1000)
+            channel.body, channel.frames = None, {}
+            # Polls at this revision reuse the pump's payload (and its encoding)
+            record = self._revisions[channel.user_id]
+            record.payload, record.payload_revision, record.body = payload, revision, None
+            if ops is None:
+                channel.patches.clear()
+            else:
+                ops.insert(0, {"op": "replace", "path": "/server_time_ms", "value": channel.published_ms})
+                patch = {"rev": channel.event_id, "base": base, "ops": ops}
+                channel.patches.append((base, self._patch_frame(channel.event_id, patch), patch))
+            subscribers = list(channel.subscribers)
+            frame = self._frame(channel, "data") if any(not s.delta for s in subscribers) else None
+        for sub in subscribers:
+            sub.push(CHANGED if sub.delta else frame)
+        self.frames_sent += len(subscribers)
+
+    def _pump(self, channel: _TenantChannel) -> None:
+        """Rebuild the tenant payload after each bump or overdue deadline"""
+        with self.app.app_context():
+            try:
+                while not channel.stop.is_set():
+                    # Clear before rebuilding so a bump during the build is not lost
+                    channel.wake.clear()
+
+                    # Reset transaction to see updates from other requests
+                    try:
+                        self.db.session.rollback()
+                    except Exception:
+                        pass
+
+                    timeout = self.resync_interval
+                    try:
+                        payload = self._payload(channel.user_id)
+                        sig = self.build_signature(payload)
+                        if sig != channel.last_sig:
+                            channel.last_sig = sig
+                            self._publish(channel, payload)
+
+                        deadline = self.next_deadline(payload)
+                        self.note_deadline(channel.user_id, deadline)
+                        if deadline is not None:
+                            timeout = min(timeout, max(0.1, deadline - time.time()))
+                    except Exception as e:
+                        print(f"Status pump error for user {channel.user_id}: {e}")
+
+                    channel.wake.wait(timeout)
+            finally:
+                self.db.session.remove()
@@ -0,0 +1,208 @@
+"""
+Cache Backend: Keeps per-worker caches consistent across gunicorn workers
+Every cached item (a tenant's roster, the kiosk token table) has a generation
+counter. Writers bump it after committing; readers compare it with the
+generation their copy was loaded at and reload when it moved, so a write in
+one worker invalidates the others on their next access. A backend may also
+hold a serialized copy of the latest value so other workers warm up without
+going to the database.
+
+LocalCacheBackend keeps generations in process memory (single worker / dev).
+SharedFileCacheBackend keeps them in a memory-mapped file that every worker
+on the host maps (put it on tmpfs, e.g. /dev/shm), with payloads stored as
+files next to it; reading a generation is a few bytes from shared memory.
+"""
+from typing import Any, Dict, Optional, Tuple
+from contextlib import contextmanager
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+_GEN = struct.Struct("<Q")
+
+
+class LocalCacheBackend:
+    """Generations in process memory; nothing is shared between workers"""
+
+    shared = False
+
+    def __init__(self):
+        self._generations: Dict[Tuple[str, Any], int] = {}
+        self._lock = threading.Lock()
+        self.bumps = 0
+
+    def generation(self, namespace: str, key: Any) -> int:
+        return self._generations.get((namespace, key), 0)
+
+    def bump(self, namespace: str, key: Any) -> Tuple[int, int]:
+        """Mark an item changed; returns (previous, new) generation"""
+        with self._lock:
+            previous = self._generations.get((namespace, key), 0)
+            self._generations[(namespace, key)] = previous + 1
+            self.bumps += 1
+            return previous, previous + 1
+
+    def publish(self, namespace: str, key: Any, base: int, data: bytes) -> Tuple[int, int]:
+        return self.bump(namespace, key)
+
+    def load(self, namespace: str, key: Any) -> Optional[Tuple[int, bytes]]:
+        return None
+
+    def store(self, namespace: str, key: Any, generation: int, data: bytes) -> bool:
+        return False
+
+    def stats(self) -> dict:
+        return {"backend": "local", "bumps": self.bumps}
+
+
+class SharedFileCacheBackend:
+    """Generations in a shared memory-mapped file, payloads in files beside it"""
+
+    shared = True
+
+    def __init__(self, directory: str, slots: int = 65536):
+        """
+        Initialize SharedFileCacheBackend.
+
+        Args:
+            directory: Directory shared by all workers on the host (tmpfs recommended)
+            slots: Generation counters in the table; keys hash into slots, so a
+                   collision only causes an extra reload
+        """
+        import fcntl  # POSIX only; the local backend works everywhere
+        self._fcntl = fcntl
+        self.directory = directory
+        self.slots = slots
+        # Payloads hold student names: only this user may list or read them
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._table = os.path.join(directory, "generations")
+        self._fd = os.open(self._table, os.O_RDWR | os.O_CREAT, 0o600)
+        self._thread_lock = threading.Lock()
+        self._lock_fd: Optional[int] = None
+        self._lock_pid: Optional[int] = None
+        size = slots * _GEN.size
+        with self._locked():
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self.bumps = 0
+        self.loads = 0
+        self.stores = 0
+        self.stale_stores = 0
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock across workers and threads"""
+        with self._thread_lock:
+            if self._lock_pid != os.getpid():
+                # flock is per open file: a worker forked after init needs its own descriptor
+                self._lock_fd = os.open(self._table, os.O_RDWR)
+                self._lock_pid = os.getpid()
+            self._fcntl.flock(self._lock_fd, self._fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                self._fcntl.flock(self._lock_fd, self._fcntl.LOCK_UN)
+
+    def _offset(self, namespace: str, key: Any) -> int:
+        return (zlib.crc32(f"{namespace}:{key}".encode()) % self.slots) * _GEN.size
+
+    def _path(self, namespace: str, key: Any) -> str:
+        return os.path.join(self.directory, f"{namespace}-{'global' if key is None else key}.bin")
+
+    def generation(self, namespace: str, key: Any) -> int:
+        return _GEN.unpack_from(self._map, self._offset(namespace, key))[0]
+
+    def bump(self, namespace: str, key: Any) -> Tuple[int, int]:
+        """Mark an item changed in every worker; returns (previous, new) generation"""
+        offset = self._offset(namespace, key)
+        with self._locked():
+            previous = _GEN.unpack_from(self._map, offset)[0]
+            _GEN.pack_into(self._map, offset, previous + 1)
+        self.bumps += 1
+        return previous, previous + 1
+
+    def publish(self, namespace: str, key: Any, base: int, data: bytes) -> Tuple[int, int]:
+        """
+        Bump the item, sharing `data` as its new value if it was built from
+        generation `base`. The payload is in place before the generation moves,
+        so no worker sees the change without the copy that goes with it.
+        """
+        path = self._path(namespace, key)
+        offset = self._offset(namespace, key)
+        tmp = self._write_tmp(path, data)
+        with self._locked():
+            previous = _GEN.unpack_from(self._map, offset)[0]
+            if previous == base:
+                self._rewrite_generation(tmp, previous + 1)
+                os.replace(tmp, path)
+                self.stores += 1
+                tmp = None
+            _GEN.pack_into(self._map, offset, previous + 1)
+        if tmp is not None:
+            os.unlink(tmp)
+            self.stale_stores += 1
+        self.bumps += 1
+        return previous, previous + 1
+
+    def load(self, namespace: str, key: Any) -> Optional[Tuple[int, bytes]]:
+        """(generation, payload) last stored for the item, if any"""
+        try:
+            with open(self._path(namespace, key), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < _GEN.size:
+            return None
+        self.loads += 1
+        return _GEN.unpack_from(data)[0], data[_GEN.size:]
+
+    def store(self, namespace: str, key: Any, generation: int, data: bytes) -> bool:
+        """Publish a payload for `generation`; dropped if the item has moved on since"""
+        path = self._path(namespace, key)
+        tmp = self._write_tmp(path, data, generation)
+        with self._locked():
+            current = _GEN.unpack_from(self._map, self._offset(namespace, key))[0]
+            if current == generation:
+                os.replace(tmp, path)
+                self.stores += 1
+                return True
+        os.unlink(tmp)
+        self.stale_stores += 1
+        return False
+
+    @staticmethod
+    def _write_tmp(path: str, data: bytes, generation: int = 0) -> str:
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        # 0o600 regardless of umask; os.replace() keeps the mode on the published file
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(_GEN.pack(generation))
+            f.write(data)
+        return tmp
+
+    @staticmethod
+    def _rewrite_generation(tmp: str, generation: int) -> None:
+        with open(tmp, "r+b") as f:
+            f.write(_GEN.pack(generation))
+
+    def stats(self) -> dict:
+        return {
+            "backend": "file",
+            "directory": self.directory,
+            "bumps": self.bumps,
+            "loads": self.loads,
+            "stores": self.stores,
+            "stale_stores": self.stale_stores,
+        }
+
+
+def create_cache_backend(spec: Optional[str]):
+    """Backend from a config string: 'local' (default) or 'file:/path/to/dir'"""
+    if not spec or spec == "local":
+        return LocalCacheBackend()
+    if spec.startswith("file:"):
+        return SharedFileCacheBackend(spec[len("file:"):])
+    raise ValueError(f"Unknown cache backend: {spec!r} (expected 'local' or 'file:/path')")
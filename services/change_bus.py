@@ -0,0 +1,282 @@
+"""
+Change Bus: Carries tenant change events between worker processes
+notify_status_change() applies a committed write to the local worker, then
+publishes the tenant's user_id on the bus. Every other worker receives it, drops
+its ClassroomState for that tenant, wakes its SSE pumps and reschedules overdue
+deadlines, so a scan handled by one worker reaches displays connected to any
+worker within milliseconds instead of at the next resync.
+
+LocalChangeBus: single process (dev / one worker); publishing is a no-op.
+SocketChangeBus: one Unix datagram socket per worker in a shared directory;
+    a publish is one datagram to each peer on the host.
+PostgresChangeBus: LISTEN/NOTIFY on the application database; also reaches
+    workers on other hosts.
+"""
+from typing import Callable, List, Optional
+from abc import ABC, abstractmethod
+import atexit
+import os
+import secrets
+import select
+import socket
+import threading
+import time
+
+Handler = Callable[[Optional[int]], None]
+
+
+def _encode(user_id: Optional[int]) -> str:
+    return "-" if user_id is None else str(user_id)
+
+
+def _decode(text: str) -> Optional[int]:
+    return None if text == "-" else int(text)
+
+
+class LocalChangeBus:
+    """No other workers to tell; the local write already applied the change"""
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+        self.published = 0
+
+    def subscribe(self, handler: Handler) -> None:
+        self._handler = handler
+
+    def start(self) -> None:
+        pass
+
+    def publish(self, user_id: Optional[int]) -> None:
+        self.published += 1
+
+    def stats(self) -> dict:
+        return {"backend": "local", "published": self.published}
+
+
+class _ListeningBus(ABC):
+    """Shared bookkeeping: handler, per-process listener thread, counters"""
+
+    name = ""
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def subscribe(self, handler: Handler) -> None:
+        """Called with the user_id of every change published by another worker"""
+        self._handler = handler
+
+    def start(self) -> None:
+        """Start listening (idempotent; call from the serving process, not before fork)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._open()
+            threading.Thread(target=self._listen, daemon=True, name=f"change-bus-{self.name}").start()
+
+    def _deliver(self, text: str) -> None:
+        self.received += 1
+        if self._handler is None:
+            return
+        try:
+            self._handler(_decode(text))
+        except Exception as e:
+            self.errors += 1
+            print(f"Change bus handler error: {e}")
+
+    @abstractmethod
+    def _open(self) -> None:
+        """Set up this process's end of the bus (caller holds self._lock)"""
+
+    @abstractmethod
+    def _listen(self) -> None:
+        """Listener thread body: deliver every event from another worker"""
+
+    @abstractmethod
+    def publish(self, user_id: Optional[int]) -> None:
+        """Send a committed change to every other worker"""
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+class SocketChangeBus(_ListeningBus):
+    """Unix datagram sockets, one per worker, in a directory shared on the host"""
+
+    name = "unix"
+
+    def __init__(self, directory: str):
+        """
+        Initialize SocketChangeBus.
+
+        Args:
+            directory: Directory every worker on the host can reach (tmpfs recommended)
+        """
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._sock: Optional[socket.socket] = None
+        self._path: Optional[str] = None
+        # Unbound and non-blocking: a peer with a full queue drops the event
+        # (its pump resync catches up) instead of stalling the request
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._peers: List[str] = []
+        self._peers_mtime: Optional[int] = None
+
+    def _open(self) -> None:
+        # Caller holds self._lock
+        self._path = os.path.join(self.directory, f"{os.getpid()}-{secrets.token_hex(3)}.sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self._path)
+        self._sock = sock
+        self._peers_mtime = None
+        atexit.register(self._remove, self._path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _listen(self) -> None:
+        sock = self._sock
+        while True:
+            try:
+                data = sock.recv(64)
+            except OSError:
+                return
+            self._deliver(data.decode())
+
+    def _peer_paths(self) -> List[str]:
+        """Sockets of the other workers, re-listed only when the directory changed"""
+        mtime = os.stat(self.directory).st_mtime_ns
+        if mtime != self._peers_mtime:
+            self._peers = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                           if name.endswith(".sock")]
+            self._peers_mtime = mtime
+        return [path for path in self._peers if path != self._path]
+
+    def publish(self, user_id: Optional[int]) -> None:
+        """Send the change to every other worker on the host"""
+        message = _encode(user_id).encode()
+        try:
+            peers = self._peer_paths()
+        except OSError as e:
+            self.errors += 1
+            print(f"Change bus publish error: {e}")
+            return
+        for path in peers:
+            try:
+                self._sender.sendto(message, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                self._remove(path)  # Worker exited without cleaning up
+            except OSError:
+                self.dropped += 1
+        self.published += 1
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update(directory=self.directory, peers=len(self._peers) - (1 if self._path in self._peers else 0))
+        return stats
+
+
+class PostgresChangeBus(_ListeningBus):
+    """LISTEN/NOTIFY on the application database (psycopg2)"""
+
+    name = "postgres"
+
+    def __init__(self, engine, channel: str = "halllday_changes", reconnect_delay: float = 1.0):
+        """
+        Initialize PostgresChangeBus.
+
+        Args:
+            engine: SQLAlchemy engine for the application database
+            channel: NOTIFY channel name
+            reconnect_delay: Seconds to wait before re-listening after a dropped connection
+        """
+        super().__init__()
+        if engine.dialect.name != "postgresql":
+            raise ValueError("The postgres change bus needs a PostgreSQL DATABASE_URL")
+        self.engine = engine
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self._origin = ""
+
+    def _open(self) -> None:
+        # Caller holds self._lock. Our own notifications come back to us; the
+        # origin tag (new per process) lets the listener skip them.
+        self._origin = secrets.token_hex(4)
+
+    def _listen(self) -> None:
+        while True:
+            raw = None
+            try:
+                # A dedicated connection, taken out of the pool for good
+                raw = self.engine.raw_connection()
+                raw.detach()
+                conn = raw.driver_connection
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel}")
+                while True:
+                    if select.select([conn], [], [], 30.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        origin, _, text = conn.notifies.pop(0).payload.partition(":")
+                        if origin != self._origin:
+                            self._deliver(text)
+            except Exception as e:
+                self.errors += 1
+                print(f"Change bus listener error (reconnecting): {e}")
+            finally:
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+            time.sleep(self.reconnect_delay)
+
+    def publish(self, user_id: Optional[int]) -> None:
+        """NOTIFY every listening worker (call after the write committed)"""
+        if self._pid != os.getpid():
+            self.start()  # Needs this process's origin tag
+        try:
+            with self.engine.connect() as conn:
+                conn.exec_driver_sql("SELECT pg_notify(%s, %s)",
+                                     (self.channel, f"{self._origin}:{_encode(user_id)}"))
+                conn.commit()
+            self.published += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Change bus publish error: {e}")
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["channel"] = self.channel
+        return stats
+
+
+def create_change_bus(spec: Optional[str], engine=None):
+    """Bus from a config string: 'local' (default), 'unix:/path/to/dir' or 'postgres'"""
+    if not spec or spec == "local":
+        return LocalChangeBus()
+    if spec.startswith("unix:"):
+        return SocketChangeBus(spec[len("unix:"):])
+    if spec == "postgres":
+        return PostgresChangeBus(engine)
+    raise ValueError(f"Unknown change bus: {spec!r} (expected 'local', 'unix:/path' or 'postgres')")
@@ -0,0 +1,209 @@
+"""
+Classroom State: In-memory authoritative state for the scan/status hot path
+Holds each tenant's open sessions, ordered queue and settings so scans
+and status reads are served from memory. Writes go to the database first and are
+then applied here (write-through); anything else invalidates the tenant, which is
+rebuilt lazily from SQL on next access.
+
+Scans run inside transaction(), which also takes a database-level tenant lock
+(BEGIN IMMEDIATE on SQLite, SELECT ... FOR UPDATE on the Settings row elsewhere)
+and re-reads the open sessions and queue under it, so concurrent scans in other
+worker processes cannot both pass the capacity check.
+"""
+from typing import Callable, Dict, Iterator, List, Optional, Set, Any
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import threading
+import time
+
+from sqlalchemy import text
+
+
+def _as_utc(ts: datetime) -> datetime:
+    """SQLite hands back naive datetimes; all state timestamps are aware UTC"""
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+
+
+class OpenSession:
+    """Lightweight copy of an open Session row"""
+    __slots__ = ("id", "student_id", "start_ts")
+
+    def __init__(self, id: int, student_id: str, start_ts: datetime):
+        self.id = id
+        self.student_id = student_id
+        self.start_ts = _as_utc(start_ts)
+
+    @property
+    def duration_seconds(self) -> int:
+        return int((datetime.now(timezone.utc) - self.start_ts).total_seconds())
+
+
+class ClassroomState:
+    """Everything the kiosk needs to decide a scan, for one user_id"""
+
+    def __init__(self, user_id: Optional[int], settings: Dict[str, Any],
+                 open_sessions: List[OpenSession], queue: List[str], lock: threading.RLock):
+        self.user_id = user_id
+        self.settings = settings
+        self.open_sessions = open_sessions  # Ordered by start_ts
+        self.queue = queue                  # Student IDs ordered by joined_ts
+        # Student IDs known to have a Student row (FK target for Session)
+        self.known_students: Set[str] = set()
+        self.loaded_at = time.time()
+        # Tenant lock, shared across reloads (see ClassroomStateService.locked)
+        self.lock = lock
+
+    def find_session(self, student_id: str) -> Optional[OpenSession]:
+        for sess in self.open_sessions:
+            if sess.student_id == student_id:
+                return sess
+        return None
+
+    def add_session(self, sess: OpenSession) -> None:
+        self.open_sessions.append(sess)
+        self.open_sessions.sort(key=lambda s: s.start_ts)
+
+    def end_session(self, session_id: int) -> None:
+        self.open_sessions = [s for s in self.open_sessions if s.id != session_id]
+
+    def queue_append(self, student_id: str) -> None:
+        self.queue.append(student_id)
+
+    def queue_remove(self, student_id: str) -> None:
+        self.queue = [q for q in self.queue if q != student_id]
+
+
+class ClassroomStateService:
+    def __init__(self, db, session_model, queue_model, settings_model,
+                 load_settings: Callable[[Optional[int]], Dict[str, Any]], ban_service,
+                 max_age: float = 30.0):
+        """
+        Initialize ClassroomStateService.
+
+        Args:
+            db: SQLAlchemy database instance
+            session_model: Session model class
+            queue_model: Queue model class
+            settings_model: Settings model class (its row is the tenant's database lock)
+            load_settings: Returns the settings dict for a user_id
+            ban_service: BanService (owns the per-tenant banned set)
+            max_age: Seconds before a state is reloaded even without invalidation
+                     (bounds staleness from writes made by other workers)
+        """
+        self.db = db
+        self.Session = session_model
+        self.Queue = queue_model
+        self.Settings = settings_model
+        self.load_settings = load_settings
+        self.ban_service = ban_service
+        self.max_age = max_age
+        self._states: Dict[Optional[int], ClassroomState] = {}
+        self._tenant_locks: Dict[Optional[int], threading.RLock] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get(self, user_id: Optional[int]) -> ClassroomState:
+        """Get the tenant's state, loading it from the database if needed"""
+        state = self._fresh(user_id)
+        if state is not None:
+            return state
+
+        # Load under the tenant lock so a reload never races an in-flight scan
+        lock = self._tenant_lock(user_id)
+        with lock:
+            state = self._fresh(user_id)
+            if state is None:
+                state = self._load(user_id, lock)
+                with self._lock:
+                    self._states[user_id] = state
+            return state
+
+    @contextmanager
+    def locked(self, user_id: Optional[int]) -> Iterator[ClassroomState]:
+        """Hold the tenant lock across a read-decide-write on its state"""
+        with self._tenant_lock(user_id):
+            yield self.get(user_id)
+
+    @contextmanager
+    def transaction(self, user_id: Optional[int]) -> Iterator[ClassroomState]:
+        """
+        Run a read-decide-write as one database transaction holding the tenant lock
+        in this process and in the database. Open sessions and queue are re-read
+        under the lock. The caller commits; anything left open is rolled back on exit.
+        """
+        with self._tenant_lock(user_id):
+            # Load first: a cold load may commit (default Settings row)
+            state = self.get(user_id)
+            session = self.db.session
+            session.rollback()
+            try:
+                self._lock_tenant(user_id)
+                self._refresh_live(state)
+                yield state
+            except Exception:
+                session.rollback()
+                # A failed write may have left memory and DB out of step
+                self.invalidate(user_id)
+                self.ban_service.invalidate(user_id)
+                raise
+            finally:
+                # Releases the database lock on read-only paths
+                session.rollback()
+
+    def invalidate(self, user_id: Optional[int]) -> None:
+        """Drop a tenant's state so the next access rebuilds it from SQL"""
+        with self._lock:
+            self._states.pop(user_id, None)
+
+    def is_banned(self, state: ClassroomState, student_id: str) -> bool:
+        return self.ban_service.is_student_banned(state.user_id, student_id)
+
+    def _fresh(self, user_id: Optional[int]) -> Optional[ClassroomState]:
+        with self._lock:
+            state = self._states.get(user_id)
+        if state is not None and time.time() - state.loaded_at <= self.max_age:
+            return state
+        return None
+
+    def _tenant_lock(self, user_id: Optional[int]) -> threading.RLock:
+        with self._lock:
+            lock = self._tenant_locks.get(user_id)
+            if lock is None:
+                lock = self._tenant_locks[user_id] = threading.RLock()
+            return lock
+
+    def _lock_tenant(self, user_id: Optional[int]) -> None:
+        """Take the database-level tenant lock for the current transaction"""
+        if self.db.engine.dialect.name == "sqlite":
+            # SQLite has no row locks; IMMEDIATE takes the database write lock up front
+            self.db.session.execute(text("BEGIN IMMEDIATE"))
+        else:
+            self.db.session.query(self.Settings.id).filter_by(user_id=user_id).with_for_update().all()
+
+    def _query_live(self, user_id: Optional[int]):
+        """Open sessions and queue straight from the database"""
+        session_query = self.db.session.query(
+            self.Session.id, self.Session.student_id, self.Session.start_ts
+        ).filter_by(end_ts=None)
+        queue_query = self.db.session.query(self.Queue.student_id).filter_by(user_id=user_id)
+        if user_id is not None:
+            session_query = session_query.filter_by(user_id=user_id)
+
+        open_sessions = [
+            OpenSession(row.id, row.student_id, row.start_ts)
+            for row in session_query.order_by(self.Session.start_ts.asc()).all()
+        ]
+        queue = [row.student_id for row in queue_query.order_by(self.Queue.joined_ts.asc()).all()]
+        return open_sessions, queue
+
+    def _refresh_live(self, state: ClassroomState) -> None:
+        state.open_sessions, state.queue = self._query_live(state.user_id)
+
+    def _load(self, user_id: Optional[int], lock: threading.RLock) -> ClassroomState:
+        """Rebuild one tenant's state with a handful of queries"""
+        settings = self.load_settings(user_id)
+
+        open_sessions, queue = self._query_live(user_id)
+
+        self.loads += 1
+        return ClassroomState(user_id, settings, open_sessions, queue, lock)
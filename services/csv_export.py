@@ -0,0 +1,38 @@
+"""
+CSV Export: Stream CSV rows to the client in fixed-size chunks
+Rows are encoded as they arrive from a server-side cursor and flushed once a
+chunk fills up, optionally through a streaming gzip compressor, so memory use
+does not depend on how much history is exported.
+"""
+from typing import Iterable, Iterator, Sequence, Any
+import csv
+import io
+import zlib
+
+CHUNK_BYTES = 64 * 1024
+
+
+def csv_chunks(header: Sequence[Any], rows: Iterable[Sequence[Any]],
+               chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """Yield the CSV (header first) as UTF-8 chunks of roughly `chunk_bytes`"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buf.tell() >= chunk_bytes:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a byte stream into a single gzip member, chunk by chunk"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
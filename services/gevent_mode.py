@@ -0,0 +1,164 @@
+"""
+Gevent Mode: Cooperative database access for `gunicorn -k gevent` workers
+A gevent worker runs every request and SSE stream as a greenlet on one hub.
+psycopg2 is a C extension that waits on the server inside libpq, so without
+help one slow query blocks the whole worker and every open display with it.
+
+enable_cooperative_db() installs a psycopg2 wait callback that polls the
+connection and parks only the calling greenlet on its socket, and
+pool_options() sizes the SQLAlchemy pool for many short greenlet checkouts.
+check_worker_driver() runs at startup and warns when the worker class and the
+database driver do not fit together.
+"""
+from typing import Any, Dict, List, Optional
+import os
+import shlex
+import sys
+
+MODES = ("auto", "on", "off")
+
+# Pool for a cooperative worker: scans and admin requests check a connection
+# out briefly and idle streams hold none, so greenlets beyond size + overflow
+# queue for a free connection instead of opening more
+GEVENT_POOL_SIZE = 10
+GEVENT_MAX_OVERFLOW = 20
+GEVENT_POOL_TIMEOUT = 10
+
+
+def monkey_patched() -> bool:
+    """True once gevent has patched this process (gevent workers do so before loading the app)"""
+    monkey = sys.modules.get("gevent.monkey")
+    return bool(monkey and monkey.is_module_patched("socket"))
+
+
+def gunicorn_worker_class() -> Optional[str]:
+    """Worker class from the gunicorn command line, or None when not running under gunicorn"""
+    if "gunicorn" not in os.path.basename(sys.argv[0] if sys.argv else ""):
+        return None
+    args = sys.argv[1:] + shlex.split(os.getenv("GUNICORN_CMD_ARGS", ""))
+    worker = "sync"
+    for i, arg in enumerate(args):
+        if arg in ("-k", "--worker-class") and i + 1 < len(args):
+            worker = args[i + 1]
+        elif arg.startswith("--worker-class="):
+            worker = arg.split("=", 1)[1]
+        elif arg.startswith("-k") and len(arg) > 2:
+            worker = arg[2:].lstrip("=")
+    # "gevent" or a class path such as gunicorn.workers.ggevent.GeventWorker
+    return "gevent" if "gevent" in worker.lower() else worker
+
+
+def psycopg_cooperative() -> bool:
+    """True when psycopg2 has a wait callback installed"""
+    try:
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+    return extensions.get_wait_callback() is not None
+
+
+def patch_psycopg() -> bool:
+    """Make psycopg2 yield to the gevent hub while it waits on the server; False if psycopg2 is missing"""
+    try:
+        import psycopg2
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+    from gevent.socket import wait_read, wait_write
+
+    def wait(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                return
+            if state == extensions.POLL_READ:
+                wait_read(conn.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(conn.fileno(), timeout=timeout)
+            else:
+                raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+    extensions.set_wait_callback(wait)
+    return True
+
+
+def enable_cooperative_db(mode: Optional[str]) -> bool:
+    """
+    Apply HALLPASS_GEVENT before the engine is created; True when database
+    access is cooperative.
+
+    'auto' patches psycopg2 when this process is already monkey-patched,
+    'on' patches it regardless (custom setups that patch later), 'off'
+    leaves the driver alone.
+    """
+    mode = mode or "auto"
+    if mode not in MODES:
+        raise ValueError(f"Unknown gevent mode: {mode!r} (expected 'auto', 'on' or 'off')")
+    if mode == "off" or (mode == "auto" and not monkey_patched()):
+        return False
+    patch_psycopg()
+    return True
+
+
+def pool_options(database_url: str, cooperative: bool, pool_size: int = 0,
+                 max_overflow: int = -1, pool_timeout: int = 0) -> Dict[str, Any]:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the connection pool.
+
+    Explicit sizes always win; otherwise a cooperative worker gets the
+    GEVENT_* sizes and any other worker keeps SQLAlchemy's defaults.
+    SQLite is left alone.
+    """
+    if database_url.startswith("sqlite"):
+        return {}
+    options: Dict[str, Any] = {}
+    if cooperative:
+        options = {"pool_size": GEVENT_POOL_SIZE, "max_overflow": GEVENT_MAX_OVERFLOW,
+                   "pool_timeout": GEVENT_POOL_TIMEOUT}
+    if pool_size > 0:
+        options["pool_size"] = pool_size
+    if max_overflow >= 0:
+        options["max_overflow"] = max_overflow
+    if pool_timeout > 0:
+        options["pool_timeout"] = pool_timeout
+    return options
+
+
+def check_worker_driver(engine, cooperative: bool) -> List[str]:
+    """Warn (and return the warnings) when the worker class and database driver are mismatched"""
+    worker = gunicorn_worker_class()
+    patched = monkey_patched()
+    dialect, driver = engine.dialect.name, engine.dialect.driver
+    warnings = []
+    if patched or worker == "gevent":
+        if worker == "gevent" and not patched:
+            warnings.append("gunicorn -k gevent imported the app before monkey-patching (--preload?): "
+                            "locks and threads created at import are real threads. Drop --preload.")
+        if dialect == "postgresql" and driver == "psycopg2" and not psycopg_cooperative():
+            warnings.append("gevent worker with psycopg2 but no wait callback: every query blocks all "
+                            "greenlets in the worker. Set HALLPASS_GEVENT=auto.")
+        if dialect == "sqlite":
+            warnings.append("gevent worker with SQLite: queries block the worker's hub. Fine for "
+                            "development, use Postgres for SSE-heavy deployments.")
+    elif cooperative:
+        warnings.append(f"HALLPASS_GEVENT=on but the worker is '{worker or 'not gunicorn'}' "
+                        "and not monkey-patched; start with gunicorn -k gevent.")
+    elif worker == "sync":
+        warnings.append("gunicorn sync worker: each open SSE display holds a whole worker. "
+                        "Use -k gevent or the ASGI entry point (asgi:application).")
+    for warning in warnings:
+        print(f"Startup check: {warning}")
+    return warnings
+
+
+def gevent_stats(engine) -> Dict[str, Any]:
+    """Worker/driver state and pool usage for the dev dashboard"""
+    pool = engine.pool
+    return {
+        "worker": gunicorn_worker_class(),
+        "monkey_patched": monkey_patched(),
+        "driver": f"{engine.dialect.name}+{engine.dialect.driver}",
+        "psycopg2_cooperative": psycopg_cooperative(),
+        "pool": pool.status(),
+        "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+    }
@@ -0,0 +1,122 @@
+"""
+JSON Patch: Minimal RFC 6902 diff/apply for status payloads
+diff() emits add/remove/replace operations only (no move/copy/test), which is
+all a status payload needs. List items are aligned by identity (the `id`
+or `student_id` of a dict, else the value) before diffing, so a student
+leaving the front of the queue is one `remove` rather than a `replace` for
+every entry that shifted up, and a session whose fields changed is patched
+in place. Values compare with Python equality (1 == 1.0 == true), which is
+fine for payloads whose fields keep their types.
+"""
+from typing import Any, Dict, List
+from collections import deque
+import copy
+
+Op = Dict[str, Any]
+
+
+def _escape(key: str) -> str:
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def diff(old: Any, new: Any, path: str = "") -> List[Op]:
+    """Operations that turn `old` into `new`"""
+    if type(old) is not type(new):
+        return [{"op": "replace", "path": path, "value": new}]
+    if isinstance(new, dict):
+        ops: List[Op] = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            if key not in old:
+                ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+            elif old[key] != value:
+                ops.extend(diff(old[key], value, f"{path}/{_escape(key)}"))
+        return ops
+    if isinstance(new, list):
+        return _diff_list(old, new, path)
+    if old != new:
+        return [{"op": "replace", "path": path, "value": new}]
+    return []
+
+
+_LIST = object()
+
+
+def _identities(items: list) -> list:
+    # Alignment only decides patch size, never correctness (matched items are
+    # diffed recursively), so keys may collide harmlessly: dicts match on
+    # id/student_id, nested lists all match each other, other values on equality
+    return [(item.get("id", item.get("student_id")) if type(item) is dict else
+             _LIST if type(item) is list else item) for item in items]
+
+
+def _align(old: list, new: list) -> List[tuple]:
+    """
+    Index pairs of matching items, in order. Greedy: each new item takes the
+    next old item with its identity, which is exact for the usual edits
+    (removals anywhere, additions anywhere); a moved item is removed and re-added.
+    """
+    positions: Dict[Any, deque] = {}
+    for i, key in enumerate(_identities(old)):
+        positions.setdefault(key, deque()).append(i)
+    pairs = []
+    last = -1
+    for j, key in enumerate(_identities(new)):
+        candidates = positions.get(key)
+        while candidates and candidates[0] <= last:
+            candidates.popleft()
+        if candidates:
+            last = candidates.popleft()
+            pairs.append((last, j))
+    return pairs
+
+
+def _diff_list(old: list, new: list, path: str) -> List[Op]:
+    ops: List[Op] = []
+    pos = i = j = 0
+    for old_i, new_j in _align(old, new) + [(len(old), len(new))]:
+        # Unmatched items: remove the old ones at the current position, insert the new ones
+        ops.extend({"op": "remove", "path": f"{path}/{pos}"} for _ in range(i, old_i))
+        for k in range(j, new_j):
+            ops.append({"op": "add", "path": f"{path}/{pos}", "value": new[k]})
+            pos += 1
+        if old_i < len(old):
+            if old[old_i] != new[new_j]:
+                ops.extend(diff(old[old_i], new[new_j], f"{path}/{pos}"))
+            pos += 1
+        i, j = old_i + 1, new_j + 1
+    return ops
+
+
+def apply(doc: Any, ops: List[Op]) -> Any:
+    """Apply add/remove/replace operations to a copy of `doc` (reference client)"""
+    doc = copy.deepcopy(doc)
+    for op in ops:
+        path = op["path"]
+        if path == "":
+            doc = copy.deepcopy(op["value"])
+            continue
+        tokens = [_unescape(t) for t in path.split("/")[1:]]
+        parent = doc
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+        if isinstance(parent, list):
+            index = len(parent) if last == "-" else int(last)
+            if op["op"] == "add":
+                parent.insert(index, op["value"])
+            elif op["op"] == "remove":
+                del parent[index]
+            else:
+                parent[index] = op["value"]
+        elif op["op"] == "remove":
+            del parent[last]
+        else:
+            parent[last] = op["value"]
+    return doc
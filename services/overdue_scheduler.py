@@ -0,0 +1,225 @@
+"""
+Overdue Scheduler: Fires per-session overdue deadlines from a min-heap
+Each open session is pushed once with its deadline: the first whole second past
+start + overdue_minutes, when its int(duration) > overdue_seconds check flips. A
+single background thread sleeps until the earliest deadline, then publishes a
+status change for the tenant and, when auto_ban_overdue is on, bans everyone who
+just went overdue in one batch. Work is O(log n) per session start/deadline
+instead of recomputing every session's duration on a timer.
+
+Tenants are rescheduled from their ClassroomState after every status change
+(session start/end, settings edits such as overdue_minutes). A periodic resync
+from the database picks up sessions started by other workers.
+
+Every worker runs a scheduler and fires the same deadlines for its own streams.
+The ban UPDATE only flips students who are not banned yet, so one worker bans
+and announces it to the others; the rest find nothing to ban.
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Any
+from collections import defaultdict
+import heapq
+import itertools
+import threading
+import time
+
+
+class OverdueScheduler:
+    def __init__(self, app, db, get_state: Callable[[Optional[int]], Any],
+                 get_settings: Callable[[Optional[int]], Dict[str, Any]],
+                 open_session_tenants: Callable[[], Iterable[Optional[int]]],
+                 ban_students: Callable[[Optional[int], List[str]], int],
+                 publish: Callable[[Optional[int]], Any],
+                 bump: Callable[[Optional[int]], Any],
+                 resync_interval: float = 60.0, ban_batch_size: int = 100,
+                 compact_threshold: int = 10000):
+        """
+        Initialize OverdueScheduler.
+
+        Args:
+            app: Flask app (the scheduler thread runs inside its app context)
+            db: SQLAlchemy database instance
+            get_state: Returns the ClassroomState for a user_id
+            get_settings: Returns the settings dict for a user_id, or None when the tenant
+                          has no Settings row (must not create one from this thread)
+            open_session_tenants: Returns the user_ids that currently have open sessions
+            ban_students: Bans the not-yet-banned students of a list for a user_id in one
+                          write, returns how many it banned
+            publish: Publishes a committed status change for a user_id to every worker
+            bump: Wakes this worker's status streams for a user_id (no database change)
+            resync_interval: Seconds between full reschedules from the database
+            ban_batch_size: Most students banned per write
+            compact_threshold: Heap size above which superseded entries are purged
+        """
+        self.app = app
+        self.db = db
+        self.get_state = get_state
+        self.get_settings = get_settings
+        self.open_session_tenants = open_session_tenants
+        self.ban_students = ban_students
+        self.publish = publish
+        self.bump = bump
+        self.resync_interval = resync_interval
+        self.ban_batch_size = ban_batch_size
+        self.compact_threshold = compact_threshold
+        # Entries: (deadline, seq, user_id, session_id, student_id, generation)
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        # Current generation per tenant with pending entries; entries from any
+        # other generation were superseded by a reschedule. Generations come
+        # from one counter so a dropped tenant never revives stale entries.
+        self._generations: Dict[Optional[int], int] = {}
+        self._next_generation = itertools.count(1)
+        # Current-generation entries still in the heap, per tenant
+        self._pending: Dict[Optional[int], int] = {}
+        # (session id, deadline) pairs that already fired (never fired twice); a
+        # new overdue_minutes gives the session a new deadline to fire
+        self._fired: Dict[Optional[int], Set[Tuple[int, float]]] = defaultdict(set)
+        self._dirty: Set[Optional[int]] = set()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        # Counters for dev stats
+        self.deadlines_fired = 0
+        self.auto_banned = 0
+
+    def start(self) -> None:
+        """Start the scheduler thread (idempotent; call from the serving process, not before fork)"""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True, name="overdue-scheduler")
+            self._thread.start()
+
+    def reschedule(self, user_id: Optional[int]) -> None:
+        """Rebuild a tenant's deadlines after its sessions or settings changed"""
+        with self._cond:
+            self._dirty.add(user_id)
+            self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "deadlines_fired": self.deadlines_fired,
+            "auto_banned": self.auto_banned,
+            "running": self._thread is not None and self._thread.is_alive(),
+        }
+
+    def _schedule_tenant(self, user_id: Optional[int]) -> None:
+        """Push one deadline per open session of the tenant under a new generation"""
+        settings = self.get_settings(user_id)
+        if settings is None:
+            # No Settings row yet: its first request creates one and reschedules
+            return
+        state = self.get_state(user_id)
+        with state.lock:
+            open_sessions = list(state.open_sessions)
+        overdue_seconds = settings["overdue_minutes"] * 60
+
+        with self._cond:
+            generation = next(self._next_generation)
+            fired = self._fired[user_id]
+            # Forget fired deadlines of sessions that have ended
+            open_ids = {s.id for s in open_sessions}
+            fired.difference_update([f for f in fired if f[0] not in open_ids])
+            pushed = 0
+            for sess in open_sessions:
+                deadline = sess.start_ts.timestamp() + overdue_seconds + 1
+                if (sess.id, deadline) in fired:
+                    continue
+                heapq.heappush(self._heap, (deadline, next(self._seq), user_id, sess.id,
+                                            sess.student_id, generation))
+                pushed += 1
+            if pushed:
+                self._generations[user_id] = generation
+                self._pending[user_id] = pushed
+            else:
+                self._forget(user_id)
+            if not fired:
+                del self._fired[user_id]
+            if len(self._heap) > self.compact_threshold:
+                self._compact()
+
+    def _forget(self, user_id: Optional[int]) -> None:
+        # Caller holds self._cond. The tenant has no pending deadlines left, so
+        # resyncs stop visiting it; its old entries no longer match any generation.
+        self._generations.pop(user_id, None)
+        self._pending.pop(user_id, None)
+
+    def _compact(self) -> None:
+        # Caller holds self._cond. Superseded entries are normally dropped lazily
+        # when popped; purge them early if reschedules pile them up.
+        self._heap = [e for e in self._heap if e[5] == self._generations.get(e[2])]
+        heapq.heapify(self._heap)
+
+    def _pop_due(self, now: float) -> Dict[Optional[int], List[tuple]]:
+        """Pop every current-generation entry whose deadline has passed, by tenant"""
+        due: Dict[Optional[int], List[tuple]] = defaultdict(list)
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                deadline, _, user_id, session_id, student_id, generation = entry
+                if generation != self._generations.get(user_id):
+                    continue
+                self._fired[user_id].add((session_id, deadline))
+                due[user_id].append((session_id, student_id))
+                self._pending[user_id] -= 1
+                if not self._pending[user_id]:
+                    self._forget(user_id)
+        return due
+
+    def _fire(self, user_id: Optional[int], entries: List[tuple]) -> None:
+        """Sessions just went overdue: auto-ban (batched) if enabled, then publish"""
+        self.deadlines_fired += len(entries)
+        banned = 0
+        settings = self.get_settings(user_id)
+        if settings is not None and settings.get("auto_ban_overdue", False):
+            student_ids = [student_id for _, student_id in entries]
+            for i in range(0, len(student_ids), self.ban_batch_size):
+                count = self.ban_students(user_id, student_ids[i:i + self.ban_batch_size])
+                banned += count
+                if count:
+                    print(f"AUTO-BAN AT DEADLINE: {count} overdue student(s) for user {user_id}")
+        self.auto_banned += banned
+        if banned:
+            # This worker's UPDATE banned them: invalidate state and tell every worker
+            self.publish(user_id)
+        else:
+            # Overdue is derived from the clock; each worker's scheduler fires it locally
+            self.bump(user_id)
+
+    def _run(self) -> None:
+        with self.app.app_context():
+            next_resync = 0.0
+            while True:
+                try:
+                    with self._cond:
+                        now = time.time()
+                        timeout = next_resync - now
+                        if self._heap:
+                            timeout = min(timeout, self._heap[0][0] - now)
+                        if not self._dirty and timeout > 0:
+                            self._cond.wait(timeout)
+                        dirty, self._dirty = self._dirty, set()
+
+                    # Reset transaction to see updates from other requests
+                    self.db.session.rollback()
+
+                    if time.time() >= next_resync:
+                        dirty.update(self.open_session_tenants())
+                        # Tenants this worker still tracks, whose sessions may have ended elsewhere
+                        dirty.update(self._generations)
+                        dirty.update(self._fired)
+                        next_resync = time.time() + self.resync_interval
+                    for user_id in dirty:
+                        self._schedule_tenant(user_id)
+
+                    for user_id, entries in self._pop_due(time.time()).items():
+                        self._fire(user_id, entries)
+                except Exception as e:
+                    print(f"Overdue scheduler error: {e}")
+                    time.sleep(1.0)
+                finally:
+                    self.db.session.remove()
@@ -0,0 +1,179 @@
+"""
+Rollup Service: Pre-aggregated session counts for the stats endpoints
+Sessions are counted into per-hour (session_rollup) and per-student-per-day
+(student_rollup) buckets in local time when they start, and their duration and
+overdue flag are added when they end. Stats read a few dozen bucket rows
+instead of every session in the window, so their cost does not grow with history.
+
+Buckets are keyed by the session's local start date/hour, matching how the
+stats endpoints have always attributed sessions. Overdue is judged with the
+overdue_minutes setting in force when the session ends.
+"""
+from typing import Callable, Dict, List, Optional, Any
+from datetime import date, datetime, timezone
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+
+class RollupService:
+    def __init__(self, db, session_rollup_model, student_rollup_model, tz):
+        """
+        Initialize RollupService.
+
+        Args:
+            db: SQLAlchemy database instance
+            session_rollup_model: SessionRollup model class (user_id, local_date, hour)
+            student_rollup_model: StudentRollup model class (user_id, local_date, student_id)
+            tz: Local timezone used for date/hour buckets
+        """
+        self.db = db
+        self.SessionRollup = session_rollup_model
+        self.StudentRollup = student_rollup_model
+        self.tz = tz
+
+    # ---------- Writes (join the caller's transaction, caller commits) ----------
+
+    def record_start(self, user_id: Optional[int], student_id: str, start_ts: datetime) -> None:
+        """Count a session that just started"""
+        local = self._local(start_ts)
+        self._bump(self.SessionRollup, dict(user_id=user_id, local_date=local.date(), hour=local.hour),
+                   sessions=1)
+        self._bump(self.StudentRollup, dict(user_id=user_id, local_date=local.date(), student_id=student_id),
+                   sessions=1)
+
+    def record_end(self, user_id: Optional[int], student_id: str, start_ts: datetime,
+                   end_ts: datetime, overdue_seconds: int) -> None:
+        """Add a finished session's duration (and overdue flag) to its start buckets"""
+        duration = max(0, int((self._utc(end_ts) - self._utc(start_ts)).total_seconds()))
+        overdue = 1 if duration > overdue_seconds else 0
+        local = self._local(start_ts)
+        self._bump(self.SessionRollup, dict(user_id=user_id, local_date=local.date(), hour=local.hour),
+                   overdue=overdue, total_duration_seconds=duration)
+        self._bump(self.StudentRollup, dict(user_id=user_id, local_date=local.date(), student_id=student_id),
+                   overdue=overdue, total_duration_seconds=duration)
+
+    def clear(self, user_id: Optional[int]) -> None:
+        """Drop a tenant's rollups (history deleted); caller commits"""
+        for model in (self.SessionRollup, self.StudentRollup):
+            query = model.query
+            if user_id is not None:
+                query = query.filter_by(user_id=user_id)
+            query.delete(synchronize_session=False)
+
+    def backfill(self, session_model, overdue_seconds_for: Callable[[Optional[int]], int],
+                 user_id: Optional[int] = None, batch_size: int = 1000) -> int:
+        """
+        Rebuild rollups from the session table (all tenants, or one). Streams
+        sessions in batches; returns the number of sessions counted.
+        """
+        self.clear(user_id)
+
+        hourly: Dict[tuple, List[int]] = {}
+        per_student: Dict[tuple, List[int]] = {}
+        overdue_cache: Dict[Optional[int], int] = {}
+        counted = 0
+
+        query = self.db.session.query(
+            session_model.user_id, session_model.student_id, session_model.start_ts, session_model.end_ts
+        )
+        if user_id is not None:
+            query = query.filter(session_model.user_id == user_id)
+        for row in query.yield_per(batch_size):
+            if row.user_id not in overdue_cache:
+                overdue_cache[row.user_id] = overdue_seconds_for(row.user_id)
+            local = self._local(row.start_ts)
+            duration = overdue = 0
+            if row.end_ts is not None:
+                duration = max(0, int((self._utc(row.end_ts) - self._utc(row.start_ts)).total_seconds()))
+                overdue = 1 if duration > overdue_cache[row.user_id] else 0
+            for buckets, key in ((hourly, (row.user_id, local.date(), local.hour)),
+                                 (per_student, (row.user_id, local.date(), row.student_id))):
+                totals = buckets.setdefault(key, [0, 0, 0])
+                totals[0] += 1
+                totals[1] += overdue
+                totals[2] += duration
+            counted += 1
+
+        self.db.session.bulk_insert_mappings(self.SessionRollup, [
+            dict(user_id=k[0], local_date=k[1], hour=k[2], sessions=v[0], overdue=v[1],
+                 total_duration_seconds=v[2]) for k, v in hourly.items()
+        ])
+        self.db.session.bulk_insert_mappings(self.StudentRollup, [
+            dict(user_id=k[0], local_date=k[1], student_id=k[2], sessions=v[0], overdue=v[1],
+                 total_duration_seconds=v[2]) for k, v in per_student.items()
+        ])
+        self.db.session.commit()
+        return counted
+
+    # ---------- Reads ----------
+
+    def hourly_counts(self, user_id: Optional[int], day: date) -> List[int]:
+        """Sessions started in each local hour of `day`"""
+        query = self.db.session.query(self.SessionRollup.hour, self.SessionRollup.sessions).filter(
+            self.SessionRollup.local_date == day
+        )
+        query = self._scope(query, self.SessionRollup, user_id)
+        hourly = [0] * 24
+        for hour, sessions in query.all():
+            hourly[hour] += sessions
+        return hourly
+
+    def daily_counts(self, user_id: Optional[int], days: List[date]) -> List[int]:
+        """Sessions started on each of `days` (same order)"""
+        query = self.db.session.query(
+            self.SessionRollup.local_date, func.sum(self.SessionRollup.sessions)
+        ).filter(self.SessionRollup.local_date >= min(days), self.SessionRollup.local_date <= max(days))
+        query = self._scope(query, self.SessionRollup, user_id).group_by(self.SessionRollup.local_date)
+        by_day = {self._as_date(d): int(total or 0) for d, total in query.all()}
+        return [by_day.get(d, 0) for d in days]
+
+    def total_sessions(self, user_id: Optional[int], since: Optional[date] = None,
+                       until: Optional[date] = None, student_id: Optional[str] = None) -> int:
+        """Sessions started between local dates `since` and `until` (inclusive)"""
+        model = self.StudentRollup if student_id else self.SessionRollup
+        query = self.db.session.query(func.sum(model.sessions))
+        if student_id:
+            query = query.filter(model.student_id == student_id)
+        if since is not None:
+            query = query.filter(model.local_date >= since)
+        if until is not None:
+            query = query.filter(model.local_date <= until)
+        return int(self._scope(query, model, user_id).scalar() or 0)
+
+    # ---------- Helpers ----------
+
+    def _bump(self, model, key: Dict[str, Any], **deltas: int) -> None:
+        """Add deltas to a bucket row, creating it on first use"""
+        deltas = {col: d for col, d in deltas.items() if d}
+        if not deltas:
+            return
+        values = {getattr(model, col): getattr(model, col) + d for col, d in deltas.items()}
+        query = model.query.filter_by(**key)
+        if query.update(values, synchronize_session=False):
+            return
+        try:
+            with self.db.session.begin_nested():
+                row = dict(sessions=0, overdue=0, total_duration_seconds=0)
+                row.update(deltas)
+                self.db.session.add(model(**key, **row))
+        except IntegrityError:
+            # Another writer created the bucket first
+            query.update(values, synchronize_session=False)
+
+    @staticmethod
+    def _scope(query, model, user_id: Optional[int]):
+        return query.filter(model.user_id == user_id) if user_id is not None else query
+
+    @staticmethod
+    def _utc(ts: datetime) -> datetime:
+        # SQLite hands back naive datetimes (stored as UTC)
+        return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+
+    def _local(self, ts: datetime) -> datetime:
+        return self._utc(ts).astimezone(self.tz)
+
+    @staticmethod
+    def _as_date(value) -> date:
+        # SQLite returns grouped dates as strings
+        return date.fromisoformat(value) if isinstance(value, str) else value
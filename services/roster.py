@@ -2,12 +2,27 @@
 Roster Service: Handles student roster management
 Refactored for 2.0 multi-tenancy with stateless user_id scoping
 """
-from typing import Dict, Optional, Any
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Any, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import hashlib
+import os
+import time
+
+from sqlalchemy import insert
+
+from services.cache_backend import LocalCacheBackend
+from services.roster_cache import RosterCache, TenantRoster
+
+# Rows hashed/encrypted and written per statement during a roster import
+INGEST_CHUNK = 1000
 
 
 class RosterService:
-    def __init__(self, db, cipher_suite, student_name_model):
+    def __init__(self, db, cipher_suite, student_name_model,
+                 membership_ttl: float = 60.0, ingest_workers: Optional[int] = None,
+                 cache_max_students: int = 200000, cache_max_bytes: int = 64 * 1024 * 1024,
+                 cache_backend=None):
         """
         Initialize RosterService.
         
@@ -15,20 +30,28 @@ class RosterService:
             db: SQLAlchemy database instance
             cipher_suite: Fernet cipher for encryption
             student_name_model: StudentName model class
+            membership_ttl: Seconds a tenant's cached roster is trusted before reloading
+                            (picks up roster edits made by other workers)
+            ingest_workers: Threads hashing/encrypting roster imports (default: CPUs, max 4)
+            cache_max_students: Students kept in the roster cache across tenants (0 = no limit)
+            cache_max_bytes: Estimated roster cache memory budget across tenants (0 = no limit)
+            cache_backend: Shares roster changes with other workers (default: this process only)
         """
         self.db = db
         self.cipher_suite = cipher_suite
         self.StudentName = student_name_model
-        # Multi-tenant cache: {user_id: {student_id: name}}
-        # None as user_id key is for legacy/global mode
-        self._roster_cache: Dict[Optional[int], Dict[str, str]] = {}
-    
-    def _get_cache_for_user(self, user_id: Optional[int]) -> Dict[str, str]:
-        """Get the roster cache for a specific user"""
-        if user_id not in self._roster_cache:
-            self._roster_cache[user_id] = {}
-        return self._roster_cache[user_id]
-        
+        # Multi-tenant roster cache keyed by the name_hash scans already compute,
+        # LRU-evicted across tenants. None as user_id key is for legacy/global mode
+        self.cache = RosterCache(max_students=cache_max_students, max_bytes=cache_max_bytes)
+        self.backend = cache_backend or LocalCacheBackend()
+        self.membership_ttl = membership_ttl
+        self.ingest_workers = ingest_workers or min(4, os.cpu_count() or 1)
+        self._upserts: Dict[str, Any] = {}
+        # Counters for dev stats
+        self.name_db_lookups = 0
+        self.unknown_rejects = 0
+        self.shared_loads = 0  # Rosters taken from the cache backend instead of the database
+    
     def _hash_student_id(self, student_id: str, user_id: Optional[int] = None) -> str:
         """
         Create a hash of student ID for FERPA-compliant lookup.
@@ -39,17 +62,132 @@ class RosterService:
         hash_input = f"student_{user_id}_{student_id}" if user_id else f"student_{student_id}"
         return hashlib.sha256(hash_input.encode()).hexdigest()[:16]
     
-    def get_memory_roster(self, user_id: Optional[int]) -> Dict[str, str]:
-        """Get student roster from memory cache for specific user"""
-        return self._get_cache_for_user(user_id)
+    # ---------- Roster cache ----------
+    
+    def _roster(self, user_id: Optional[int], max_age: Optional[float] = None) -> TenantRoster:
+        """
+        The tenant's cached roster. Reloaded when stale or changed by another
+        worker: from the copy that worker shared if there is one, otherwise with
+        one plain SELECT of name_hash, display_name, banned (nothing is decrypted).
+        """
+        ttl = self.membership_ttl if max_age is None else min(max_age, self.membership_ttl)
+        # Read before loading so a write that lands mid-load is seen as newer
+        generation = self.backend.generation("roster", user_id)
+        roster = self.cache.get(user_id, ttl, generation)
+        if roster is not None:
+            return roster
+        
+        roster = self._load_shared(user_id, generation, ttl)
+        if roster is None:
+            roster = self._load_roster(user_id)
+            roster.generation = generation
+            if self.backend.shared:
+                self.backend.store("roster", user_id, generation, roster.to_bytes())
+        self.cache.put(user_id, roster)
+        return roster
+    
+    def _load_roster(self, user_id: Optional[int]) -> TenantRoster:
+        query = self.db.session.query(
+            self.StudentName.name_hash, self.StudentName.display_name, self.StudentName.banned
+        )
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        return TenantRoster(query)
+    
+    def _load_shared(self, user_id: Optional[int], generation: int, ttl: float) -> Optional[TenantRoster]:
+        """The roster another worker published for this generation, if still fresh"""
+        found = self.backend.load("roster", user_id)
+        if found is None or found[0] != generation:
+            return None
+        roster = TenantRoster.from_bytes(found[1])
+        if time.time() - roster.loaded_at > ttl:
+            return None
+        roster.generation = generation
+        self.shared_loads += 1
+        return roster
+    
+    def _publish(self, user_id: Optional[int], roster: Optional[TenantRoster]) -> None:
+        """Tell other workers the tenant's roster changed, sharing the patched copy if it was current"""
+        if roster is None:
+            self.backend.bump("roster", user_id)
+            return
+        base = roster.generation
+        data = roster.to_bytes() if self.backend.shared else b""
+        previous, generation = self.backend.publish("roster", user_id, base, data)
+        if previous == base:
+            roster.generation = generation
+        else:
+            self.cache.pop(user_id)  # Patched a copy that was already stale; reload instead
+    
+    def roster_size(self, user_id: Optional[int]) -> int:
+        """Number of students on the tenant's roster"""
+        return len(self._roster(user_id))
+    
+    def is_banned(self, user_id: Optional[int], name_hash: str, max_age: Optional[float] = None) -> bool:
+        """Ban flag from the cached roster (reloaded if older than max_age)"""
+        return self._roster(user_id, max_age).is_banned(name_hash)
+    
+    def banned_hashes(self, user_id: Optional[int], max_age: Optional[float] = None) -> Set[str]:
+        """Banned name_hash values from the cached roster (reloaded if older than max_age)"""
+        return self._roster(user_id, max_age).banned_hashes()
+    
+    def cache_student(self, user_id: Optional[int], name_hash: str, name: str) -> None:
+        """Patch an added/renamed student into the cached roster (after the caller commits)"""
+        roster = self.cache.peek(user_id)
+        if roster is not None:
+            roster.set(name_hash, name)
+        self._publish(user_id, roster)
+    
+    def uncache_student(self, user_id: Optional[int], name_hash: str) -> None:
+        """Drop a deleted student from the cached roster (after the caller commits)"""
+        roster = self.cache.peek(user_id)
+        if roster is not None:
+            roster.discard(name_hash)
+        self._publish(user_id, roster)
     
-    def set_memory_roster(self, user_id: Optional[int], roster_dict: Dict[str, str]) -> None:
-        """Set student roster in memory cache for specific user"""
-        self._roster_cache[user_id] = roster_dict.copy()
+    def mark_banned(self, user_id: Optional[int], name_hash: str, banned: bool) -> None:
+        """Apply a ban/unban written by the caller to the cached roster"""
+        self.mark_many_banned(user_id, (name_hash,), banned)
     
-    def clear_memory_roster(self, user_id: Optional[int]) -> None:
-        """Clear student roster from memory cache for specific user"""
-        self._roster_cache[user_id] = {}
+    def mark_many_banned(self, user_id: Optional[int], name_hashes: Iterable[str], banned: bool) -> None:
+        """Apply a batch of bans/unbans written by the caller, publishing the roster once"""
+        roster = self.cache.peek(user_id)
+        if roster is not None:
+            for name_hash in name_hashes:
+                roster.set_banned(name_hash, banned)
+        self._publish(user_id, roster)
+    
+    def invalidate_roster(self, user_id: Optional[int]) -> None:
+        """Forget the tenant's cached roster in every worker (reloaded on next lookup)"""
+        self.cache.pop(user_id)
+        self.backend.bump("roster", user_id)
+    
+    def refresh_roster(self, user_id: Optional[int]) -> None:
+        """
+        Reload right away after a bulk write and publish the result, so other
+        workers switch straight to the shared copy instead of each querying
+        """
+        self.cache.pop(user_id)
+        base = self.backend.generation("roster", user_id)
+        try:
+            roster = self._load_roster(user_id)
+        except Exception:
+            self.backend.bump("roster", user_id)  # Loaded lazily on next lookup instead
+            return
+        roster.generation = base
+        self.cache.put(user_id, roster)
+        self._publish(user_id, roster)
+    
+    def is_known_student(self, user_id: Optional[int], student_id: str) -> bool:
+        """
+        Cheap roster membership check: False means the ID is definitely not on
+        the roster (as of the last load) and needs no database lookup.
+        """
+        try:
+            roster = self._roster(user_id)
+        except Exception:
+            return True  # Can't tell; let the database lookup decide
+        return self._hash_student_id(student_id, user_id) in roster
     
     def store_student_name(self, user_id: Optional[int], student_id: str, name: str) -> None:
         """Store student name in database using hash for lookup and encryption for retrieval"""
@@ -75,6 +213,7 @@ class RosterService:
                 )
                 self.db.session.add(student_name)
             self.db.session.commit()
+            self.cache_student(user_id, name_hash, name)
         except Exception:
             try:
                 self.db.session.rollback()
@@ -85,45 +224,226 @@ class RosterService:
         """
         Store multiple student names in database efficiently (single commit).
         Returns the count of successfully stored students.
-        Handles legacy data by updating existing records regardless of user_id.
+        Existing records with the same hash are updated in place.
+        """
+        return self.ingest(user_id, roster.items())["count"]
+
+    # ---------- Bulk roster import ----------
+
+    def ingest(self, user_id: Optional[int], rows: Iterable[Tuple[str, str]], replace: bool = False,
+               chunk_size: int = INGEST_CHUNK) -> Dict[str, Any]:
         """
-        stored_count = 0
+        Import (student_id, name) pairs in one transaction. Rows are consumed
+        lazily in chunks; each chunk is hashed and encrypted on a worker thread
+        while the previous one is written with a single multi-row upsert.
+        With replace=True the tenant's existing roster is deleted first.
+
+        Returns count (distinct student IDs, later rows win), seconds,
+        db_seconds and rows_per_second.
+        """
+        started = time.perf_counter()
+        roster: Dict[str, str] = {}
+        db_seconds = 0.0
         try:
-            for student_id, name in roster.items():
-                name_hash = self._hash_student_id(student_id, user_id)
-                encrypted_id = self.cipher_suite.encrypt(student_id.encode()).decode()
-                
-                # First check if any record with this name_hash exists (including legacy)
-                existing = self.StudentName.query.filter_by(name_hash=name_hash).first()
-                
-                if existing:
-                    # Update existing record, claim it for this user if needed
-                    existing.display_name = name
-                    existing.encrypted_id = encrypted_id
-                    if user_id is not None:
-                        existing.user_id = user_id  # Claim legacy record for this user
-                else:
-                    # Create new record
-                    student_name = self.StudentName(
-                        name_hash=name_hash, 
-                        display_name=name, 
-                        encrypted_id=encrypted_id,
-                        user_id=user_id
-                    )
-                    self.db.session.add(student_name)
-                stored_count += 1
-            
-            # Single commit at the end
+            if replace:
+                db_started = time.perf_counter()
+                self.StudentName.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+                db_seconds += time.perf_counter() - db_started
+
+            db_seconds += self._store_chunks(user_id, self._ingest_chunks(rows, chunk_size, roster))
+
+            db_started = time.perf_counter()
             self.db.session.commit()
-            return stored_count
-            
-        except Exception as e:
+            db_seconds += time.perf_counter() - db_started
+        except Exception:
             try:
                 self.db.session.rollback()
             except Exception:
                 pass
-            raise e  # Re-raise so caller knows it failed
-    
+            raise
+        self.refresh_roster(user_id)
+
+        elapsed = time.perf_counter() - started
+        rate = len(roster) / elapsed if elapsed > 0 else 0.0
+        print(f"Roster import for user {user_id}: {len(roster)} rows in {elapsed:.2f}s "
+              f"({rate:.0f} rows/s, {db_seconds:.3f}s in database)")
+        return dict(count=len(roster), seconds=elapsed, db_seconds=db_seconds,
+                    rows_per_second=rate)
+
+    def sync(self, user_id: Optional[int], rows: Iterable[Tuple[str, str]],
+             chunk_size: int = INGEST_CHUNK,
+             is_placeholder: Optional[Callable[[str], bool]] = None) -> Dict[str, Any]:
+        """
+        Make the tenant's roster match (student_id, name) pairs by applying only
+        the difference against the stored name_hash values: new students are
+        inserted, renamed ones updated, missing ones deleted. Untouched rows keep
+        their ban state and encrypted_id, so re-uploading an unchanged roster
+        writes nothing (and leaves the cached roster alone).
+
+        IDs for which is_placeholder() is true were generated per upload and
+        identify no one across files, so they are never matched: a stored row
+        with the same ID is deleted and the row inserted fresh.
+
+        Returns the ingest() summary plus added, updated, removed, unchanged.
+        """
+        started = time.perf_counter()
+        roster: Dict[str, str] = {}
+        wanted: Dict[str, Tuple[str, str]] = {}
+        for student_id, name in rows:
+            roster[student_id] = name
+            wanted[self._hash_student_id(student_id, user_id)] = (student_id, name)
+
+        db_started = time.perf_counter()
+        existing = {
+            row.name_hash: row for row in self.db.session.query(
+                self.StudentName.id, self.StudentName.name_hash,
+                self.StudentName.display_name, self.StudentName.encrypted_id,
+            ).filter(self.StudentName.user_id == user_id)
+        }
+        db_seconds = time.perf_counter() - db_started
+
+        added: List[Tuple[str, str]] = []
+        sealed: List[Tuple[str, str]] = []  # Existing rows missing an encrypted_id
+        renamed: List[Dict[str, Any]] = []
+        replaced: List[int] = []  # Stored rows under a placeholder ID reused by this file
+        for name_hash, (student_id, name) in wanted.items():
+            current = existing.get(name_hash)
+            if current is not None and is_placeholder is not None and is_placeholder(student_id):
+                replaced.append(current.id)
+                current = None
+            if current is None:
+                added.append((student_id, name))
+            elif current.encrypted_id is None:
+                sealed.append((student_id, name))
+            elif current.display_name != name:
+                renamed.append(dict(id=current.id, display_name=name))
+        removed = [row.id for name_hash, row in existing.items() if name_hash not in wanted] + replaced
+
+        changed = bool(added or sealed or renamed or removed)
+        if changed:
+            try:
+                db_started = time.perf_counter()
+                for i in range(0, len(removed), chunk_size):
+                    self.StudentName.query.filter(
+                        self.StudentName.id.in_(removed[i:i + chunk_size])
+                    ).delete(synchronize_session=False)
+                if renamed:
+                    self.db.session.bulk_update_mappings(self.StudentName, renamed)
+                db_seconds += time.perf_counter() - db_started
+
+                db_seconds += self._store_chunks(user_id, self._ingest_chunks(added + sealed, chunk_size, {}))
+
+                db_started = time.perf_counter()
+                self.db.session.commit()
+                db_seconds += time.perf_counter() - db_started
+            except Exception:
+                try:
+                    self.db.session.rollback()
+                except Exception:
+                    pass
+                raise
+            self.refresh_roster(user_id)
+
+        elapsed = time.perf_counter() - started
+        rate = len(roster) / elapsed if elapsed > 0 else 0.0
+        summary = dict(added=len(added), updated=len(renamed) + len(sealed), removed=len(removed),
+                       unchanged=len(wanted) - len(added) - len(renamed) - len(sealed))
+        print(f"Roster sync for user {user_id}: {len(roster)} rows in {elapsed:.2f}s "
+              f"({rate:.0f} rows/s, {db_seconds:.3f}s in database) "
+              f"+{summary['added']} ~{summary['updated']} -{summary['removed']}")
+        return dict(count=len(roster), seconds=elapsed, db_seconds=db_seconds,
+                    rows_per_second=rate, changed=changed, **summary)
+
+    def _store_chunks(self, user_id: Optional[int], chunks: Iterator[List[Tuple[str, str]]]) -> float:
+        """Seal each chunk on the pool while the previous one is written; returns database seconds"""
+        db_seconds = 0.0
+        first = next(chunks, None)
+        if first is None:
+            return db_seconds
+        with ThreadPoolExecutor(max_workers=self.ingest_workers) as pool:
+            pending = pool.submit(self._seal_chunk, user_id, first)
+            for chunk in chunks:
+                sealed = pending.result()
+                pending = pool.submit(self._seal_chunk, user_id, chunk)
+                db_seconds += self._write_chunk(user_id, sealed)
+            db_seconds += self._write_chunk(user_id, pending.result())
+        return db_seconds
+
+    @staticmethod
+    def _ingest_chunks(rows: Iterable[Tuple[str, str]], chunk_size: int,
+                       roster: Dict[str, str]) -> Iterator[List[Tuple[str, str]]]:
+        """Group rows into chunks, recording every pair in `roster`"""
+        chunk: List[Tuple[str, str]] = []
+        for student_id, name in rows:
+            roster[student_id] = name
+            chunk.append((student_id, name))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _seal_chunk(self, user_id: Optional[int], chunk: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Hash and encrypt a chunk into StudentName rows (one per hash, last wins)"""
+        encrypt = self.cipher_suite.encrypt
+        now = datetime.now(timezone.utc)
+        sealed: Dict[str, Dict[str, Any]] = {}
+        for student_id, name in chunk:
+            name_hash = self._hash_student_id(student_id, user_id)
+            sealed[name_hash] = dict(
+                name_hash=name_hash,
+                encrypted_id=encrypt(student_id.encode()).decode(),
+                display_name=name,
+                user_id=user_id,
+                created_at=now,
+                banned=False,
+            )
+        return list(sealed.values())
+
+    def _write_chunk(self, user_id: Optional[int], rows: List[Dict[str, Any]]) -> float:
+        """Upsert a sealed chunk; returns seconds spent in the database"""
+        started = time.perf_counter()
+        dialect = self.db.engine.dialect.name
+        if user_id is not None and dialect in ("postgresql", "sqlite"):
+            # INSERT ... ON CONFLICT (user_id, name_hash) DO UPDATE, executemany'd
+            # (batched into multi-row VALUES by the driver/insertmanyvalues)
+            self.db.session.execute(self._upsert_statement(dialect), rows)
+        else:
+            # NULL user_id never conflicts on the composite key: match hashes explicitly
+            existing = dict(
+                self.db.session.query(self.StudentName.name_hash, self.StudentName.id)
+                .filter(self.StudentName.name_hash.in_([row["name_hash"] for row in rows]))
+                .all()
+            )
+            updates = [
+                dict(id=existing[row["name_hash"]], display_name=row["display_name"],
+                     encrypted_id=row["encrypted_id"],
+                     **({"user_id": user_id} if user_id is not None else {}))
+                for row in rows if row["name_hash"] in existing
+            ]
+            inserts = [row for row in rows if row["name_hash"] not in existing]
+            if updates:
+                self.db.session.bulk_update_mappings(self.StudentName, updates)
+            if inserts:
+                self.db.session.execute(insert(self.StudentName.__table__), inserts)
+        return time.perf_counter() - started
+
+    def _upsert_statement(self, dialect: str):
+        """Cached StudentName upsert keyed on uq_user_name_hash"""
+        stmt = self._upserts.get(dialect)
+        if stmt is None:
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            stmt = dialect_insert(self.StudentName.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id", "name_hash"],
+                set_=dict(display_name=stmt.excluded.display_name, encrypted_id=stmt.excluded.encrypted_id),
+            )
+            self._upserts[dialect] = stmt
+        return stmt
+
     def get_student_name_from_db(self, user_id: Optional[int], student_id: str) -> Optional[str]:
         """Get student name from database using hash lookup"""
         try:
@@ -140,20 +460,19 @@ class RosterService:
             return None
     
     def get_student_name(self, user_id: Optional[int], student_id: str, fallback: str = "Student") -> str:
-        """Get student name from memory or database"""
-        # Try memory roster first (fastest)
-        cache = self._get_cache_for_user(user_id)
-        name = cache.get(student_id)
-        if name:
-            return name
+        """Get student name from the cached roster (database only if it can't be loaded)"""
+        try:
+            roster = self._roster(user_id)
+        except Exception:
+            self.name_db_lookups += 1
+            return self.get_student_name_from_db(user_id, student_id) or fallback
         
-        # Try database lookup
-        name = self.get_student_name_from_db(user_id, student_id)
+        name = roster.get(self._hash_student_id(student_id, user_id))
         if name:
-            # Cache it back to memory
-            cache[student_id] = name
             return name
         
+        # Not on the roster: rejected without touching the database
+        self.unknown_rejects += 1
         return fallback
     
     def clear_all_student_names(self, user_id: Optional[int]) -> bool:
@@ -166,7 +485,7 @@ class RosterService:
             self.db.session.commit()
             
             # Also clear cache
-            self.clear_memory_roster(user_id)
+            self.invalidate_roster(user_id)
             return True
         except Exception:
             self.db.session.rollback()
@@ -0,0 +1,277 @@
+"""
+Roster Cache: Bounded LRU of per-tenant rosters with a memory budget
+Each tenant's roster is stored compactly (sorted 64-bit name_hash keys, names
+packed into one UTF-8 buffer with an offset array, one ban-flag byte each)
+instead of a dict of strings. Tenants are evicted least-recently-used first
+once the total student count or size exceeds the budget, so worker memory
+stays flat no matter how many teachers share the instance.
+
+Request threads and the overdue scheduler patch a cached roster in place
+(set, discard, set_banned) while others read it, so every TenantRoster method
+holds the roster's own lock: a reader never sees an entry half-moved.
+"""
+from typing import Dict, Iterable, Optional, Set, Tuple
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+import json
+import struct
+import threading
+import time
+
+
+class TenantRoster:
+    """One tenant's roster: name_hash -> display name, plus ban flags"""
+
+    __slots__ = ("keys", "offsets", "blob", "banned", "extra", "loaded_at", "generation", "_lock")
+
+    # loaded_at, student count, name buffer length, legacy-entry JSON length
+    _HEADER = struct.Struct("<dIII")
+
+    def __init__(self, rows: Iterable[Tuple[str, str, bool]], loaded_at: Optional[float] = None):
+        """Build from (name_hash, display_name, banned) rows"""
+        packed = []
+        # Hashes that are not 16 hex digits (legacy data): {name_hash: [name, banned]}
+        self.extra: Dict[str, list] = {}
+        for name_hash, name, banned in rows:
+            key = self._key(name_hash)
+            if key is None:
+                self.extra[name_hash] = [name, bool(banned)]
+            else:
+                packed.append((key, name.encode("utf-8"), 1 if banned else 0))
+        packed.sort(key=lambda item: item[0])
+        self.keys = array("Q", (item[0] for item in packed))
+        self.blob = bytearray(b"".join(item[1] for item in packed))
+        self.offsets = array("I", [0])
+        end = 0
+        for item in packed:
+            end += len(item[1])
+            self.offsets.append(end)
+        self.banned = bytearray(item[2] for item in packed)
+        self.loaded_at = time.time() if loaded_at is None else loaded_at
+        # Cache backend generation this copy reflects (see services.cache_backend)
+        self.generation = 0
+        # Guards keys/offsets/blob/banned/extra; readers take it too
+        self._lock = threading.Lock()
+
+    def to_bytes(self) -> bytes:
+        """Serialize for sharing with other workers (same host, same byte order)"""
+        with self._lock:
+            extra = json.dumps(self.extra).encode() if self.extra else b""
+            return b"".join((
+                self._HEADER.pack(self.loaded_at, len(self.keys), len(self.blob), len(extra)),
+                self.keys.tobytes(), self.offsets.tobytes(), bytes(self.blob), bytes(self.banned), extra,
+            ))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TenantRoster":
+        loaded_at, count, blob_len, extra_len = cls._HEADER.unpack_from(data)
+        roster = cls((), loaded_at)
+        pos = cls._HEADER.size
+        roster.keys.frombytes(data[pos:pos + 8 * count])
+        pos += 8 * count
+        roster.offsets = array("I")
+        roster.offsets.frombytes(data[pos:pos + 4 * (count + 1)])
+        pos += 4 * (count + 1)
+        roster.blob = bytearray(data[pos:pos + blob_len])
+        pos += blob_len
+        roster.banned = bytearray(data[pos:pos + count])
+        pos += count
+        if extra_len:
+            roster.extra = json.loads(data[pos:pos + extra_len])
+        return roster
+
+    @staticmethod
+    def _key(name_hash: str) -> Optional[int]:
+        if len(name_hash) != 16:
+            return None
+        try:
+            return int(name_hash, 16)
+        except ValueError:
+            return None
+
+    def _find(self, key: int) -> int:
+        """Index of key, or -1 (caller holds self._lock)"""
+        i = bisect_left(self.keys, key)
+        return i if i < len(self.keys) and self.keys[i] == key else -1
+
+    def _name(self, i: int) -> str:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def _shift(self, start: int, delta: int) -> None:
+        offsets = self.offsets
+        for j in range(start, len(offsets)):
+            offsets[j] += delta
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held (buffers, plus a rough figure for legacy entries)"""
+        with self._lock:
+            return (self.keys.itemsize * len(self.keys) + self.offsets.itemsize * len(self.offsets) +
+                    len(self.blob) + len(self.banned) + 200 * len(self.extra))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.keys) + len(self.extra)
+
+    def __contains__(self, name_hash: str) -> bool:
+        key = self._key(name_hash)
+        with self._lock:
+            return name_hash in self.extra if key is None else self._find(key) >= 0
+
+    def get(self, name_hash: str) -> Optional[str]:
+        key = self._key(name_hash)
+        with self._lock:
+            if key is None:
+                entry = self.extra.get(name_hash)
+                return entry[0] if entry else None
+            i = self._find(key)
+            return self._name(i) if i >= 0 else None
+
+    def is_banned(self, name_hash: str) -> bool:
+        key = self._key(name_hash)
+        with self._lock:
+            if key is None:
+                entry = self.extra.get(name_hash)
+                return bool(entry and entry[1])
+            i = self._find(key)
+            return i >= 0 and bool(self.banned[i])
+
+    def banned_hashes(self) -> Set[str]:
+        with self._lock:
+            hashes = {f"{key:016x}" for key, flag in zip(self.keys, self.banned) if flag}
+            hashes.update(h for h, (_, flag) in self.extra.items() if flag)
+        return hashes
+
+    def set(self, name_hash: str, name: str) -> None:
+        """Add a student (not banned) or rename an existing one"""
+        key = self._key(name_hash)
+        encoded = name.encode("utf-8")
+        with self._lock:
+            if key is None:
+                self.extra.setdefault(name_hash, [name, False])[0] = name
+                return
+            i = bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key:
+                start, end = self.offsets[i], self.offsets[i + 1]
+                self.blob[start:end] = encoded
+                self._shift(i + 1, len(encoded) - (end - start))
+                return
+            start = self.offsets[i]
+            self.blob[start:start] = encoded
+            self.keys.insert(i, key)
+            self.banned.insert(i, 0)
+            self.offsets.insert(i + 1, start)
+            self._shift(i + 1, len(encoded))
+
+    def discard(self, name_hash: str) -> None:
+        key = self._key(name_hash)
+        with self._lock:
+            if key is None:
+                self.extra.pop(name_hash, None)
+                return
+            i = self._find(key)
+            if i < 0:
+                return
+            start, end = self.offsets[i], self.offsets[i + 1]
+            del self.blob[start:end]
+            del self.keys[i]
+            del self.banned[i]
+            del self.offsets[i + 1]
+            self._shift(i + 1, start - end)
+
+    def set_banned(self, name_hash: str, banned: bool) -> None:
+        key = self._key(name_hash)
+        with self._lock:
+            if key is None:
+                if name_hash in self.extra:
+                    self.extra[name_hash][1] = banned
+                return
+            i = self._find(key)
+            if i >= 0:
+                self.banned[i] = 1 if banned else 0
+
+
+class RosterCache:
+    def __init__(self, max_students: int = 200000, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Initialize RosterCache.
+
+        Args:
+            max_students: Most students kept across all tenants (0 = no limit)
+            max_bytes: Estimated memory budget across all tenants (0 = no limit)
+        """
+        self.max_students = max_students
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Optional[int], TenantRoster]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.invalidations = 0  # Changed by another worker
+        self.evictions = 0
+
+    def get(self, user_id: Optional[int], max_age: float, generation: int = 0) -> Optional[TenantRoster]:
+        """The tenant's roster if cached at `generation` and loaded within max_age seconds"""
+        with self._lock:
+            roster = self._entries.get(user_id)
+            if roster is not None:
+                if roster.generation != generation:
+                    del self._entries[user_id]
+                    self.invalidations += 1
+                elif time.time() - roster.loaded_at <= max_age:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return roster
+                else:
+                    del self._entries[user_id]
+                    self.expirations += 1
+            self.misses += 1
+            return None
+
+    def peek(self, user_id: Optional[int]) -> Optional[TenantRoster]:
+        """The cached roster (if any) for in-place patching; no stats or LRU update"""
+        with self._lock:
+            return self._entries.get(user_id)
+
+    def put(self, user_id: Optional[int], roster: TenantRoster) -> None:
+        """Cache a freshly loaded roster, evicting least recently used tenants over budget"""
+        with self._lock:
+            self._entries[user_id] = roster
+            self._entries.move_to_end(user_id)
+            students, nbytes = self._totals()
+            while len(self._entries) > 1 and (
+                (self.max_students and students > self.max_students) or
+                (self.max_bytes and nbytes > self.max_bytes)
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                students -= len(evicted)
+                nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def pop(self, user_id: Optional[int]) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def _totals(self) -> Tuple[int, int]:
+        return (sum(len(r) for r in self._entries.values()),
+                sum(r.nbytes for r in self._entries.values()))
+
+    def stats(self) -> dict:
+        with self._lock:
+            tenants = len(self._entries)
+            students, nbytes = self._totals()
+        total = self.hits + self.misses
+        return {
+            "tenants": tenants,
+            "students": students,
+            "bytes": nbytes,
+            "max_students": self.max_students,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -2,9 +2,20 @@
 Session Service: Handles hallpass session management
 Refactored for 2.0 multi-tenancy with stateless user_id scoping
 """
-from typing import Optional, List
+from typing import Iterator, Optional, List, Tuple
+from collections import namedtuple
 from datetime import datetime, timezone
 
+from sqlalchemy import and_, func, or_
+
+
+def _as_utc(ts: Optional[datetime]) -> Optional[datetime]:
+    return ts.replace(tzinfo=timezone.utc) if ts is not None and ts.tzinfo is None else ts
+
+
+# One exported session; timestamps are aware UTC (SQLite returns naive ones)
+ExportRow = namedtuple("ExportRow", "id student_id start_ts end_ts ended_by room student_name")
+
 
 class SessionService:
     def __init__(self, db, session_model):
@@ -53,6 +64,85 @@ class SessionService:
         except Exception:
             return []
     
+    LOG_STATUSES = ("active", "completed", "overdue")
+
+    def get_log_page(self, user_id: Optional[int], limit: int, after: Optional[Tuple[datetime, int]] = None,
+                     offset: int = 0, **filters) -> Tuple[List, Optional[Tuple[datetime, int]]]:
+        """
+        Get one page of pass logs, newest first, using keyset pagination.
+
+        Args:
+            after: (start_ts, id) of the last row of the previous page
+            offset: Legacy OFFSET paging (ignored when `after` is given)
+            **filters: See _log_query (start_utc, end_utc, status, student_id, overdue_seconds)
+
+        Returns:
+            (sessions, key of the last row or None when there are no more pages)
+        """
+        query = self._log_query(user_id, **filters)
+        if after is not None:
+            start_ts, session_id = after
+            query = query.filter(or_(
+                self.Session.start_ts < start_ts,
+                and_(self.Session.start_ts == start_ts, self.Session.id < session_id),
+            ))
+        query = query.order_by(self.Session.start_ts.desc(), self.Session.id.desc())
+        if after is None and offset:
+            query = query.offset(offset)
+        rows = query.limit(limit + 1).all()
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, (rows[-1].start_ts, rows[-1].id)
+
+    def iter_sessions(self, user_id: Optional[int], newest_first: bool = False, batch_size: int = 500,
+                      **filters) -> Iterator[ExportRow]:
+        """
+        Stream sessions matching the pass-log filters as ExportRow tuples.
+
+        Rows are fetched `batch_size` at a time through a server-side cursor
+        (yield_per) as plain columns, so no ORM objects pile up in the session.
+        """
+        S = self.Session
+        Student = S.student.property.mapper.class_
+        order = (S.start_ts.desc(), S.id.desc()) if newest_first else (S.start_ts.asc(), S.id.asc())
+        query = self._log_query(user_id, **filters).outerjoin(S.student).with_entities(
+            S.id, S.student_id, S.start_ts, S.end_ts, S.ended_by, S.room, Student.name
+        ).order_by(*order).yield_per(batch_size)
+        for row in query:
+            yield ExportRow(row[0], row[1], _as_utc(row[2]), _as_utc(row[3]), row[4], row[5], row[6])
+
+    def count_logs(self, user_id: Optional[int], **filters) -> int:
+        """Exact number of sessions matching the pass-log filters"""
+        return self._log_query(user_id, **filters).order_by(None).count()
+
+    def duration_seconds(self):
+        """SQL expression for end_ts - start_ts in seconds (SQLite and Postgres)"""
+        if self.db.engine.dialect.name == "sqlite":
+            # julianday() is a float of days; round to whole milliseconds so 601s is not 600.9999s
+            days = func.julianday(self.Session.end_ts) - func.julianday(self.Session.start_ts)
+            return func.round(days * 86400000) / 1000.0
+        return func.extract("epoch", self.Session.end_ts - self.Session.start_ts)
+
+    def _log_query(self, user_id: Optional[int], start_utc: Optional[datetime] = None,
+                   end_utc: Optional[datetime] = None, status: Optional[str] = None,
+                   student_id: Optional[str] = None, overdue_seconds: int = 0):
+        """Sessions filtered by start range [start_utc, end_utc), status and student"""
+        query = self.Session.query.filter_by(user_id=user_id)
+        if start_utc is not None:
+            query = query.filter(self.Session.start_ts >= start_utc)
+        if end_utc is not None:
+            query = query.filter(self.Session.start_ts < end_utc)
+        if student_id:
+            query = query.filter(self.Session.student_id == student_id)
+        if status == "active":
+            query = query.filter(self.Session.end_ts.is_(None))
+        elif status in ("completed", "overdue"):
+            # Whole seconds, like Session.duration_seconds
+            overdue = self.duration_seconds() >= overdue_seconds + 1
+            query = query.filter(self.Session.end_ts.isnot(None), overdue if status == "overdue" else ~overdue)
+        return query
+
     def get_session_count(self, user_id: Optional[int]) -> int:
         """Get total session count (scoped to user if set)"""
         try:
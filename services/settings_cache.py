@@ -0,0 +1,87 @@
+"""
+Settings Cache: Versioned per-tenant settings snapshots
+get_settings() is called several times per request (and per exported row), so the
+Settings row is read once per tenant and kept as an immutable snapshot until a
+settings write invalidates it. The TTL bounds staleness from other workers.
+"""
+from typing import Any, Callable, Dict, Mapping, Optional
+from types import MappingProxyType
+import threading
+import time
+
+
+class SettingsCache:
+    def __init__(self, load: Callable[[Optional[int]], Dict[str, Any]], ttl: float = 30.0,
+                 find: Optional[Callable[[Optional[int]], Optional[Dict[str, Any]]]] = None):
+        """
+        Initialize SettingsCache.
+
+        Args:
+            load: Reads the settings dict for a user_id from the database (may raise)
+            ttl: Seconds a snapshot is served before it is re-read
+            find: Like load but never creates a missing row, returning None instead
+                  (background threads); defaults to load
+        """
+        self.load = load
+        self.find_loader = find or load
+        self.ttl = ttl
+        # {user_id: (snapshot, version, loaded_at)}
+        self._entries: Dict[Optional[int], tuple] = {}
+        # Bumped on every invalidation so a load racing a write is never stored
+        self._versions: Dict[Optional[int], int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: Optional[int]) -> Dict[str, Any]:
+        """Get a copy of the tenant's settings, loading them on a miss"""
+        return dict(self.snapshot(user_id))
+
+    def find(self, user_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Like get(), but None for a tenant without settings instead of creating them"""
+        snapshot = self._snapshot(user_id, self.find_loader)
+        return dict(snapshot) if snapshot is not None else None
+
+    def snapshot(self, user_id: Optional[int]) -> Mapping[str, Any]:
+        """Get the shared read-only settings snapshot for a tenant"""
+        return self._snapshot(user_id, self.load)
+
+    def _snapshot(self, user_id: Optional[int], load) -> Optional[Mapping[str, Any]]:
+        now = time.time()
+        with self._lock:
+            version = self._versions.get(user_id, 0)
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] == version and now - entry[2] <= self.ttl:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        settings = load(user_id)
+        if settings is None:
+            return None
+        snapshot = MappingProxyType(dict(settings))
+        with self._lock:
+            if self._versions.get(user_id, 0) == version:
+                self._entries[user_id] = (snapshot, version, now)
+        return snapshot
+
+    def invalidate(self, user_id: Optional[int]) -> None:
+        """Drop a tenant's snapshot after its Settings row changed"""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+
+    def version(self, user_id: Optional[int]) -> int:
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            "entries": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,45 @@
+"""
+Status Encoder: Encodes status payloads once per revision
+The status body is built without the clock, so its bytes only change when the
+classroom state does and can be cached per tenant revision. server_time_ms is
+spliced in front when a body is served; clients derive elapsed time from it
+and each session's start_ms.
+
+orjson is used when installed (HALLPASS_JSON_ENCODER=auto); it is optional.
+"""
+from typing import Any, Callable, Optional
+import json
+import time
+
+try:
+    import orjson
+except ImportError:  # Optional faster encoder
+    orjson = None
+
+Encoder = Callable[[Any], bytes]
+
+
+def _json_encode(payload: Any) -> bytes:
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def create_status_encoder(spec: Optional[str]) -> Encoder:
+    """Encoder from a config string: 'auto' (orjson when installed), 'orjson' or 'json'"""
+    if not spec or spec == "auto":
+        return orjson.dumps if orjson is not None else _json_encode
+    if spec == "orjson":
+        if orjson is None:
+            raise ValueError("HALLPASS_JSON_ENCODER=orjson but orjson is not installed")
+        return orjson.dumps
+    if spec == "json":
+        return _json_encode
+    raise ValueError(f"Unknown JSON encoder: {spec!r} (expected 'auto', 'orjson' or 'json')")
+
+
+def stamp_server_time(body: bytes, now_ms: Optional[int] = None) -> bytes:
+    """Prefix an encoded status object with server_time_ms (defaults to now)"""
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    prefix = b'{"server_time_ms":%d' % now_ms
+    # body is a JSON object: b"{}" or b'{"key":...}'
+    return prefix + (b"}" if body == b"{}" else b"," + body[1:])
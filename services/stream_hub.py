@@ -0,0 +1,163 @@
+"""
+Stream Hub: Fans broadcaster frames out to asyncio SSE connections
+Each event loop holds one StatusBroadcaster subscription per tenant, however
+many displays are connected. The pump thread hands a new frame to the loop
+once (call_soon_threadsafe), and the hub marks it pending on every connection
+for that tenant. An idle connection is just a small mailbox plus a parked
+coroutine: no thread, no greenlet stack, and one keep-alive timer per loop
+instead of one per connection.
+
+Delta connections share a second subscription per tenant. They are only
+woken by it; on wake-up each one pulls the patches it has not sent yet from
+the broadcaster (resume), so a slow client never breaks its patch chain.
+"""
+from typing import Callable, Dict, Optional, Set, Tuple
+import asyncio
+
+from services.broadcaster import Subscription
+
+PING = b": ping\n\n"
+Key = Tuple[Optional[int], bool]
+
+
+class Listener:
+    """One connection's mailbox: the newest unsent frame (a slow client skips older ones)"""
+
+    __slots__ = ("user_id", "delta", "event_id", "catch_up", "frame", "waiter", "closed")
+
+    def __init__(self, user_id: Optional[int], delta: bool = False, event_id: Optional[str] = None,
+                 catch_up: Optional[Callable[["Listener"], bytes]] = None):
+        self.user_id = user_id
+        self.delta = delta
+        # Delta only: last event id sent, and how to fetch what follows it
+        self.event_id = event_id
+        self.catch_up = catch_up
+        self.frame: Optional[bytes] = None
+        self.waiter: Optional[asyncio.Future] = None
+        self.closed = False
+
+    def offer(self, frame: bytes) -> None:
+        if frame is PING and self.frame is not None:
+            return  # Already has something to send
+        self.frame = frame
+        self._wake()
+
+    def close(self) -> None:
+        self.closed = True
+        self._wake()
+
+    def _wake(self) -> None:
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """The next frame, or None once closed (or after timeout)"""
+        if self.frame is None and not self.closed:
+            self.waiter = asyncio.get_running_loop().create_future()
+            try:
+                if timeout is None:
+                    await self.waiter
+                else:
+                    await asyncio.wait_for(self.waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.waiter = None
+        if self.closed:
+            return None
+        frame, self.frame = self.frame, None
+        if self.catch_up is not None and frame is not None and frame is not PING:
+            frame = self.catch_up(self)
+        return frame
+
+
+class _LoopSubscription(Subscription):
+    """Broadcaster mailbox that forwards frames into an event loop"""
+
+    def __init__(self, user_id: Optional[int], delta: bool, loop: asyncio.AbstractEventLoop, hub: "StreamHub"):
+        super().__init__(user_id, delta=delta)
+        self._loop = loop
+        self._hub = hub
+
+    def push(self, frame: str) -> None:
+        # Called from the pump thread
+        self._loop.call_soon_threadsafe(self._hub._fan_out, (self.user_id, self.delta), frame.encode())
+
+
+class StreamHub:
+    def __init__(self, broadcaster, keepalive: float = 15.0):
+        """
+        Initialize StreamHub (one per event loop).
+
+        Args:
+            broadcaster: The app's StatusBroadcaster
+            keepalive: Seconds between keep-alive comments on idle connections
+        """
+        self.broadcaster = broadcaster
+        self.keepalive = keepalive
+        self._listeners: Dict[Key, Set[Listener]] = {}
+        self._subscriptions: Dict[Key, _LoopSubscription] = {}
+        self._last_frame: Dict[Key, bytes] = {}
+        self._ticker: Optional[asyncio.Task] = None
+        # Counters for benchmarks and dev stats
+        self.frames_in = 0
+        self.frames_out = 0
+
+    def attach(self, user_id: Optional[int], delta: bool = False, last_event_id: Optional[str] = None) -> Listener:
+        """
+        Connect a client; it starts with the tenant's current frame if there
+        is one (delta: the patches since `last_event_id`, or a snapshot).
+        """
+        key = (user_id, delta)
+        listener = Listener(user_id, delta, last_event_id, self._catch_up if delta else None)
+        listeners = self._listeners.get(key)
+        if listeners is None:
+            listeners = self._listeners[key] = set()
+            sub = _LoopSubscription(user_id, delta, asyncio.get_running_loop(), self)
+            self._subscriptions[key] = sub
+            self.broadcaster.subscribe(user_id, sub)
+        listeners.add(listener)
+        frame = self._last_frame.get(key)
+        if frame is not None:
+            listener.frame = frame
+        if self._ticker is None:
+            self._ticker = asyncio.get_running_loop().create_task(self._keep_alive())
+        return listener
+
+    def detach(self, listener: Listener) -> None:
+        """Disconnect a client; the tenant's broadcaster subscription goes with its last client"""
+        listener.close()
+        key = (listener.user_id, listener.delta)
+        listeners = self._listeners.get(key)
+        if listeners is None:
+            return
+        listeners.discard(listener)
+        if not listeners:
+            del self._listeners[key]
+            self._last_frame.pop(key, None)
+            self.broadcaster.unsubscribe(self._subscriptions.pop(key))
+
+    def connection_count(self) -> int:
+        return sum(len(listeners) for listeners in self._listeners.values())
+
+    def _catch_up(self, listener: Listener) -> bytes:
+        frames, listener.event_id = self.broadcaster.resume(listener.user_id, listener.event_id)
+        return "".join(frames).encode()
+
+    def _fan_out(self, key: Key, frame: bytes) -> None:
+        listeners = self._listeners.get(key)
+        if listeners is None:
+            return  # Last client left while the frame was in flight
+        self._last_frame[key] = frame
+        self.frames_in += 1
+        for listener in listeners:
+            listener.offer(frame)
+        self.frames_out += len(listeners)
+
+    async def _keep_alive(self) -> None:
+        # One timer for every connection on the loop, so proxies don't time out idle streams
+        while True:
+            await asyncio.sleep(self.keepalive)
+            for listeners in list(self._listeners.values()):
+                for listener in listeners:
+                    listener.offer(PING)
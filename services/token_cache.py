@@ -0,0 +1,96 @@
+"""
+Token Cache: Bounded LRU + TTL resolver for kiosk token/slug -> user_id
+Every kiosk scan, status poll, SSE stream start and template render resolves the
+public token. Hits are served from memory; unknown tokens are cached briefly too
+so a kiosk stuck on a bad URL cannot hammer the user table. Token or slug
+changes in one worker clear the other workers' caches through the cache backend.
+"""
+from typing import Callable, Optional
+from collections import OrderedDict
+import threading
+import time
+
+from services.cache_backend import LocalCacheBackend
+
+
+class TokenResolver:
+    def __init__(self, lookup: Callable[[str], Optional[int]], max_entries: int = 4096,
+                 ttl: float = 300.0, negative_ttl: float = 5.0, cache_backend=None):
+        """
+        Initialize TokenResolver.
+
+        Args:
+            lookup: Resolves a token or slug to a user_id from the database (None if unknown)
+            max_entries: Most tokens kept before the least recently used is evicted
+            ttl: Seconds a resolved token stays cached
+            negative_ttl: Seconds an unknown token stays cached as a miss
+            cache_backend: Shares invalidations with other workers (default: this process only)
+        """
+        self.lookup = lookup
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # {token: (user_id or None, expires_at)}
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.backend = cache_backend or LocalCacheBackend()
+        self._generation = self.backend.generation("tokens", None)
+        # Bumped on every invalidation so a lookup racing a change is never stored
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, token: str) -> Optional[int]:
+        """Get the user_id for a kiosk token or slug"""
+        now = time.time()
+        generation = self.backend.generation("tokens", None)
+        with self._lock:
+            if generation != self._generation:
+                # Another worker changed a token or slug
+                self._entries.clear()
+                self._generation = generation
+                self._version += 1
+            version = self._version
+            entry = self._entries.get(token)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        user_id = self.lookup(token)
+        expires_at = now + (self.ttl if user_id is not None else self.negative_ttl)
+        with self._lock:
+            if self._version != version:
+                return user_id
+            self._entries[token] = (user_id, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return user_id
+
+    def invalidate(self, token: Optional[str] = None, user_id: Optional[int] = None) -> None:
+        """
+        Forget a token and/or every token of a user. Cached misses are dropped
+        as well, since a new slug may have been cached as unknown.
+        """
+        with self._lock:
+            for key, (cached_user_id, _) in list(self._entries.items()):
+                if key == token or cached_user_id is None or \
+                        (user_id is not None and cached_user_id == user_id):
+                    del self._entries[key]
+            self._version += 1
+            previous, generation = self.backend.bump("tokens", None)
+            if self._generation == previous:
+                self._generation = generation
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            "entries": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }